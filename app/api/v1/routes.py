@@ -1,40 +1,89 @@
+import json
 import httpx
-import requests
-import os
-import mimetypes
-import asyncio
 import stripe
-from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any
-from app.core.constants import KLING_AI_TASK_STATUS_URL, KLING_AI_GENERATE_URL, ACCESS_KEY, SECRET_KEY, STRIPE_SECRET_KEY
-from app.core.constants import FILE_STATUS, STAGED_UPLOADS_CREATE, FILE_CREATE, FILE_UPDATE_ADD_PRODUCT, STRIPE_WEBHOOK_SECRET
-from app.core.utils import get_size_and_download, encode_jwt_token
-from app.crud.video import create_video
+from typing import List, Dict, Any, Optional, AsyncIterator
+from contextlib import asynccontextmanager
+from app.core.constants import STRIPE_SECRET_KEY, STRIPE_API_BASE, VIDEO_PAGE_SIZE, VIDEO_PAGE_SIZE_MAX
+from app.core.constants import STRIPE_WEBHOOK_SECRET, GENERATE_DEDUP_WINDOW_S, IDEMPOTENCY_KEY_TTL_S, UPLOAD_STALE_S
+from app.core.coalesce import RequestCoalescer, fingerprint
+from app.core.bulk import bulk_generator
+from app.core.uploads import UploadJob, upload_queue
+from app.core.images import ingest_images, server_timing
+from app.core.kling import submit_task
+from app.core.kling_callbacks import kling_callbacks, verify_callback_token
+from app.core.response_cache import CREDITS, VIDEOS, response_cache
+from app.core.shopify import gql, graphql_url
+from app.core.stripe_events import stripe_event_processor
+from app.crud.video import create_video, find_recent_video, get_video_by_id, get_video_status, get_videos_by_ids, get_upload_state, list_videos, save_video, save_videos, delete_video as delete_video_row
+from app.core.executor import run_db, run_blocking
 from app.db.deps import get_db
-from app.db.models.video import Video
-from app.db.models.credits import Credits
-from app.schema.video import ShopNamePayload, VideoSummary, GenerateVideoRequest, VideoUploadRequest, CreateSessionRequest
-from app.core.utils import get_thumbnail_from_url, checkIfAvailable, updateCredits
-from datetime import datetime, timedelta
-import uuid
-import numpy as np
-import cv2
+from app.crud.credits import get_credits as get_credits_by_shop, reserve_credits, commit_reservation, refund_reservation, Reservation
+from app.schema.video import ShopNamePayload, VideoSummary, GenerateVideoRequest, BulkGenerateRequest, VideoUploadRequest, BulkUploadRequest, CreateSessionRequest, UploadJobStatus
+from datetime import datetime, timedelta, timezone
 
 router = APIRouter()
+_video_list = TypeAdapter(List[VideoSummary])
+generate_coalescer = RequestCoalescer(GENERATE_DEDUP_WINDOW_S)
 stripe.api_key = STRIPE_SECRET_KEY
+if STRIPE_API_BASE:
+    stripe.api_base = STRIPE_API_BASE
+
+@asynccontextmanager
+async def reserved_credit(db: Session, shop: str) -> AsyncIterator[Reservation]:
+    # Holds one credit for the duration of a Kling submission: committed if the
+    # block completes with a task, refunded if it raises or submits nothing.
+    reservation = await run_db(reserve_credits, db, shop)
+    if not reservation:
+        raise HTTPException(status_code=403, detail=f"Not Enough Credits. Charge credits.")
+    try:
+        yield reservation
+    except BaseException:
+        await run_db(_rollback_and_refund, db, reservation)
+        raise
+    if reservation.task_id is None:
+        await run_db(_rollback_and_refund, db, reservation)
+    else:
+        await run_db(commit_reservation, db, reservation, reservation.task_id)
+
+def _rollback_and_refund(db: Session, reservation: Reservation):
+    db.rollback()
+    refund_reservation(db, reservation)
 
 @router.get("/")
 def root():
     return {"message": "Hello, World!"}
 
 @router.get('/video', response_model=List[VideoSummary])
-async def get_video(shop: str = Query(...), db: Session = Depends(get_db)):
-    return db.query(Video).filter(Video.shop == shop).order_by(Video.created_at.desc()).all()
+async def get_video(
+    request: Request,
+    shop: str = Query(...),
+    limit: Optional[int] = Query(None, ge=1, le=VIDEO_PAGE_SIZE_MAX),
+    cursor: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    product_id: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+):
+    if cursor and limit is None:
+        limit = VIDEO_PAGE_SIZE
+
+    async def build():
+        try:
+            videos, next_cursor = await run_db(list_videos, db, shop, limit, cursor, status, product_id)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+        return _video_list.dump_json(_video_list.validate_python(videos, from_attributes=True)), headers
+
+    return await response_cache.serve(request, VIDEOS, shop, (limit, cursor, status, product_id), build)
 
 @router.delete('/video/{video_id}', status_code=204)
 async def delete_video(video_id:str, shop: str = Query(...), token: str = Query(...), db: Session = Depends(get_db)):
-    video = db.query(Video).filter(Video.id == video_id).first()
+    video = await run_db(get_video_by_id, db, video_id)
 
     if not video:
         raise HTTPException(status_code=404, detail="Video not found")
@@ -47,70 +96,52 @@ async def delete_video(video_id:str, shop: str = Query(...), token: str = Query(
       }
     }
     """
-    url = f"https://{shop}/admin/api/2025-07/graphql.json"
     headers = {
         "X-Shopify-Access-Token": token,
         "Content-Type": "application/json",
         "Accept": "application/json",
     }
-    resp = requests.post(url, json={"query": mutation, "variables": {"fileIds": [video.video_id]}}, headers=headers, timeout=30)
-    
-    db.delete(video)
-    db.commit()
+    try:
+        await gql(graphql_url(shop, "2025-07"), headers, mutation, {"fileIds": [video.video_id]})
+    except HTTPException as exc:
+        print(f"fileDelete for video {video_id} failed:", exc.detail)
+
+    await run_db(delete_video_row, db, video)
 
     return None
 
 @router.put('/video/{video_id}', response_model=VideoSummary)
 async def update_video(video_id: str, db: Session = Depends(get_db)):
-    video = db.query(Video).filter(Video.id == video_id).first()
+    # Task status is refreshed by the background Kling poller; this only reads the stored state.
+    video = await run_db(get_video_by_id, db, video_id)
     if not video:
         raise HTTPException(status_code=404, detail="Video not found")
+    return video
 
-    headers = {
-        "Authorization": f"Bearer {encode_jwt_token(ACCESS_KEY, SECRET_KEY)}"
-    }
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                f"{KLING_AI_TASK_STATUS_URL}/{video_id}",
-                headers=headers
-            )
-        response.raise_for_status()
-        data = response.json()
-
-        if data['data']['task_status'] == 'succeed':
-            if video.status == 'processing':
-                video.video_url = data['data']['task_result']['videos'][0]['url']
-                video.status = 'completed'
-                video.duration = data['data']['task_result']['videos'][0]['duration']
-                video.thumbnail = get_thumbnail_from_url(video.video_url)
-
-                db.commit()
-                db.refresh(video)
-        elif data['data']['task_status'] == 'failed':
-            video.status = data['data']['task_status']
-
-            db.commit()
-            db.refresh(video)
-
-        return video
-    except httpx.HTTPStatusError as exc:
-        raise HTTPException(status_code=exc.response.status_code, detail=str(exc))
-    except httpx.RequestError as exc:
-        raise HTTPException(status_code=502, detail=f"Error contacting third-party API: {str(exc)}")
+@router.post('/kling/callback')
+async def kling_callback(request: Request, token: Optional[str] = Query(None)):
+    if not verify_callback_token(token):
+        raise HTTPException(status_code=401, detail="Invalid callback token")
+    body = await request.json()
+    await kling_callbacks.handle(body.get("data", body))
+    return {"ok": True}
 
 @router.post("/regenerate/{video_id}")
 async def regenerate_video(video_id: str, db: Session = Depends(get_db)):
-    try:
-        video = db.query(Video).filter(Video.id == video_id).first()
-        if not video:
-            raise HTTPException(status_code=404, detail="Video not found")
+    video = await run_db(get_video_by_id, db, video_id)
+    if not video:
+        raise HTTPException(status_code=404, detail="Video not found")
+
+    async with reserved_credit(db, video.shop) as reservation:
         video.video_id = ''
         video.video_url = ''
         video.thumbnail = ''
         video.status = 'processing'
         video.duration = 5
-        video.created_at = datetime.now()
+        video.created_at = datetime.now(timezone.utc)
+        video.upload_stage = None
+        video.upload_resource_url = None
+        video.upload_error = None
 
         images = [
             video.image1,
@@ -124,208 +155,223 @@ async def regenerate_video(video_id: str, db: Session = Depends(get_db)):
             "prompt": video.prompt,
             "aspect_ratio": "1:1"
         }
-        headers = {
-            "Authorization": f"Bearer {encode_jwt_token(ACCESS_KEY, SECRET_KEY)}"
-        }
         for image in images:
             if image != "":
                 payload["image_list"].append({
                     "image": image
                 })
         
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.post(
-                KLING_AI_GENERATE_URL,
-                json=payload,
-                headers=headers
-            )
-        print(response.json())
-        response.raise_for_status()
-        data = response.json()
+        data, account = await submit_task(payload, video.shop)
 
         video.id = data['data']['task_id']
-        db.commit()
-        db.refresh(video)
+        video.kling_account = account
+        await run_db(save_video, db, video)
 
-        updateCredits(video.shop)
+        reservation.task_id = video.id
         return data
-    except Exception as exc:
-        raise exc
     
-@router.post("/video")
-async def generate_video(body: GenerateVideoRequest, db: Session = Depends(get_db)):
-    if not checkIfAvailable(body.shop):
-        raise HTTPException(status_code=403, detail=f"Not Enough Credits. Charge credits.")
-
-    payload: Dict[str, Any] = {
-        "image_list": [],
-        "prompt": body.prompt,
-        "aspect_ratio": "1:1"
-    }
-    headers = {
-        "Authorization": f"Bearer {encode_jwt_token(ACCESS_KEY, SECRET_KEY)}"
-    }
-
+def _existing_task(video) -> Dict[str, Any]:
+    # Same shape as a Kling submit response, for duplicates answered from the DB.
+    return {"code": 0, "message": "duplicate", "data": {"task_id": video.id, "task_status": video.status}}
 
+@router.post("/video")
+async def generate_video(body: GenerateVideoRequest, request: Request, response: Response, db: Session = Depends(get_db)):
+    # Duplicates of a request (same Idempotency-Key, or same shop, product,
+    # images and prompt) share one submission and are charged once. An
+    # Idempotency-Key reused with a different body is rejected with 422;
+    # without a key the product title may differ between duplicates, and a
+    # task that already failed on Kling does not count as one.
+    idempotency_key = request.headers.get("Idempotency-Key")
+    body_hash = fingerprint("body", body.product_id, body.product_title, body.images, body.prompt)
+    if idempotency_key:
+        key = fingerprint("idempotency-key", body.shop, idempotency_key)
+    else:
+        key = fingerprint("request", body.shop, body.product_id, body.images, body.prompt)
+
+    if not idempotency_key:
+        recent = generate_coalescer.peek(key)
+        if recent is not None and await run_db(get_video_status, db, recent[1]["data"]["task_id"]) == "failed":
+            generate_coalescer.forget(key)
+
+    async def generate():
+        return body_hash, await _generate(body, response, db, key if idempotency_key else None, body_hash)
+
+    (owner_hash, data), shared = await generate_coalescer.run(key, generate, kind="generate")
+    if idempotency_key and owner_hash != body_hash:
+        _key_reused()
+    if shared or data.get("message") == "duplicate":
+        response.headers["Idempotent-Replayed"] = "true"
+    return data
+
+def _key_reused():
+    raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request body")
+
+async def _generate(body: GenerateVideoRequest, response: Response, db: Session, idempotency_fingerprint: Optional[str], body_hash: str) -> Dict[str, Any]:
     try:
-        # Convert image to PNG files
-
-        for image in body.images:
-            file_name = f"{str(uuid.uuid4())}.png"
-
-            response = requests.get(image)
-            response.raise_for_status()
-
-            img_array = np.asarray(bytearray(response.content), dtype=np.uint8)
-            img = cv2.imdecode(img_array, cv2.IMREAD_UNCHANGED)
-
-            cv2.imwrite(f"static/{file_name}", img)
+        if idempotency_fingerprint:
+            since = datetime.now(timezone.utc) - timedelta(seconds=IDEMPOTENCY_KEY_TTL_S)
+            existing = await run_db(find_recent_video, db, body.shop, idempotency_fingerprint, since)
+            if existing:
+                if existing.request_body_hash and existing.request_body_hash != body_hash:
+                    _key_reused()
+                return _existing_task(existing)
 
+        payload: Dict[str, Any] = {
+            "image_list": [],
+            "prompt": body.prompt,
+            "aspect_ratio": "1:1"
+        }
+        # Fetch all product images concurrently and store them as normalized PNGs
+        ingested = await ingest_images(body.images)
+        for image in ingested:
+            print(f"ingested {image.source_url}: {image.size_in} bytes, {'cached' if image.cached else 'encoded'}, fetch {image.fetch_ms:.0f} ms, process {image.process_ms:.0f} ms")
             payload["image_list"].append({
-                "image": f"https://lookmotion.ai/static/{file_name}"
+                "image": image.url
             })
+        response.headers["Server-Timing"] = server_timing(ingested)
 
         images = [img_dict["image"] for img_dict in payload["image_list"]]
 
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.post(
-                KLING_AI_GENERATE_URL,
-                json=payload,
-                headers=headers
-            )
-        print(response.json())
-        response.raise_for_status()
-        data = response.json()
-
-        create_video(db, data['data']['task_id'], images, body.prompt, body.product_id, body.product_title, body.shop)
-
-        updateCredits(body.shop)
-        return data
+        # Keyed on image content, so the same pictures behind different CDN
+        # URLs still count as a duplicate. Checked before reserving, so a
+        # duplicate never touches the shop's balance.
+        request_fingerprint = idempotency_fingerprint or fingerprint("content", body.shop, body.product_id, [image.key for image in ingested], body.prompt)
+        if not idempotency_fingerprint:
+            since = datetime.now(timezone.utc) - timedelta(seconds=GENERATE_DEDUP_WINDOW_S)
+            existing = await run_db(find_recent_video, db, body.shop, request_fingerprint, since, skip_failed=True)
+            if existing:
+                return _existing_task(existing)
+
+        async with reserved_credit(db, body.shop) as reservation:
+            data, account = await submit_task(payload, body.shop)
+
+            await run_db(create_video, db, data['data']['task_id'], images, body.prompt, body.product_id, body.product_title, body.shop, account, request_fingerprint, body_hash if idempotency_fingerprint else None)
+
+            reservation.task_id = data['data']['task_id']
+            return data
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
     except httpx.HTTPStatusError as exc:
         print(exc)
         raise HTTPException(status_code=exc.response.status_code, detail=str(exc))
     except httpx.RequestError as exc:
         raise HTTPException(status_code=502, detail=f"Error contacting third-party API: {str(exc)}")
 
-async def gql(GQL_URL: str, HEADERS: Any, client: httpx.AsyncClient, query: str, variables: Dict[str, Any]):
-    r = await client.post(GQL_URL, headers=HEADERS, json={"query": query, "variables": variables})
-    req_id = r.headers.get("X-Request-Id")
-    if r.status_code >= 400:
-        raise HTTPException(r.status_code, f"Shopify HTTP error: {r.text} (X-Request-Id: {req_id})")
-    data = r.json()
-    if "errors" in data:
-        raise HTTPException(502, {"message": "Shopify GraphQL error", "errors": data["errors"], "x_request_id": req_id})
-    return {"data": data["data"], "x_request_id": req_id}
-
-async def wait_until_ready(GQL_URL: str, HEADERS: Any, client: httpx.AsyncClient, file_id: str, timeout_s: int = 300):
-    start = asyncio.get_event_loop().time()
-    while True:
-        d = await gql(GQL_URL, HEADERS, client, FILE_STATUS, {"id": file_id})
-        status = d["data"]["node"]["fileStatus"]
-        if status == "READY":
-            return
-        if status in ("FAILED", "CANCELLED"):
-            raise HTTPException(502, f"Video processing failed with status {status}")
-        if asyncio.get_event_loop().time() - start > timeout_s:
-            raise HTTPException(504, f"Timed out waiting for READY (last status: {status})")
-        await asyncio.sleep(1.2)
-
-@router.post('/upload')
-async def upload_video(payload: VideoUploadRequest, db: Session = Depends(get_db)):
-    GQL_URL = f"https://{payload.shop}/admin/api/2024-07/graphql.json"
+@router.post('/video/bulk')
+async def generate_videos_bulk(body: BulkGenerateRequest, db: Session = Depends(get_db)):
+    # Credits for the whole catalog are reserved up front; the NDJSON stream
+    # reports each product as it is submitted and ends with a summary line.
+    reservation = await run_db(reserve_credits, db, body.shop, len(body.products))
+    if not reservation:
+        raise HTTPException(status_code=403, detail=f"Not Enough Credits. Charge credits.")
+    events = bulk_generator.submit(body.shop, body.prompt, body.products, reservation)
 
-    HEADERS = {
-        "X-Shopify-Access-Token": payload.token
-    }
+    async def stream():
+        while (line := await events.get()) is not None:
+            yield line
 
-    video = db.query(Video).filter(Video.id == payload.video_id).first()
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+def _uploading_elsewhere(video) -> bool:
+    # Another worker holds the job while it keeps the heartbeat fresh; queueing
+    # it here too would upload the video twice.
+    if video.status != "uploading" or not video.upload_heartbeat_at or upload_queue.position(video.id) is not None:
+        return False
+    heartbeat = video.upload_heartbeat_at
+    if heartbeat.tzinfo is None:
+        heartbeat = heartbeat.replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc) - heartbeat < timedelta(seconds=UPLOAD_STALE_S)
+
+@router.post('/upload', status_code=202)
+async def upload_video(payload: VideoUploadRequest, db: Session = Depends(get_db)):
+    video = await run_db(get_video_by_id, db, payload.video_id)
     if not video:
         raise HTTPException(status_code=404, detail="Video not found")
-    try:
+    if video.status == "uploaded":
+        return {"ok": True, "job_id": video.id, "status": "done", "queue_position": None, "video_id": video.video_id}
+    if _uploading_elsewhere(video):
+        return {"ok": True, "job_id": video.id, "status": "running", "queue_position": None}
+
+    video.status = "uploading"
+    video.upload_error = None
+    video.upload_heartbeat_at = datetime.now(timezone.utc)
+    if not video.upload_stage or video.upload_stage == "attached":
+        video.upload_stage = "queued"
+    await run_db(save_video, db, video)
+
+    position = upload_queue.enqueue(UploadJob(
+        video_id=video.id,
+        shop=payload.shop,
+        token=payload.token,
+        video_url=payload.video_url,
+        product_id=payload.product_id,
+        product_title=payload.product_title,
+    ))
+    return {"ok": True, "job_id": video.id, "status": "running" if position == 0 else "queued", "queue_position": position}
+
+@router.post('/upload/bulk', status_code=202)
+async def upload_videos_bulk(payload: BulkUploadRequest, db: Session = Depends(get_db)):
+    # Stages, creates and attaches the videos with one mutation per
+    # UPLOAD_BATCH_SIZE videos instead of three per video.
+    found = {video.id: video for video in await run_db(get_videos_by_ids, db, [item.video_id for item in payload.videos])}
+    results: Dict[str, Dict[str, Any]] = {}
+    jobs: List[UploadJob] = []
+    for item in payload.videos:
+        video = found.get(item.video_id)
+        if not video:
+            results[item.video_id] = {"job_id": item.video_id, "status": "not_found", "queue_position": None}
+            continue
+        if video.status == "uploaded":
+            results[item.video_id] = {"job_id": video.id, "status": "done", "queue_position": None, "video_id": video.video_id}
+            continue
+        if _uploading_elsewhere(video):
+            results[item.video_id] = {"job_id": video.id, "status": "running", "queue_position": None}
+            continue
         video.status = "uploading"
-        db.commit()
-        db.refresh(video)
-
-        size, file_path = await get_size_and_download(payload.video_url)
-
-        filename = f"{payload.product_title}.mp4"
-        mime = mimetypes.guess_type(filename)[0] or "video/mp4"
-
-        product_gid = f"{payload.product_id}"
-        async with httpx.AsyncClient(timeout=120, follow_redirects=True) as client:
-            # 1) stagedUploadsCreate
-            variables: Dict[str, Any] = {
-                "input": [{
-                    "filename": filename,
-                    "mimeType": mime,
-                    "resource": "VIDEO",
-                    "httpMethod": "POST",
-                    "fileSize": str(size),
-                }]
-            }
-            d1 = await gql(GQL_URL, HEADERS, client, STAGED_UPLOADS_CREATE, variables)
-            su = d1["data"]["stagedUploadsCreate"]
-            if su["userErrors"]:
-                raise HTTPException(400, {"where": "stagedUploadsCreate", "userErrors": su["userErrors"], "x_request_id": d1["x_request_id"]})
-            target = su["stagedTargets"][0]
-            upload_url = target["url"]
-            params = {p["name"]: p["value"] for p in target["parameters"]}  # includes key, policy, x-goog-*, etc.
-            resource_url = target["resourceUrl"]
-
-            print(resource_url)
-
-            # 2) multipart POST (fields EXACTLY as provided + file)
-            multipart = params.copy()
-            # Some endpoints require 'Content-Type' field inside the form
-            # multipart["Content-Type"] = mime
-            with open(file_path, "rb") as f:
-                files = {**{k: (None, v) for k, v in multipart.items()}, "file": (filename, f, mime)}
-                r = await client.post(upload_url, files=files)
-                if r.status_code not in (204, 201, 200):
-                    raise HTTPException(502, f"Upload to staged target failed: {r.status_code} {r.text}")
-
-            # 3) fileCreate using the staged resourceUrl
-            d2 = await gql(GQL_URL, HEADERS, client, FILE_CREATE, {
-                "files": [{
-                    "contentType": "VIDEO",
-                    "originalSource": resource_url,
-                    **({})
-                }]
-            })
-            fc = d2["data"]["fileCreate"]
-            if fc["userErrors"]:
-                raise HTTPException(400, {"where": "fileCreate", "userErrors": fc["userErrors"], "x_request_id": d2["x_request_id"]})
-            file_id = fc["files"][0]["id"]
-
-            print("file_id", file_id)
-
-            # 4) wait until READY
-            await wait_until_ready(GQL_URL, HEADERS, client, file_id)
-
-            # 5) attach to product
-            d3 = await gql(GQL_URL, HEADERS, client, FILE_UPDATE_ADD_PRODUCT, {
-                "files": [{"id": file_id, "alt": payload.product_title, "referencesToAdd": [product_gid]}]
-            })
-            fu = d3["data"]["fileUpdate"]
-            if fu["userErrors"]:
-                raise HTTPException(400, {"where": "fileUpdate", "userErrors": fu["userErrors"], "x_request_id": d3["x_request_id"]})
-
-            try:
-                os.remove(file_path)
-            except Exception:
-                pass
-
-            video.status = "uploaded"
-            video.video_id = file_id
-            db.commit()
-            db.refresh(video)
-
-            return {"ok": True, "video_id": file_id, "attached_to": product_gid}
-    except Exception as e:
-        video.status = "completed"
-        db.commit()
-        db.refresh(video)
-        raise e
+        video.upload_error = None
+        video.upload_heartbeat_at = datetime.now(timezone.utc)
+        if not video.upload_stage or video.upload_stage == "attached":
+            video.upload_stage = "queued"
+        jobs.append(UploadJob(
+            video_id=video.id,
+            shop=payload.shop,
+            token=payload.token,
+            video_url=item.video_url,
+            product_id=item.product_id,
+            product_title=item.product_title,
+        ))
+    await run_db(save_videos, db, list(found.values()))
+
+    for video_id, position in upload_queue.enqueue_batch(jobs).items():
+        results[video_id] = {"job_id": video_id, "status": "running" if position == 0 else "queued", "queue_position": position}
+    return {"ok": True, "jobs": [results[item.video_id] for item in payload.videos]}
+
+@router.get('/upload/{job_id}', response_model=UploadJobStatus)
+async def get_upload_status(job_id: str, db: Session = Depends(get_db)):
+    row = await run_db(get_upload_state, db, job_id)
+    if not row:
+        raise HTTPException(status_code=404, detail="Upload job not found")
+
+    position = upload_queue.position(job_id)
+    if row.status == "uploaded":
+        status = "done"
+    elif row.upload_error:
+        status = "failed"
+    elif position is not None:
+        status = "running" if position == 0 else "queued"
+    elif row.status == "uploading":
+        status = "running"  # held by another worker process; failed by the stale sweep if that process died
+    else:
+        status = "idle"
+
+    return UploadJobStatus(
+        job_id=job_id,
+        status=status,
+        stage=row.upload_stage,
+        queue_position=position,
+        video_id=row.video_id if row.upload_stage in ("created", "ready", "attached") else None,
+        error=row.upload_error,
+    )
 
 @router.post('/subscription')
 async def create_subscription(db: Session = Depends(get_db)):
@@ -335,7 +381,10 @@ async def create_subscription(db: Session = Depends(get_db)):
         raise e
 
 @router.post('/stripe-hook')
-async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
+async def stripe_webhook(request: Request):
+    # Acknowledge as soon as the event is durably recorded; credits are
+    # granted by stripe_event_processor, so a slow Stripe API call can no
+    # longer time out the webhook and trigger a redelivery.
     sig_header = request.headers.get("stripe-signature")
     body = await request.body()
     try:
@@ -348,40 +397,11 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
 
     # On checkout completed, you can link customer to user
     if type_ == "checkout.session.completed":
-        shop_id = data.get("client_reference_id")
+        shop_id = data["client_reference_id"]
         print("shop_id:", shop_id)
-        line_items = stripe.checkout.Session.list_line_items(data["id"], limit=100)
-        print("line_items:", line_items['data'])
-        price_id, product_id, quantity, amount = line_items['data'][0]['price']['id'], line_items['data'][0]['price']['product'], line_items['data'][0]['quantity'], line_items['data'][0]['price']['unit_amount']
-        print("line_items:", price_id, product_id, quantity, amount)
-        if product_id == "prod_Su4INfJofTlANV": # extra credit
-            credits = db.query(Credits).filter(Credits.shop_name == shop_id).first()
-            if not credits:
-                credits = Credits(
-                    shop_name=shop_id,
-                    extra_credit=quantity,
-                )
-                db.add(credits)
-                db.commit()
-            else:
-                credits.extra_credit = credits.extra_credit + quantity
-                db.commit()
-        else:
-            credits = db.query(Credits).filter(Credits.shop_name == shop_id).first()
-            if not credits:
-                credits = Credits(
-                    shop_name=shop_id,
-                    monthly_credit=amount/140,
-                    subscription_type=(1 if amount == 14000 else (2 if amount == 35000 else 3)),
-                    subscription_expired=datetime.now()+timedelta(days=30)
-                )
-                db.add(credits)
-                db.commit()
-            else:
-                credits.monthly_credit = amount / 140
-                credits.subscription_type=(1 if amount == 14000 else (2 if amount == 35000 else 3))
-                credits.subscription_expired=datetime.now()+timedelta(days=30)
-                db.commit()
+        created = await stripe_event_processor.record(event["id"], type_, shop_id, data["id"])
+        return {"received": True, "duplicate": not created}
+    return {"received": True}
 
 @router.post('/create-checkout-session')
 async def create_checkout_session(payload: CreateSessionRequest, db: Session = Depends(get_db)):
@@ -407,7 +427,8 @@ async def create_checkout_session(payload: CreateSessionRequest, db: Session = D
                 "price": "price_1RyGAC96qwFkAOsorujppUrp",
                 "quantity": payload.credits
             })
-        session = stripe.checkout.Session.create(
+        session = await run_blocking(
+            stripe.checkout.Session.create,
             mode="payment",
             payment_method_types=['card'],
             line_items=[line_item],
@@ -421,10 +442,7 @@ async def create_checkout_session(payload: CreateSessionRequest, db: Session = D
     except Exception as e:
         raise e
 
-@router.post('/credits')
-async def get_credits(payload: ShopNamePayload, db: Session = Depends(get_db)):
-    credits = db.query(Credits).filter(Credits.shop_name == payload.shop).first()
-
+def _credits_summary(credits) -> Dict[str, Any]:
     if not credits:
         return {
             "extra_credit": 0,
@@ -442,6 +460,22 @@ async def get_credits(payload: ShopNamePayload, db: Session = Depends(get_db)):
         "active_subscription": datetime.now() <= credits.subscription_expired if credits.subscription_expired else False
     }
 
+async def _serve_credits(request: Request, shop: str, db: Session) -> Response:
+    async def build():
+        credits = await run_db(get_credits_by_shop, db, shop)
+        return json.dumps(jsonable_encoder(_credits_summary(credits))).encode(), {}
+
+    return await response_cache.serve(request, CREDITS, shop, None, build)
+
+@router.post('/credits')
+async def get_credits(payload: ShopNamePayload, request: Request, db: Session = Depends(get_db)):
+    return await _serve_credits(request, payload.shop, db)
+
+@router.get('/credits')
+async def get_credits_conditional(request: Request, shop: str = Query(...), db: Session = Depends(get_db)):
+    # Same as POST /credits, but revalidates with If-None-Match / 304.
+    return await _serve_credits(request, shop, db)
+
 @router.post('/expire-subscription')
 async def expire_subscription(db: Session = Depends(get_db)):
     try:
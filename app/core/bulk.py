@@ -0,0 +1,148 @@
+import asyncio
+import json
+from typing import Any, Dict, List, Optional, Set, Tuple
+import httpx
+from app.core.constants import BULK_CONCURRENCY, BULK_STOP_TIMEOUT_S
+from app.core.executor import run_db
+from app.core.images import ingest_images
+from app.core.kling import submit_task
+from app.crud.credits import Reservation, commit_reservation, refund_reservation
+from app.crud.video import build_video, create_videos
+from app.db.models.video import Video
+from app.db.session import SessionLocal
+from app.schema.video import BulkProduct
+
+# A bulk job holds one credit reservation for the whole catalog, runs image
+# ingestion and Kling submission for up to BULK_CONCURRENCY products at once
+# (Kling submissions additionally go through the fair-share scheduler, without
+# a queue timeout, and share the per-account submit rate limit). Accepted
+# videos are inserted as they come in, batching whatever was accepted while
+# the previous insert ran, so the poller and callbacks see each task right
+# away. When the job ends, however it ends, every product without an inserted
+# row is refunded and the rest of the reservation is committed. Progress goes
+# to an asyncio.Queue as NDJSON lines; the job itself runs detached from the
+# request, so a client that disconnects mid-stream does not lose tasks that
+# were already submitted to Kling.
+
+def _line(event: Dict[str, Any]) -> str:
+    return json.dumps(event) + "\n"
+
+def _error_text(exc: Exception) -> str:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return f"Kling returned {exc.response.status_code}"
+    if isinstance(exc, httpx.RequestError):
+        return f"Error contacting third-party API: {exc}"
+    return str(exc)
+
+def _insert(videos: List[Video]):
+    db = SessionLocal()
+    try:
+        create_videos(db, videos)
+    finally:
+        db.close()
+
+def _settle(reservation: Reservation, unused: int):
+    db = SessionLocal()
+    try:
+        if unused:
+            refund_reservation(db, reservation, unused)
+        if reservation.amount:
+            commit_reservation(db, reservation)
+    finally:
+        db.close()
+
+class BulkGenerator:
+    def __init__(self):
+        self._jobs: Set[asyncio.Task] = set()
+
+    def submit(self, shop: str, prompt: str, products: List[BulkProduct], reservation: Reservation) -> "asyncio.Queue[Optional[str]]":
+        events: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+        task = asyncio.create_task(self._run(shop, prompt, products, reservation, events))
+        self._jobs.add(task)
+        task.add_done_callback(self._jobs.discard)
+        return events
+
+    async def stop(self):
+        # Jobs are not cancelled: each has Kling tasks in flight and credits
+        # reserved that only the job itself can settle. Jobs still running
+        # after the timeout have their inserted rows picked up by the poller.
+        if self._jobs:
+            _, pending = await asyncio.wait(set(self._jobs), timeout=BULK_STOP_TIMEOUT_S)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {"running": len(self._jobs)}
+
+    async def _one(self, sem: asyncio.Semaphore, index: int, shop: str, prompt: str, product: BulkProduct) -> Tuple[int, Optional[Video], Optional[str]]:
+        async with sem:
+            try:
+                ingested = await ingest_images(product.images)
+                images = [image.url for image in ingested]
+                data, account = await submit_task({
+                    "image_list": [{"image": url} for url in images],
+                    "prompt": product.prompt or prompt,
+                    "aspect_ratio": "1:1",
+                }, shop, queue_timeout=None)
+                task_id = data['data']['task_id']
+                return index, build_video(task_id, images, product.prompt or prompt, product.product_id, product.product_title, shop, account), None
+            except Exception as exc:
+                print(f"Bulk generation for product {product.product_id} failed:", exc)
+                return index, None, _error_text(exc)
+
+    async def _run(self, shop: str, prompt: str, products: List[BulkProduct], reservation: Reservation, events: "asyncio.Queue[Optional[str]]"):
+        sem = asyncio.Semaphore(BULK_CONCURRENCY)
+        accepted: List[Video] = []
+        inserted = 0
+        insert: Optional[asyncio.Task] = None
+
+        async def flush():
+            nonlocal inserted
+            while accepted:
+                batch = accepted[:]
+                del accepted[:]
+                try:
+                    await run_db(_insert, batch)
+                    inserted += len(batch)
+                except Exception as exc:
+                    # Not retried: a partial insert could not be told apart
+                    # from a failed one. The tasks still finish on Kling.
+                    print(f"Inserting {len(batch)} bulk videos for {shop} failed:", exc)
+
+        def schedule_flush():
+            nonlocal insert
+            if insert is None or insert.done():
+                insert = asyncio.create_task(flush())
+
+        jobs = [asyncio.create_task(self._one(sem, i, shop, prompt, p)) for i, p in enumerate(products)]
+        try:
+            events.put_nowait(_line({"event": "accepted", "count": len(products), "reservation_id": reservation.id}))
+            for next_done in asyncio.as_completed(jobs):
+                index, video, error = await next_done
+                product_id = products[index].product_id
+                if video is not None:
+                    accepted.append(video)
+                    schedule_flush()
+                    events.put_nowait(_line({"event": "submitted", "index": index, "product_id": product_id, "task_id": video.id}))
+                else:
+                    events.put_nowait(_line({"event": "failed", "index": index, "product_id": product_id, "error": error}))
+        except BaseException as exc:
+            print(f"Bulk generation for {shop} failed:", exc)
+            events.put_nowait(_line({"event": "error", "error": str(exc) or type(exc).__name__}))
+            raise
+        finally:
+            for job in jobs:
+                job.cancel()
+            try:
+                if insert is not None:
+                    await asyncio.shield(insert)
+                await asyncio.shield(flush())
+                unused = len(products) - inserted
+                await asyncio.shield(run_db(_settle, reservation, unused))
+                events.put_nowait(_line({"event": "done", "submitted": inserted, "failed": unused, "refunded": unused}))
+            except BaseException as exc:
+                print(f"Settling bulk reservation {reservation.id} for {shop} failed:", exc)
+            events.put_nowait(None)
+
+bulk_generator = BulkGenerator()
@@ -0,0 +1,91 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+from app.core.metrics import registry
+
+# Duplicate POST /video requests (double clicks, client retries) share one
+# submission: a duplicate that arrives while the first is still running waits
+# for its result, and one that arrives within the window afterwards gets the
+# stored result. Only successes are remembered; a failed submission can be
+# retried right away. Persisted duplicates (other workers, restarts) are
+# caught by the request_fingerprint column on Video.
+
+coalesced_requests = registry.counter("coalesced_requests_total", "Duplicate requests answered from an in-flight or recent submission.")
+
+def fingerprint(*parts: Any) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        values: Iterable[Any] = part if isinstance(part, (list, tuple)) else (part,)
+        for value in values:
+            digest.update(str(value).encode())
+            digest.update(b"\0")
+        digest.update(b"\1")
+    return digest.hexdigest()
+
+class RequestCoalescer:
+    def __init__(self, window_s: float, max_recent: int = 10000):
+        self.window_s = window_s
+        self.max_recent = max_recent
+        self._inflight: Dict[str, "asyncio.Future[Any]"] = {}
+        self._recent: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def _lookup_recent(self, key: str) -> Tuple[bool, Any]:
+        entry = self._recent.get(key)
+        if entry is None:
+            return False, None
+        if entry[0] < time.monotonic():
+            del self._recent[key]
+            return False, None
+        return True, entry[1]
+
+    def peek(self, key: str) -> Optional[Any]:
+        found, value = self._lookup_recent(key)
+        return value if found else None
+
+    def forget(self, key: str):
+        self._recent.pop(key, None)
+
+    async def run(self, key: str, fn: Callable[[], Awaitable[Any]], kind: str = "request") -> Tuple[Any, bool]:
+        # Returns (result, shared); shared is True when another request did the work.
+        while True:
+            found, value = self._lookup_recent(key)
+            if found:
+                coalesced_requests.inc(kind=kind, source="recent")
+                return value, True
+            future = self._inflight.get(key)
+            if future is None:
+                break
+            try:
+                value = await asyncio.shield(future)
+                coalesced_requests.inc(kind=kind, source="in_flight")
+                return value, True
+            except asyncio.CancelledError:
+                # The original request was cancelled (client went away); take
+                # over unless this request is the one being cancelled.
+                if future.cancelled() and not asyncio.current_task().cancelling():
+                    continue
+                raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            future.exception()  # mark retrieved when nobody else is waiting
+            raise
+        finally:
+            del self._inflight[key]
+        future.set_result(value)
+        self._recent[key] = (time.monotonic() + self.window_s, value)
+        while len(self._recent) > self.max_recent:
+            self._recent.popitem(last=False)
+        return value, False
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._inflight), "recent": len(self._recent)}
@@ -1,4 +1,5 @@
 import os
+from pathlib import Path
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,10 +9,20 @@ KLING_AI_GENERATE_URL = f"{KLING_AI_API_BASE_URL}/v1/videos/multi-image2video"
 KLING_AI_TASK_STATUS_URL = f"{KLING_AI_API_BASE_URL}/v1/videos/multi-image2video"
 ACCESS_KEY = os.getenv("ACCESS_KEY") or ""
 SECRET_KEY = os.getenv("SECRET_KEY") or ""
+# Extra Kling key pairs as "ak1:sk1,ak2:sk2"; ACCESS_KEY/SECRET_KEY is always the first pair.
+KLING_KEY_PAIRS = os.getenv("KLING_KEY_PAIRS") or ""
+KLING_KEY_STRATEGY = os.getenv("KLING_KEY_STRATEGY") or "least_loaded"  # or "round_robin"
+KLING_TOKEN_TTL_S = int(os.getenv("KLING_TOKEN_TTL_S") or 10 * 24 * 3600)
+KLING_TOKEN_REFRESH_MARGIN_S = int(os.getenv("KLING_TOKEN_REFRESH_MARGIN_S") or 3600)
 SQLALCHEMY_DATABASE_URL = os.getenv("SQLALCHEMY_DATABASE_URL") or ""
+# Async driver URL; derived from SQLALCHEMY_DATABASE_URL (aiosqlite / asyncpg / aiomysql) when unset.
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or ""
+DB_ASYNC = (os.getenv("DB_ASYNC") or "0") == "1"  # request sessions from the async engine
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY") or ""
 CLIENT_URL = os.getenv("CLIENT_URL") or ""
 STRIPE_WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or ""
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE") or ""  # point the Stripe SDK at a stand-in (bench/fake_upstream.py)
+SHOPIFY_ADMIN_URL = os.getenv("SHOPIFY_ADMIN_URL") or "https://{shop}"
 
 STAGED_UPLOADS_CREATE = """
 mutation StagedUploadsCreate($input: [StagedUploadInput!]!) {
@@ -31,9 +42,9 @@ mutation FileCreate($files: [FileCreateInput!]!) {
 }
 """
 
-FILE_STATUS = """
-query FileStatus($id: ID!) {
-  node(id: $id) { ... on Video { id fileStatus } }
+FILE_STATUSES = """
+query FileStatuses($ids: [ID!]!) {
+  nodes(ids: $ids) { ... on Video { id fileStatus } }
 }
 """
 
@@ -44,4 +55,149 @@ mutation FileUpdate($files: [FileUpdateInput!]!) {
     userErrors { field message code }
   }
 }
-"""
\ No newline at end of file
+"""
+
+# Background Kling task poller
+KLING_POLLER_ENABLED = (os.getenv("KLING_POLLER_ENABLED") or "1") == "1"
+KLING_POLL_TICK_S = float(os.getenv("KLING_POLL_TICK_S") or 2)
+KLING_POLL_BATCH_SIZE = int(os.getenv("KLING_POLL_BATCH_SIZE") or 50)
+KLING_POLL_CONCURRENCY = int(os.getenv("KLING_POLL_CONCURRENCY") or 5)
+KLING_POLL_MAX_RPS = float(os.getenv("KLING_POLL_MAX_RPS") or 10)
+KLING_POLL_FIRST_DELAY_S = float(os.getenv("KLING_POLL_FIRST_DELAY_S") or 20)
+KLING_POLL_MIN_INTERVAL_S = float(os.getenv("KLING_POLL_MIN_INTERVAL_S") or 5)
+KLING_POLL_MAX_INTERVAL_S = float(os.getenv("KLING_POLL_MAX_INTERVAL_S") or 60)
+
+# Kling task callbacks (polling becomes a fallback once a secret is set)
+KLING_CALLBACK_SECRET = os.getenv("KLING_CALLBACK_SECRET") or ""
+KLING_CALLBACK_BASE_URL = os.getenv("KLING_CALLBACK_BASE_URL") or os.getenv("PUBLIC_BASE_URL") or "https://lookmotion.ai"
+KLING_CALLBACK_FALLBACK_DELAY_S = float(os.getenv("KLING_CALLBACK_FALLBACK_DELAY_S") or 600)
+# Completed videos whose thumbnail extraction failed are retried with backoff
+THUMBNAIL_RETRY_INTERVAL_S = float(os.getenv("THUMBNAIL_RETRY_INTERVAL_S") or 60)
+THUMBNAIL_RETRY_BATCH = int(os.getenv("THUMBNAIL_RETRY_BATCH") or 20)
+THUMBNAIL_RETRY_WINDOW_S = float(os.getenv("THUMBNAIL_RETRY_WINDOW_S") or 24 * 3600)  # only videos created this recently
+
+# Shared upstream HTTP connection pools
+KLING_POOL_MAX_CONNECTIONS = int(os.getenv("KLING_POOL_MAX_CONNECTIONS") or 20)
+SHOPIFY_POOL_MAX_CONNECTIONS = int(os.getenv("SHOPIFY_POOL_MAX_CONNECTIONS") or 50)
+MEDIA_POOL_MAX_CONNECTIONS = int(os.getenv("MEDIA_POOL_MAX_CONNECTIONS") or 50)
+KLING_POOL_PER_HOST = int(os.getenv("KLING_POOL_PER_HOST") or 20)
+SHOPIFY_POOL_PER_HOST = int(os.getenv("SHOPIFY_POOL_PER_HOST") or 8)
+MEDIA_POOL_PER_HOST = int(os.getenv("MEDIA_POOL_PER_HOST") or 8)
+POOL_KEEPALIVE_EXPIRY_S = float(os.getenv("POOL_KEEPALIVE_EXPIRY_S") or 30)
+
+# Thread pools for blocking work (DB queries, OpenCV, Stripe SDK)
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS") or 10)
+BLOCKING_EXECUTOR_WORKERS = int(os.getenv("BLOCKING_EXECUTOR_WORKERS") or (os.cpu_count() or 2) * 2)
+
+# Database connection pool (per process; multiply by the uvicorn worker count)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE") or DB_EXECUTOR_WORKERS)
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW") or 5)
+DB_POOL_TIMEOUT_S = float(os.getenv("DB_POOL_TIMEOUT_S") or 30)
+DB_POOL_RECYCLE_S = int(os.getenv("DB_POOL_RECYCLE_S") or 1800)
+DB_POOL_PRE_PING = (os.getenv("DB_POOL_PRE_PING") or "1") == "1"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS") or 15000)
+SQLITE_WAL = (os.getenv("SQLITE_WAL") or "1") == "1"
+
+# Product image ingestion
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL") or "https://lookmotion.ai"
+STATIC_DIR = os.getenv("STATIC_DIR") or str(Path(__file__).resolve().parents[2] / "static")
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE") or 1280)
+IMAGE_ASPECT = os.getenv("IMAGE_ASPECT") or ""  # e.g. "1:1" to letterbox every image to a square
+IMAGE_PNG_COMPRESSION = int(os.getenv("IMAGE_PNG_COMPRESSION") or 3)
+
+# Content-addressed product image store
+IMAGE_STORE_MAX_BYTES = int(os.getenv("IMAGE_STORE_MAX_BYTES") or 2 * 1024 ** 3)
+IMAGE_STORE_ORPHAN_TTL_S = float(os.getenv("IMAGE_STORE_ORPHAN_TTL_S") or 30 * 24 * 3600)
+IMAGE_STORE_GRACE_S = float(os.getenv("IMAGE_STORE_GRACE_S") or 3600)
+IMAGE_STORE_GC_INTERVAL_S = float(os.getenv("IMAGE_STORE_GC_INTERVAL_S") or 3600)
+
+# Thumbnail extraction
+THUMBNAIL_SMALL_WIDTH = int(os.getenv("THUMBNAIL_SMALL_WIDTH") or 320)
+THUMBNAIL_LARGE_WIDTH = int(os.getenv("THUMBNAIL_LARGE_WIDTH") or 960)
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY") or 80)
+THUMBNAIL_PROBE_BYTES = int(os.getenv("THUMBNAIL_PROBE_BYTES") or 64 * 1024)
+THUMBNAIL_MDAT_PREFIX_BYTES = int(os.getenv("THUMBNAIL_MDAT_PREFIX_BYTES") or 2 * 1024 * 1024)
+
+# Cache lifetime for content-addressed files under /static
+STATIC_IMMUTABLE_MAX_AGE_S = int(os.getenv("STATIC_IMMUTABLE_MAX_AGE_S") or 365 * 24 * 3600)
+STATIC_DEFAULT_MAX_AGE_S = int(os.getenv("STATIC_DEFAULT_MAX_AGE_S") or 3600)
+# Smaller encodings of stored images/thumbnails offered via Accept, most preferred first ("" disables)
+STATIC_VARIANT_FORMATS = os.getenv("STATIC_VARIANT_FORMATS") if os.getenv("STATIC_VARIANT_FORMATS") is not None else "avif,webp"
+STATIC_VARIANT_QUALITY = int(os.getenv("STATIC_VARIANT_QUALITY") or 80)  # lossy variants of JPEG thumbnails; PNG sources stay lossless
+STATIC_VARIANT_PENDING_MAX_AGE_S = int(os.getenv("STATIC_VARIANT_PENDING_MAX_AGE_S") or 60)  # cache lifetime of the original while its variant is being built
+# Hand file bodies to nginx: responses carry X-Accel-Redirect: <prefix><path> and no body
+STATIC_ACCEL_REDIRECT_PREFIX = os.getenv("STATIC_ACCEL_REDIRECT_PREFIX") or ""
+
+# GET /video pagination (opt-in: without limit or cursor the full list is returned)
+VIDEO_PAGE_SIZE = int(os.getenv("VIDEO_PAGE_SIZE") or 50)
+VIDEO_PAGE_SIZE_MAX = int(os.getenv("VIDEO_PAGE_SIZE_MAX") or 200)
+
+# Video relay from Kling to Shopify staged upload targets
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES") or 256 * 1024)
+UPLOAD_SPILL_TO_DISK = (os.getenv("UPLOAD_SPILL_TO_DISK") or "0") == "1"
+UPLOAD_SPOOL_MEMORY_BYTES = int(os.getenv("UPLOAD_SPOOL_MEMORY_BYTES") or 8 * 1024 * 1024)
+
+# Background Shopify upload jobs
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS") or 4)
+UPLOAD_HEARTBEAT_S = float(os.getenv("UPLOAD_HEARTBEAT_S") or 30)
+UPLOAD_STALE_S = float(os.getenv("UPLOAD_STALE_S") or 120)  # uploading rows without a heartbeat this long are marked failed
+
+# Batched Shopify fileStatus polling
+FILE_STATUS_MIN_INTERVAL_S = float(os.getenv("FILE_STATUS_MIN_INTERVAL_S") or 1.2)
+FILE_STATUS_MAX_INTERVAL_S = float(os.getenv("FILE_STATUS_MAX_INTERVAL_S") or 20)
+FILE_STATUS_BATCH_SIZE = int(os.getenv("FILE_STATUS_BATCH_SIZE") or 250)
+FILE_READY_TIMEOUT_S = float(os.getenv("FILE_READY_TIMEOUT_S") or 300)
+
+# Shopify GraphQL cost budget (leaky bucket per shop)
+SHOPIFY_BUDGET_MAX_POINTS = float(os.getenv("SHOPIFY_BUDGET_MAX_POINTS") or 1000)
+SHOPIFY_BUDGET_RESTORE_RATE = float(os.getenv("SHOPIFY_BUDGET_RESTORE_RATE") or 50)
+SHOPIFY_QUERY_COST_ESTIMATE = float(os.getenv("SHOPIFY_QUERY_COST_ESTIMATE") or 50)
+SHOPIFY_THROTTLE_RETRIES = int(os.getenv("SHOPIFY_THROTTLE_RETRIES") or 5)
+SHOPIFY_THROTTLE_BACKOFF_S = float(os.getenv("SHOPIFY_THROTTLE_BACKOFF_S") or 1)
+
+# Bulk video generation
+BULK_MAX_PRODUCTS = int(os.getenv("BULK_MAX_PRODUCTS") or 500)
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY") or 8)
+BULK_STOP_TIMEOUT_S = float(os.getenv("BULK_STOP_TIMEOUT_S") or 60)  # shutdown wait for running bulk jobs
+KLING_SUBMIT_MAX_RPS = float(os.getenv("KLING_SUBMIT_MAX_RPS") or 5)
+
+# Bulk Shopify uploads
+UPLOAD_BULK_MAX = int(os.getenv("UPLOAD_BULK_MAX") or 250)
+UPLOAD_BATCH_SIZE = int(os.getenv("UPLOAD_BATCH_SIZE") or 50)  # items per stagedUploadsCreate/fileCreate/fileUpdate call
+UPLOAD_RELAY_CONCURRENCY = int(os.getenv("UPLOAD_RELAY_CONCURRENCY") or 4)
+
+# Metrics (GET /metrics) and optional OpenTelemetry spans
+METRICS_PREFIX = os.getenv("METRICS_PREFIX") or "lookmotion_"
+# Bearer token for /metrics, /pools and /shopify-budgets; the endpoints answer 404 while it is unset
+METRICS_TOKEN = os.getenv("METRICS_TOKEN") or ""
+OTEL_ENABLED = (os.getenv("OTEL_ENABLED") or "0") == "1"
+
+# Stripe webhook event processing
+STRIPE_EVENT_POLL_S = float(os.getenv("STRIPE_EVENT_POLL_S") or 5)
+STRIPE_EVENT_BATCH_SIZE = int(os.getenv("STRIPE_EVENT_BATCH_SIZE") or 20)
+STRIPE_EVENT_MAX_ATTEMPTS = int(os.getenv("STRIPE_EVENT_MAX_ATTEMPTS") or 8)
+STRIPE_EVENT_RETRY_BASE_S = float(os.getenv("STRIPE_EVENT_RETRY_BASE_S") or 5)
+STRIPE_EVENT_RETRY_MAX_S = float(os.getenv("STRIPE_EVENT_RETRY_MAX_S") or 3600)
+STRIPE_EVENT_STALE_S = float(os.getenv("STRIPE_EVENT_STALE_S") or 300)  # reclaim events left in processing by a crashed worker
+
+# Kling submission scheduler (per process; divide the plan's limit by the worker count)
+KLING_MAX_IN_FLIGHT = int(os.getenv("KLING_MAX_IN_FLIGHT") or 10)  # tasks submitted and not yet finished
+KLING_SLOT_TIMEOUT_S = float(os.getenv("KLING_SLOT_TIMEOUT_S") or 1800)  # free a slot whose task never reported back
+KLING_QUEUE_MAX = int(os.getenv("KLING_QUEUE_MAX") or 500)
+KLING_QUEUE_MAX_PER_SHOP = int(os.getenv("KLING_QUEUE_MAX_PER_SHOP") or 20)
+KLING_QUEUE_TIMEOUT_S = float(os.getenv("KLING_QUEUE_TIMEOUT_S") or 120)  # longest an API request waits for a slot
+# Fair-share weight per Credits.subscription_type as "type:weight,..."; shops without an active plan weigh 1.
+KLING_SHOP_WEIGHTS = os.getenv("KLING_SHOP_WEIGHTS") or "1:2,2:3,3:4"
+KLING_SUBMIT_RETRIES = int(os.getenv("KLING_SUBMIT_RETRIES") or 3)
+KLING_SUBMIT_BACKOFF_S = float(os.getenv("KLING_SUBMIT_BACKOFF_S") or 1)
+
+# Per-shop response cache for dashboard reads (GET /video, /credits). Writes in
+# this process invalidate immediately; a write on another worker is only seen
+# once the TTL runs out. Set it to 0 to turn the cache off when running several
+# workers that must not serve stale balances.
+RESPONSE_CACHE_TTL_S = float(os.getenv("RESPONSE_CACHE_TTL_S") or 10)
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES") or 10000)
+
+# Duplicate POST /video coalescing
+GENERATE_DEDUP_WINDOW_S = float(os.getenv("GENERATE_DEDUP_WINDOW_S") or 120)  # same shop/product/images/prompt
+IDEMPOTENCY_KEY_TTL_S = float(os.getenv("IDEMPOTENCY_KEY_TTL_S") or 24 * 3600)
@@ -0,0 +1,61 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, TypeVar
+from app.core.constants import DB_EXECUTOR_WORKERS, BLOCKING_EXECUTOR_WORKERS
+from app.core.metrics import registry
+from sqlalchemy.ext.asyncio import AsyncSession
+
+T = TypeVar("T")
+
+# Route handlers are async; anything that would block the event loop runs on
+# one of these bounded pools instead. DB work gets its own pool so a burst of
+# OpenCV encodes cannot starve plain queries.
+_db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+_blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_EXECUTOR_WORKERS, thread_name_prefix="blocking")
+
+executor_wait_seconds = registry.histogram("executor_wait_seconds", "Time a job waited for a free executor thread.")
+executor_run_seconds = registry.histogram("executor_run_seconds", "Time a job ran on an executor thread (DB queries on the db pool).")
+
+def _timed(pool: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> Callable[[], T]:
+    name = getattr(fn, "__qualname__", None) or getattr(fn, "__name__", "unknown")
+    queued = time.perf_counter()
+
+    def call() -> T:
+        started = time.perf_counter()
+        executor_wait_seconds.observe(started - queued, pool=pool)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            executor_run_seconds.observe(time.perf_counter() - started, pool=pool, fn=name)
+    return call
+
+@contextmanager
+def _timed_async(fn: Callable[..., Any]) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        executor_run_seconds.observe(time.perf_counter() - start, pool="async_db", fn=getattr(fn, "__qualname__", "unknown"))
+
+async def run_db(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    # fn(db, ...) with an AsyncSession runs through its async driver instead of
+    # taking a DB thread; the sync crud code itself is unchanged.
+    if args and isinstance(args[0], AsyncSession):
+        with _timed_async(fn):
+            return await args[0].run_sync(fn, *args[1:], **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(_db_executor, _timed("db", fn, *args, **kwargs))
+
+async def run_blocking(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    return await asyncio.get_running_loop().run_in_executor(_blocking_executor, _timed("blocking", fn, *args, **kwargs))
+
+def executor_stats():
+    return {
+        "db": {"workers": _db_executor._max_workers, "queued": _db_executor._work_queue.qsize()},
+        "blocking": {"workers": _blocking_executor._max_workers, "queued": _blocking_executor._work_queue.qsize()},
+    }
+
+def shutdown_executors():
+    _db_executor.shutdown(wait=False, cancel_futures=True)
+    _blocking_executor.shutdown(wait=False, cancel_futures=True)
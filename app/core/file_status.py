@@ -0,0 +1,126 @@
+import asyncio
+from typing import Dict, List, Optional
+from fastapi import HTTPException
+from app.core.constants import (
+    FILE_STATUSES, FILE_STATUS_MIN_INTERVAL_S, FILE_STATUS_MAX_INTERVAL_S,
+    FILE_STATUS_BATCH_SIZE, FILE_READY_TIMEOUT_S,
+)
+from app.core.metrics import stage
+from app.core.shopify import FileProcessingFailed, gql, graphql_url
+
+# Instead of every upload polling its own file, each shop gets one polling
+# loop that asks for all of that shop's pending files in a single
+# `nodes(ids: [...])` query. The loop backs off exponentially while nothing
+# changes, drops back to the fast interval when a new file is registered, and
+# exits once no uploads are waiting on the shop.
+
+class _ShopWatch:
+    def __init__(self, shop: str, token: str):
+        self.shop = shop
+        self.token = token
+        self.waiters: Dict[str, List["asyncio.Future[None]"]] = {}
+        self.wake = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def resolve(self, file_id: str, exc: Optional[BaseException] = None):
+        for future in self.waiters.pop(file_id, []):
+            if future.done():
+                continue
+            if exc is None:
+                future.set_result(None)
+            else:
+                future.set_exception(exc)
+
+    def fail_all(self, exc: BaseException):
+        for file_id in list(self.waiters):
+            self.resolve(file_id, exc)
+
+class FileStatusPoller:
+    def __init__(self):
+        self._shops: Dict[str, _ShopWatch] = {}
+
+    async def wait_ready(self, shop: str, token: str, file_id: str, timeout_s: float = FILE_READY_TIMEOUT_S):
+        watch = self._shops.get(shop)
+        if watch is None:
+            watch = self._shops[shop] = _ShopWatch(shop, token)
+        watch.token = token
+
+        future = asyncio.get_running_loop().create_future()
+        watch.waiters.setdefault(file_id, []).append(future)
+        watch.wake.set()
+        if watch.task is None or watch.task.done():
+            watch.task = asyncio.create_task(self._run(watch))
+
+        try:
+            with stage("ready_wait"):
+                await asyncio.wait_for(asyncio.shield(future), timeout_s)
+        except asyncio.TimeoutError:
+            raise HTTPException(504, f"Timed out waiting for READY on {file_id}")
+        finally:
+            waiting = watch.waiters.get(file_id)
+            if waiting and future in waiting:
+                waiting.remove(future)
+                if not waiting:
+                    del watch.waiters[file_id]
+
+    async def _poll(self, watch: _ShopWatch) -> bool:
+        # One round over every pending file of the shop. Returns True if any
+        # file reached a terminal state.
+        ids = list(watch.waiters)
+        headers = {"X-Shopify-Access-Token": watch.token}
+        progressed = False
+        for i in range(0, len(ids), FILE_STATUS_BATCH_SIZE):
+            d = await gql(graphql_url(watch.shop), headers, FILE_STATUSES, {"ids": ids[i:i + FILE_STATUS_BATCH_SIZE]})
+            for node in d["data"]["nodes"]:
+                if not node:
+                    continue
+                status = node.get("fileStatus")
+                if status == "READY":
+                    watch.resolve(node["id"])
+                    progressed = True
+                elif status in ("FAILED", "CANCELLED"):
+                    watch.resolve(node["id"], FileProcessingFailed(502, f"Video processing failed with status {status}"))
+                    progressed = True
+        return progressed
+
+    async def _run(self, watch: _ShopWatch):
+        delay = FILE_STATUS_MIN_INTERVAL_S
+        try:
+            while watch.waiters:
+                watch.wake.clear()
+                try:
+                    if await self._poll(watch):
+                        delay = FILE_STATUS_MIN_INTERVAL_S
+                    else:
+                        delay = min(delay * 2, FILE_STATUS_MAX_INTERVAL_S)
+                except HTTPException as exc:
+                    if 400 <= exc.status_code < 500 and exc.status_code != 429:
+                        # Bad token or similar: no point in polling again.
+                        watch.fail_all(exc)
+                        break
+                    print(f"fileStatus poll for {watch.shop} failed:", exc.detail)
+                    delay = min(delay * 2, FILE_STATUS_MAX_INTERVAL_S)
+                except Exception as exc:
+                    print(f"fileStatus poll for {watch.shop} failed:", exc)
+                    delay = min(delay * 2, FILE_STATUS_MAX_INTERVAL_S)
+
+                if not watch.waiters:
+                    break
+                await asyncio.sleep(FILE_STATUS_MIN_INTERVAL_S)
+                if not watch.wake.is_set():
+                    # Nothing new registered: wait out the rest of the backoff
+                    # unless a new upload wakes us up.
+                    try:
+                        await asyncio.wait_for(watch.wake.wait(), delay - FILE_STATUS_MIN_INTERVAL_S)
+                    except asyncio.TimeoutError:
+                        pass
+                if watch.wake.is_set():
+                    delay = FILE_STATUS_MIN_INTERVAL_S
+        finally:
+            if self._shops.get(watch.shop) is watch and not watch.waiters:
+                del self._shops[watch.shop]
+
+    def stats(self) -> Dict[str, int]:
+        return {shop: len(watch.waiters) for shop, watch in self._shops.items()}
+
+file_status_poller = FileStatusPoller()
@@ -0,0 +1,131 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+import httpx
+from app.core.constants import (
+    KLING_POOL_MAX_CONNECTIONS, SHOPIFY_POOL_MAX_CONNECTIONS, MEDIA_POOL_MAX_CONNECTIONS,
+    KLING_POOL_PER_HOST, SHOPIFY_POOL_PER_HOST, MEDIA_POOL_PER_HOST, POOL_KEEPALIVE_EXPIRY_S,
+)
+from app.core.metrics import registry
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Metrics are labelled by pool only: shop domains and CDN hosts are unbounded.
+upstream_responses_total = registry.counter("upstream_responses_total", "Upstream HTTP responses by pool and status code.")
+upstream_errors_total = registry.counter("upstream_errors_total", "Upstream requests that failed without a response.")
+upstream_request_seconds = registry.histogram("upstream_request_seconds", "Upstream request time, from getting a host slot to the end of the body.")
+upstream_slot_wait_seconds = registry.histogram("upstream_slot_wait_seconds", "Time spent waiting for a per-host concurrency slot.")
+
+class UpstreamPool:
+    # One keep-alive connection pool per upstream, shared by every request
+    # handler for the lifetime of the app. Each host additionally gets its own
+    # concurrency cap so a single slow shop or CDN cannot take the whole pool.
+    def __init__(self, name: str, max_connections: int, per_host_limit: int, timeout: float, follow_redirects: bool = False):
+        self.name = name
+        self.max_connections = max_connections
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.follow_redirects = follow_redirects
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self._host_in_flight: Dict[str, int] = {}
+        self._host_users: Dict[str, int] = {}  # requests holding or waiting for the host's semaphore
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                timeout=self.timeout,
+                follow_redirects=self.follow_redirects,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=POOL_KEEPALIVE_EXPIRY_S,
+                ),
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @asynccontextmanager
+    async def _slot(self, host: str) -> AsyncIterator[None]:
+        # Semaphores exist only while a host has requests, so the per-shop
+        # and per-CDN maps do not grow with every host ever contacted.
+        slot = self._host_slots.setdefault(host, asyncio.Semaphore(self.per_host_limit))
+        self._host_users[host] = self._host_users.get(host, 0) + 1
+        queued = time.perf_counter()
+        try:
+            async with slot:
+                started = time.perf_counter()
+                upstream_slot_wait_seconds.observe(started - queued, pool=self.name)
+                self.requests += 1
+                self.in_flight += 1
+                self._host_in_flight[host] = self._host_in_flight.get(host, 0) + 1
+                try:
+                    yield
+                except httpx.HTTPError:
+                    self.errors += 1
+                    upstream_errors_total.inc(pool=self.name)
+                    raise
+                finally:
+                    upstream_request_seconds.observe(time.perf_counter() - started, pool=self.name)
+                    self.in_flight -= 1
+                    self._host_in_flight[host] -= 1
+                    if not self._host_in_flight[host]:
+                        del self._host_in_flight[host]
+        finally:
+            self._host_users[host] -= 1
+            if not self._host_users[host]:
+                del self._host_users[host]
+                del self._host_slots[host]
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        host = httpx.URL(url).host
+        async with self._slot(host):
+            response = await self.client.request(method, url, **kwargs)
+        upstream_responses_total.inc(pool=self.name, status=response.status_code)
+        return response
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs: Any) -> AsyncIterator[httpx.Response]:
+        host = httpx.URL(url).host
+        async with self._slot(host):
+            async with self.client.stream(method, url, **kwargs) as response:
+                upstream_responses_total.inc(pool=self.name, status=response.status_code)
+                yield response
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "http2": HTTP2_AVAILABLE,
+            "max_connections": self.max_connections,
+            "per_host_limit": self.per_host_limit,
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "hosts_in_flight": dict(self._host_in_flight),
+        }
+
+kling_pool = UpstreamPool("kling", KLING_POOL_MAX_CONNECTIONS, KLING_POOL_PER_HOST, timeout=10.0)
+shopify_pool = UpstreamPool("shopify", SHOPIFY_POOL_MAX_CONNECTIONS, SHOPIFY_POOL_PER_HOST, timeout=120.0, follow_redirects=True)
+media_pool = UpstreamPool("media", MEDIA_POOL_MAX_CONNECTIONS, MEDIA_POOL_PER_HOST, timeout=60.0, follow_redirects=True)
+
+POOLS = (kling_pool, shopify_pool, media_pool)
+
+async def close_pools():
+    for pool in POOLS:
+        await pool.close()
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    return {pool.name: pool.stats() for pool in POOLS}
@@ -0,0 +1,134 @@
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from app.core.constants import (
+    PUBLIC_BASE_URL, STATIC_DIR, IMAGE_MAX_SIDE, IMAGE_ASPECT, IMAGE_PNG_COMPRESSION,
+    IMAGE_STORE_MAX_BYTES, IMAGE_STORE_ORPHAN_TTL_S, IMAGE_STORE_GRACE_S, IMAGE_STORE_GC_INTERVAL_S,
+)
+from app.core.executor import run_db
+from app.db.models.video import Video
+from app.db.session import SessionLocal
+
+class ImageStore:
+    # Normalized product PNGs keyed by a hash of the source bytes and the
+    # normalization settings, so the same Shopify image is only re-encoded once.
+    # A file's reference count is the number of Video.image1..image4 columns
+    # pointing at it; unreferenced files stay around as a cache until the store
+    # goes over its size budget or the orphan TTL, least recently used first.
+    subdir = "images"
+
+    def __init__(self, root: str):
+        self.root = os.path.join(root, self.subdir)
+        self.url_prefix = f"{PUBLIC_BASE_URL}/static/{self.subdir}/"
+        self._params = f"{IMAGE_MAX_SIDE}|{IMAGE_ASPECT}|{IMAGE_PNG_COMPRESSION}".encode()
+        self._task: Optional[asyncio.Task] = None
+        os.makedirs(self.root, exist_ok=True)
+
+    def key_for(self, content: bytes) -> str:
+        h = hashlib.sha256(content)
+        h.update(b"|" + self._params)
+        return h.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.png")
+
+    def url(self, key: str) -> str:
+        return f"{self.url_prefix}{key}.png"
+
+    def key_from_url(self, url: Optional[str]) -> Optional[str]:
+        if not url or not url.startswith(self.url_prefix) or not url.endswith(".png"):
+            return None
+        return url[len(self.url_prefix):-len(".png")]
+
+    def lookup(self, key: str) -> bool:
+        # A hit refreshes the file's mtime, which is what LRU eviction orders by.
+        try:
+            os.utime(self.path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def temp_path(self, key: str) -> str:
+        return os.path.join(self.root, f".{key}.{uuid.uuid4().hex}.tmp.png")
+
+    def commit(self, temp_path: str, key: str):
+        os.replace(temp_path, self.path(key))
+
+    def refcounts(self, db: Session) -> Dict[str, int]:
+        counts: Counter = Counter()
+        rows = db.query(Video.image1, Video.image2, Video.image3, Video.image4).yield_per(1000)
+        for row in rows:
+            for url in row:
+                key = self.key_from_url(url)
+                if key:
+                    counts[key] += 1
+        return dict(counts)
+
+    def gc(self, db: Session) -> Tuple[int, int]:
+        # Returns (files_removed, bytes_removed).
+        refs = self.refcounts(db)
+        now = time.time()
+        orphans: List[Tuple[float, int, str]] = []
+        total = 0
+        for entry in os.scandir(self.root):
+            if not entry.is_file():
+                continue
+            st = entry.stat()
+            total += st.st_size
+            if now - st.st_mtime < IMAGE_STORE_GRACE_S:
+                continue
+            if entry.name.startswith("."):
+                # Leftover temp file from an interrupted encode.
+                orphans.append((0.0, st.st_size, entry.path))
+            elif entry.name[:-len(".png")] not in refs:
+                orphans.append((st.st_mtime, st.st_size, entry.path))
+
+        removed = removed_bytes = 0
+        for mtime, size, path in sorted(orphans):
+            if now - mtime < IMAGE_STORE_ORPHAN_TTL_S and total <= IMAGE_STORE_MAX_BYTES:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            removed += 1
+            removed_bytes += size
+        return removed, removed_bytes
+
+    def _gc_once(self) -> Tuple[int, int]:
+        db = SessionLocal()
+        try:
+            return self.gc(db)
+        finally:
+            db.close()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                removed, removed_bytes = await run_db(self._gc_once)
+                if removed:
+                    print(f"Image store GC removed {removed} files ({removed_bytes} bytes)")
+            except Exception as exc:
+                print("Image store GC failed:", exc)
+            await asyncio.sleep(IMAGE_STORE_GC_INTERVAL_S)
+
+image_store = ImageStore(STATIC_DIR)
@@ -0,0 +1,128 @@
+import asyncio
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+from app.core.constants import IMAGE_MAX_SIDE, IMAGE_ASPECT, IMAGE_PNG_COMPRESSION
+from app.core.executor import run_blocking
+from app.core.http import media_pool
+from app.core.image_store import image_store
+from app.core.metrics import stage
+
+@dataclass
+class IngestedImage:
+    source_url: str
+    key: str
+    url: str
+    cached: bool
+    size_in: int
+    fetch_ms: float
+    process_ms: float
+
+def _parse_aspect(aspect: str) -> Optional[float]:
+    if not aspect:
+        return None
+    w, h = aspect.split(":")
+    return float(w) / float(h)
+
+def normalize_image(img: np.ndarray, max_side: int = IMAGE_MAX_SIDE, aspect: Optional[float] = _parse_aspect(IMAGE_ASPECT)) -> np.ndarray:
+    # Letterbox to the target aspect ratio (so product edges are never cropped),
+    # then downscale so the longest side is at most `max_side`.
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    h, w = img.shape[:2]
+
+    if aspect:
+        target_w, target_h = w, h
+        if w / h < aspect:
+            target_w = int(round(h * aspect))
+        else:
+            target_h = int(round(w / aspect))
+        if (target_w, target_h) != (w, h):
+            top = (target_h - h) // 2
+            left = (target_w - w) // 2
+            fill = (255,) * img.shape[2]
+            img = cv2.copyMakeBorder(img, top, target_h - h - top, left, target_w - w - left, cv2.BORDER_CONSTANT, value=fill)
+            h, w = target_h, target_w
+
+    scale = max_side / max(h, w)
+    if scale < 1:
+        img = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    return img
+
+def decode_normalize_save(content: bytes, path: str):
+    img = cv2.imdecode(np.frombuffer(content, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise ValueError("Failed to decode image")
+    img = normalize_image(img)
+    if not cv2.imwrite(path, img, [cv2.IMWRITE_PNG_COMPRESSION, IMAGE_PNG_COMPRESSION]):
+        raise ValueError("Failed to encode image")
+
+# Encodes currently running in this process, so concurrent requests for the
+# same image wait for one encode instead of racing.
+_encoding: Dict[str, "asyncio.Future[None]"] = {}
+
+async def _store(key: str, content: bytes) -> bool:
+    # Returns True when the image was already in the store.
+    if key in _encoding:
+        await asyncio.shield(_encoding[key])
+        return True
+    if await run_blocking(image_store.lookup, key):
+        return True
+    if key in _encoding:
+        # Another request started the same encode while we were checking the store.
+        await asyncio.shield(_encoding[key])
+        return True
+
+    future = asyncio.get_running_loop().create_future()
+    _encoding[key] = future
+    try:
+        temp_path = image_store.temp_path(key)
+        with stage("image_encode"):
+            await run_blocking(decode_normalize_save, content, temp_path)
+        await run_blocking(image_store.commit, temp_path, key)
+        future.set_result(None)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as exc:
+        future.set_exception(exc)
+        future.exception()  # mark retrieved when nobody else is waiting
+        raise
+    finally:
+        del _encoding[key]
+    return False
+
+async def _ingest_one(url: str) -> IngestedImage:
+    start = perf_counter()
+    with stage("image_fetch"):
+        response = await media_pool.request("GET", url)
+        response.raise_for_status()
+    fetched = perf_counter()
+
+    key = image_store.key_for(response.content)
+    cached = await _store(key, response.content)
+    done = perf_counter()
+
+    return IngestedImage(
+        source_url=url,
+        key=key,
+        url=image_store.url(key),
+        cached=cached,
+        size_in=len(response.content),
+        fetch_ms=(fetched - start) * 1000,
+        process_ms=(done - fetched) * 1000,
+    )
+
+async def ingest_images(urls: List[str]) -> List[IngestedImage]:
+    # All downloads run concurrently; decode/normalize/encode runs on the
+    # blocking pool as each download lands. Order of `urls` is preserved.
+    return list(await asyncio.gather(*(_ingest_one(url) for url in urls)))
+
+def server_timing(images: List[IngestedImage]) -> str:
+    parts: List[Tuple[str, float]] = []
+    for i, image in enumerate(images, start=1):
+        parts.append((f"img{i}-fetch", image.fetch_ms))
+        parts.append((f"img{i}-process", image.process_ms))
+    return ", ".join(f"{name};dur={ms:.1f}" for name, ms in parts)
@@ -0,0 +1,110 @@
+import asyncio
+import random
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import quote
+import httpx
+from sqlalchemy.orm import Session
+from app.core.constants import (
+    KLING_AI_GENERATE_URL, KLING_AI_TASK_STATUS_URL, KLING_SUBMIT_MAX_RPS,
+    KLING_CALLBACK_SECRET, KLING_CALLBACK_BASE_URL, KLING_QUEUE_TIMEOUT_S, KLING_SUBMIT_RETRIES, KLING_SUBMIT_BACKOFF_S,
+)
+from app.core.http import kling_pool
+from app.core.kling_auth import kling_keys
+from app.core.kling_scheduler import kling_scheduler
+from app.core.metrics import registry, stage
+from app.db.models.video import Video
+
+# Each Kling account gets its own submit rate limit, so adding key pairs
+# raises the overall ceiling; a bulk job still cannot push any single account
+# over its quota.
+kling_submit_retries = registry.counter("kling_submit_retries_total", "Kling submissions retried after a 429 or 5xx.")
+
+_submit_locks: Dict[str, asyncio.Lock] = {}
+_last_submit: Dict[str, float] = {}
+
+async def _submit_throttle(account: str):
+    async with _submit_locks.setdefault(account, asyncio.Lock()):
+        wait = _last_submit.get(account, 0.0) + 1 / KLING_SUBMIT_MAX_RPS - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        _last_submit[account] = time.monotonic()
+
+def callback_url() -> Optional[str]:
+    # Kling POSTs the task state here on every status change. The shared
+    # secret in the query string is what the receiver checks.
+    if not KLING_CALLBACK_SECRET:
+        return None
+    return f"{KLING_CALLBACK_BASE_URL}/api/v1/kling/callback?token={quote(KLING_CALLBACK_SECRET)}"
+
+def _retry_delay(response: httpx.Response, attempt: int) -> float:
+    retry_after = response.headers.get("Retry-After")
+    if retry_after and retry_after.replace(".", "", 1).isdigit():
+        return float(retry_after)
+    return KLING_SUBMIT_BACKOFF_S * 2 ** attempt + random.uniform(0, KLING_SUBMIT_BACKOFF_S)
+
+async def _post_task(payload: Dict[str, Any]) -> Tuple[httpx.Response, str]:
+    # 429 (quota / concurrency) and 5xx are retried with backoff; anything
+    # else is returned to the caller.
+    attempt = 0
+    while True:
+        with kling_keys.use(balance=True) as (account, headers):
+            await _submit_throttle(account)
+            with stage("kling_submit"):
+                response = await kling_pool.request("POST", KLING_AI_GENERATE_URL, json=payload, headers=headers)
+        retryable = response.status_code == 429 or response.status_code >= 500
+        if not retryable or attempt == KLING_SUBMIT_RETRIES:
+            return response, account
+        delay = _retry_delay(response, attempt)
+        kling_submit_retries.inc(status=response.status_code)
+        print(f"Kling submit returned {response.status_code}, retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+        attempt += 1
+
+async def submit_task(payload: Dict[str, Any], shop: str, queue_timeout: Optional[float] = KLING_QUEUE_TIMEOUT_S) -> Tuple[Dict[str, Any], str]:
+    # Returns the Kling response and the account the task was created under;
+    # later status calls for the task have to use that same account. The
+    # response carries a "queue" entry with the scheduler position and wait.
+    url = callback_url()
+    if url:
+        payload = {**payload, "callback_url": url}
+    with stage("kling_queue_wait"):
+        ticket = await kling_scheduler.acquire(shop, queue_timeout)
+    try:
+        response, account = await _post_task(payload)
+        print(response.json())
+        response.raise_for_status()
+        data = response.json()
+        kling_scheduler.bind(ticket, data['data']['task_id'])
+    finally:
+        kling_scheduler.abandon(ticket)
+    data["queue"] = ticket.feedback()
+    return data, account
+
+async def fetch_task(task_id: str, account: Optional[str] = None) -> Dict[str, Any]:
+    with kling_keys.use(account) as (_, headers), stage("kling_status"):
+        response = await kling_pool.request("GET", f"{KLING_AI_TASK_STATUS_URL}/{task_id}", headers=headers)
+    response.raise_for_status()
+    return response.json()["data"]
+
+def apply_task_result(db: Session, video: Video, data: Dict[str, Any], thumbnail: Optional[str] = None) -> bool:
+    # Returns True when the row changed. Only `processing` rows are updated so
+    # re-applying the same result is a no-op.
+    if video.status != 'processing':
+        return False
+
+    if data['task_status'] == 'succeed':
+        result = data['task_result']['videos'][0]
+        video.video_url = result['url']
+        video.duration = result['duration']
+        video.thumbnail = thumbnail
+        video.status = 'completed'
+    elif data['task_status'] == 'failed':
+        video.status = 'failed'
+    else:
+        return False
+
+    db.commit()
+    db.refresh(video)
+    kling_scheduler.release(video.id)
+    return True
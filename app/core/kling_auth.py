@@ -0,0 +1,91 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from app.core.constants import (
+    ACCESS_KEY, SECRET_KEY, KLING_KEY_PAIRS, KLING_KEY_STRATEGY,
+    KLING_TOKEN_TTL_S, KLING_TOKEN_REFRESH_MARGIN_S,
+)
+from app.core.utils import encode_jwt_token
+
+class KlingKey:
+    # One Kling account. The signed JWT is cached and only re-signed once it
+    # is within KLING_TOKEN_REFRESH_MARGIN_S of expiring.
+    def __init__(self, access_key: str, secret_key: str):
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.signings = 0
+
+    def token(self) -> str:
+        now = time.time()
+        if self._token is None or now >= self._expires_at - KLING_TOKEN_REFRESH_MARGIN_S:
+            self._token = encode_jwt_token(self.access_key, self.secret_key, KLING_TOKEN_TTL_S)
+            self._expires_at = now + KLING_TOKEN_TTL_S
+            self.signings += 1
+        return self._token
+
+def _parse_pairs(raw: str) -> List[Tuple[str, str]]:
+    pairs = [(ACCESS_KEY, SECRET_KEY)]
+    for item in raw.split(","):
+        if ":" in item:
+            ak, sk = item.strip().split(":", 1)
+            if ak and ak not in {p[0] for p in pairs}:
+                pairs.append((ak, sk))
+    return pairs
+
+class KlingKeys:
+    # Spreads Kling calls over every configured key pair. New tasks go to the
+    # least-loaded (or next round-robin) account; calls about an existing task
+    # must use the account that created it, and tasks recorded without one
+    # predate multiple keys, so they belong to the default key. A threading
+    # lock keeps this safe from both the event loop and executor threads.
+    def __init__(self, pairs: List[Tuple[str, str]], strategy: str):
+        self.keys = [KlingKey(ak, sk) for ak, sk in pairs]
+        self.strategy = strategy
+        self._by_access_key = {key.access_key: key for key in self.keys}
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def _pick(self, account: Optional[str], balance: bool) -> KlingKey:
+        if not balance:
+            if account is None:
+                return self.keys[0]
+            if account not in self._by_access_key:
+                print(f"Unknown Kling account {account}, using the default key")
+                return self.keys[0]
+            return self._by_access_key[account]
+        if self.strategy == "round_robin":
+            key = self.keys[self._next % len(self.keys)]
+            self._next += 1
+            return key
+        return min(self.keys, key=lambda k: k.in_flight)
+
+    @contextmanager
+    def use(self, account: Optional[str] = None, balance: bool = False) -> Iterator[Tuple[str, Dict[str, str]]]:
+        # Yields (account, headers) and counts the call as in flight on that key.
+        # balance=True (new submissions only) ignores `account` and spreads the load.
+        with self._lock:
+            key = self._pick(account, balance)
+            headers = {"Authorization": f"Bearer {key.token()}"}
+            key.in_flight += 1
+            key.requests += 1
+        try:
+            yield key.access_key, headers
+        finally:
+            with self._lock:
+                key.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "strategy": self.strategy,
+            "keys": [
+                {"key": index, "in_flight": key.in_flight, "requests": key.requests, "signings": key.signings}
+                for index, key in enumerate(self.keys)
+            ],
+        }
+
+kling_keys = KlingKeys(_parse_pairs(KLING_KEY_PAIRS), KLING_KEY_STRATEGY)
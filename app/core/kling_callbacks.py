@@ -0,0 +1,149 @@
+import asyncio
+import hmac
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set
+from sqlalchemy import or_
+from app.core.constants import (
+    KLING_CALLBACK_SECRET, THUMBNAIL_RETRY_INTERVAL_S, THUMBNAIL_RETRY_BATCH, THUMBNAIL_RETRY_WINDOW_S,
+)
+from app.core.executor import run_db
+from app.core.kling import apply_task_result
+from app.core.kling_scheduler import kling_scheduler
+from app.core.thumbnail_store import thumbnail_store
+from app.db.models.video import Video
+from app.db.session import SessionLocal
+
+# Kling reports task state changes to POST /kling/callback; the poller hands
+# over the results it fetches for tasks whose callback never came. The result
+# is applied to the Video row right away (so the UI sees the finished video
+# without waiting for a thumbnail); the thumbnail is extracted afterwards in
+# the background. Redelivered callbacks are no-ops: apply_task_result only
+# touches `processing` rows and a thumbnail is extracted at most once.
+# Completed rows still without a thumbnail (extraction failed, or the process
+# stopped before it ran) are picked up by a periodic sweep, with exponential
+# backoff per video.
+
+def verify_callback_token(token: Optional[str]) -> bool:
+    if not KLING_CALLBACK_SECRET or not token:
+        return False
+    return hmac.compare_digest(token.encode(), KLING_CALLBACK_SECRET.encode())
+
+def _apply(task_id: str, data: Dict[str, Any]) -> Optional[str]:
+    # Returns the video URL when the row still needs a thumbnail.
+    db = SessionLocal()
+    try:
+        video = db.query(Video).filter(Video.id == task_id).first()
+        if not video:
+            return None
+        apply_task_result(db, video, data)
+        if video.status == 'completed' and not video.thumbnail and video.video_url:
+            return video.video_url
+        return None
+    finally:
+        db.close()
+
+def _missing_thumbnails(since: datetime, skip: List[str], limit: int) -> List[Any]:
+    db = SessionLocal()
+    try:
+        query = db.query(Video.id, Video.video_url).filter(
+            Video.status == 'completed',
+            or_(Video.thumbnail == None, Video.thumbnail == ''),
+            Video.video_url != '',
+            Video.created_at >= since,
+        )
+        if skip:
+            query = query.filter(Video.id.notin_(skip))
+        return query.order_by(Video.created_at.desc()).limit(limit).all()
+    finally:
+        db.close()
+
+def _set_thumbnail(task_id: str, key: str):
+    db = SessionLocal()
+    try:
+        video = db.query(Video).filter(Video.id == task_id).first()
+        if video and not video.thumbnail:
+            video.thumbnail = key
+            db.commit()
+    finally:
+        db.close()
+
+class KlingCallbacks:
+    def __init__(self):
+        self._thumbnails: Dict[str, asyncio.Task] = {}
+        self._failures: Dict[str, int] = {}
+        self._retry_at: Dict[str, float] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+        self.received = 0
+        self.retried = 0
+
+    def start(self):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def handle(self, data: Dict[str, Any]):
+        self.received += 1
+        task_id = data.get("task_id")
+        if not task_id or data.get("task_status") not in ("succeed", "failed"):
+            return
+        await self.apply(task_id, data)
+
+    async def apply(self, task_id: str, data: Dict[str, Any]):
+        video_url = await run_db(_apply, task_id, data)
+        # The row may not exist yet (bulk jobs insert after submission) or may
+        # have been deleted; the task is finished on Kling either way.
+        kling_scheduler.release(task_id)
+        if video_url:
+            self._extract(task_id, video_url)
+
+    def _extract(self, task_id: str, video_url: str):
+        if task_id not in self._thumbnails:
+            task = asyncio.create_task(self._thumbnail(task_id, video_url))
+            self._thumbnails[task_id] = task
+            task.add_done_callback(lambda _: self._thumbnails.pop(task_id, None))
+
+    async def _thumbnail(self, task_id: str, video_url: str):
+        try:
+            key = await thumbnail_store.store_from_video(video_url)
+            await run_db(_set_thumbnail, task_id, key)
+            self._failures.pop(task_id, None)
+            self._retry_at.pop(task_id, None)
+        except Exception as exc:
+            failures = self._failures.get(task_id, 0) + 1
+            self._failures[task_id] = failures
+            self._retry_at[task_id] = time.monotonic() + min(THUMBNAIL_RETRY_INTERVAL_S * 2 ** failures, 3600)
+            print(f"Thumbnail extraction for {task_id} failed (attempt {failures}):", exc)
+
+    async def retry_thumbnails(self) -> int:
+        now = time.monotonic()
+        for task_id, at in list(self._retry_at.items()):
+            if at < now - THUMBNAIL_RETRY_WINDOW_S:
+                self._retry_at.pop(task_id, None)
+                self._failures.pop(task_id, None)
+        skip = list(self._thumbnails) + [t for t, at in self._retry_at.items() if at > now]
+        since = datetime.now(timezone.utc) - timedelta(seconds=THUMBNAIL_RETRY_WINDOW_S)
+        rows = await run_db(_missing_thumbnails, since, skip, THUMBNAIL_RETRY_BATCH)
+        for row in rows:
+            self._extract(row.id, row.video_url)
+        self.retried += len(rows)
+        return len(rows)
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(THUMBNAIL_RETRY_INTERVAL_S)
+            try:
+                await self.retry_thumbnails()
+            except Exception as exc:
+                print("Thumbnail retry sweep failed:", exc)
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+        tasks: Set[asyncio.Task] = set(self._thumbnails.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+kling_callbacks = KlingCallbacks()
@@ -0,0 +1,266 @@
+import asyncio
+import heapq
+import itertools
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from fastapi import HTTPException
+from app.core.constants import (
+    KLING_MAX_IN_FLIGHT, KLING_SLOT_TIMEOUT_S, KLING_QUEUE_MAX, KLING_QUEUE_MAX_PER_SHOP, KLING_SHOP_WEIGHTS,
+)
+from app.core.executor import run_db
+from app.db.models.credits import Credits
+from app.db.models.video import Video
+from app.db.session import SessionLocal
+
+# Caps the number of Kling tasks this process has running (submitted and not
+# yet succeeded/failed) at KLING_MAX_IN_FLIGHT. A submission takes a slot
+# before it is sent; the slot stays with the task id until the poller or a
+# callback records the final state. Waiting submissions are served in
+# start-time fair queuing order: each shop's waiters get tags spaced
+# 1/weight apart, the lowest tag goes next, so a shop queueing fifty
+# generations only delays other shops by its fair share.
+#
+# The cap is held in this process only. Run a single submitting worker, or
+# split the plan's limit across workers (KLING_MAX_IN_FLIGHT = limit / workers).
+# After a restart every worker seeds its count with all unfinished tasks, which
+# errs on the side of the quota; those slots are freed by reconcile() once the
+# rows leave `processing`, whichever worker applied the result.
+
+_WEIGHT_TTL_S = 300
+_EXPIRE_TICK_S = 30
+
+def _parse_weights(spec: str) -> Dict[int, float]:
+    weights: Dict[int, float] = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        plan, weight = part.split(":")
+        weights[int(plan)] = float(weight)
+    return weights
+
+_weights_by_plan = _parse_weights(KLING_SHOP_WEIGHTS)
+
+class KlingQueueFull(HTTPException):
+    pass
+
+@dataclass
+class Ticket:
+    shop: str
+    position: int  # submissions ahead of this one when it was queued; 0 = slot was free
+    wait_ms: float = 0.0
+    bound: bool = False
+
+    def feedback(self) -> Dict[str, Any]:
+        return {"position": self.position, "wait_ms": round(self.wait_ms)}
+
+def _load_weight(shop: str) -> float:
+    db = SessionLocal()
+    try:
+        credits = db.query(Credits.subscription_type, Credits.subscription_expired).filter(Credits.shop_name == shop).first()
+    finally:
+        db.close()
+    if not credits or credits.subscription_type is None:
+        return 1.0
+    if credits.subscription_expired and credits.subscription_expired < datetime.now():
+        return 1.0
+    return _weights_by_plan.get(credits.subscription_type, 1.0)
+
+def _load_running() -> List[Any]:
+    since = datetime.now(timezone.utc) - timedelta(seconds=KLING_SLOT_TIMEOUT_S)
+    db = SessionLocal()
+    try:
+        return db.query(Video.id, Video.shop).filter(Video.status == 'processing', Video.created_at >= since).all()
+    finally:
+        db.close()
+
+class KlingScheduler:
+    def __init__(self):
+        self.limit = KLING_MAX_IN_FLIGHT
+        self._running: Dict[str, Tuple[str, float]] = {}  # task_id -> (shop, started)
+        self._seen: Set[str] = set()  # running tasks whose Video row has been seen in `processing`
+        self._pending = 0  # slots handed out to submissions that have no task id yet
+        self._heap: List[list] = []  # [tag, seq, shop, future]
+        self._queued: Dict[str, int] = {}
+        self._last_tag: Dict[str, float] = {}
+        self._vclock = 0.0
+        self._seq = itertools.count()
+        self._weights: Dict[str, Tuple[float, float]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._restore: Optional[asyncio.Task] = None
+        self._expirer: Optional[asyncio.Task] = None
+        self.dispatched = 0
+        self.rejected = 0
+        self.expired = 0
+
+    def start(self):
+        # Tasks submitted before a restart still count against the Kling quota.
+        self._loop = asyncio.get_running_loop()
+        if self._restore is None:
+            self._restore = asyncio.create_task(self._restore_running())
+        if self._expirer is None:
+            self._expirer = asyncio.create_task(self._expire_loop())
+
+    async def stop(self):
+        tasks = [t for t in (self._restore, self._expirer) if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._restore = self._expirer = None
+        for entry in self._heap:
+            if not entry[3].done():
+                entry[3].cancel()
+
+    async def _restore_running(self):
+        try:
+            rows = await run_db(_load_running)
+        except Exception as exc:
+            print("Could not restore running Kling tasks:", exc)
+            return
+        now = time.monotonic()
+        for row in rows:
+            if row.id not in self._running:
+                self._running[row.id] = (row.shop, now)
+                self._seen.add(row.id)
+
+    async def _expire_loop(self):
+        # Waiters only get a slot when one is freed, so stale slots have to be
+        # expired even when no new submission comes in.
+        while True:
+            await asyncio.sleep(_EXPIRE_TICK_S)
+            self._expire()
+
+    def in_flight(self) -> int:
+        return len(self._running) + self._pending
+
+    async def _weight(self, shop: str) -> float:
+        cached = self._weights.get(shop)
+        if cached and time.monotonic() - cached[1] < _WEIGHT_TTL_S:
+            return cached[0]
+        try:
+            weight = await run_db(_load_weight, shop)
+        except Exception as exc:
+            print(f"Could not load the plan of {shop}:", exc)
+            weight = 1.0
+        self._weights[shop] = (weight, time.monotonic())
+        return weight
+
+    async def acquire(self, shop: str, timeout: Optional[float] = None) -> Ticket:
+        self._loop = asyncio.get_running_loop()
+        weight = await self._weight(shop)
+        self._expire()
+        if not self._queued_total() and self.in_flight() < self.limit:
+            self._pending += 1
+            self.dispatched += 1
+            return Ticket(shop, 0)
+
+        if self._queued.get(shop, 0) >= KLING_QUEUE_MAX_PER_SHOP or self._queued_total() >= KLING_QUEUE_MAX:
+            self.rejected += 1
+            raise KlingQueueFull(503, {"message": "Video generation queue is full, try again shortly", "queued": self._queued.get(shop, 0)}, headers={"Retry-After": "30"})
+
+        tag = max(self._vclock, self._last_tag.get(shop, 0.0)) + 1 / weight
+        self._last_tag[shop] = tag
+        future = asyncio.get_running_loop().create_future()
+        position = 1 + sum(1 for e in self._heap if not e[3].done() and e[0] <= tag)
+        heapq.heappush(self._heap, [tag, next(self._seq), shop, future])
+        self._queued[shop] = self._queued.get(shop, 0) + 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise KlingQueueFull(503, {"message": "Timed out waiting for a video generation slot", "position": position}, headers={"Retry-After": "30"})
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.abandon(Ticket(shop, position))
+            raise
+        finally:
+            self._dequeued(shop)
+        return Ticket(shop, position, (time.perf_counter() - start) * 1000)
+
+    def _queued_total(self) -> int:
+        return sum(self._queued.values())
+
+    def _dequeued(self, shop: str):
+        self._queued[shop] -= 1
+        if not self._queued[shop]:
+            del self._queued[shop]
+            # An idle shop starts from the current virtual time when it comes
+            # back, so being quiet does not bank priority.
+            self._last_tag.pop(shop, None)
+
+    def _dispatch(self):
+        while self._heap and self.in_flight() < self.limit:
+            tag, _, _, future = heapq.heappop(self._heap)
+            if future.done():
+                continue  # timed out or cancelled while queued
+            self._vclock = tag
+            self._pending += 1
+            self.dispatched += 1
+            future.set_result(None)
+
+    def bind(self, ticket: Ticket, task_id: str):
+        # The submission was accepted; the slot now belongs to the task.
+        if not ticket.bound:
+            ticket.bound = True
+            self._pending -= 1
+            self._running[task_id] = (ticket.shop, time.monotonic())
+
+    def abandon(self, ticket: Ticket):
+        # The submission failed; nothing is running on Kling for it.
+        if not ticket.bound:
+            ticket.bound = True
+            self._pending -= 1
+            self._dispatch()
+
+    def release(self, task_id: str):
+        # Called when a task reaches a final state. Safe from executor threads.
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.call_soon_threadsafe(self._release, task_id)
+            return
+        self._release(task_id)
+
+    def _release(self, task_id: str):
+        if task_id in self._running:
+            self._drop(task_id)
+            self._dispatch()
+
+    def _drop(self, task_id: str):
+        self._running.pop(task_id, None)
+        self._seen.discard(task_id)
+
+    def reconcile(self, processing: Iterable[str]):
+        # Drops slots of tasks whose rows left `processing` without passing
+        # through release() (deleted videos, results applied by another worker).
+        # A task only counts as gone once its row has been seen: bulk jobs
+        # insert their rows shortly after submission.
+        processing = set(processing)
+        for task_id in list(self._running):
+            if task_id in processing:
+                self._seen.add(task_id)
+            elif task_id in self._seen:
+                self._drop(task_id)
+        self._dispatch()
+
+    def _expire(self):
+        cutoff = time.monotonic() - KLING_SLOT_TIMEOUT_S
+        for task_id, (_, started) in list(self._running.items()):
+            if started < cutoff:
+                self._drop(task_id)
+                self.expired += 1
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight(),
+            "queued": self._queued_total(),
+            "dispatched": self.dispatched,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "shops_queued": len(self._queued),
+        }
+
+kling_scheduler = KlingScheduler()
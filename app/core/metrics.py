@@ -0,0 +1,176 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from app.core.constants import METRICS_PREFIX, OTEL_ENABLED
+
+try:
+    from opentelemetry import trace
+    _tracer = trace.get_tracer("lookmotion") if OTEL_ENABLED else None
+except ImportError:
+    _tracer = None
+
+# Small in-process metrics registry rendered in the Prometheus text format at
+# GET /metrics. Metrics are updated from the event loop and from executor
+# threads, so every update takes the metric's lock.
+
+Labels = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _fmt(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = f"{METRICS_PREFIX}{name}"
+        self.help = help_text
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any):
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            return self.header() + [f"{self.name}{_fmt(k)} {v}" for k, v in self._values.items()]
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self._values: Dict[Labels, float] = {}
+
+    def set(self, value: float, **labels: Any):
+        with self._lock:
+            self._values[_labels(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: Any):
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: Any):
+        self.inc(-amount, **labels)
+
+    def clear(self):
+        # For collectors whose label set shrinks (e.g. per-shop queues that drained).
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> List[str]:
+        with self._lock:
+            return self.header() + [f"{self.name}{_fmt(k)} {v}" for k, v in self._values.items()]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+        self._values: Dict[Labels, List[float]] = {}  # bucket counts..., +Inf count, sum
+
+    def observe(self, value: float, **labels: Any):
+        key = _labels(labels)
+        with self._lock:
+            row = self._values.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += 1
+            row[-1] += value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        with self._lock:
+            for key, row in self._values.items():
+                for bound, count in zip(self.buckets, row):
+                    lines.append(f"{self.name}_bucket{_fmt(key, ('le', repr(float(bound))))} {count}")
+                lines.append(f"{self.name}_bucket{_fmt(key, ('le', '+Inf'))} {row[-2]}")
+                lines.append(f"{self.name}_count{_fmt(key)} {row[-2]}")
+                lines.append(f"{self.name}_sum{_fmt(key)} {row[-1]}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], None]] = []
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._add(Counter(name, help_text))
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._add(Gauge(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn: Callable[[], None]):
+        # Called before every render to refresh gauges that mirror state kept
+        # elsewhere (pool usage, queue lengths).
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        for fn in self._collectors:
+            try:
+                fn()
+            except Exception as exc:
+                print("Metrics collector failed:", exc)
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+registry = Registry()
+
+stage_seconds = registry.histogram("stage_duration_seconds", "Time spent in one step of a request or background job.")
+stage_errors = registry.counter("stage_errors_total", "Steps that raised.")
+stage_in_flight = registry.gauge("stage_in_flight", "Steps currently running.")
+
+@contextmanager
+def stage(name: str, **attributes: Any) -> Iterator[None]:
+    # Times one step. Works from async code and executor threads alike; with
+    # OTEL_ENABLED and opentelemetry installed, each step is also a span.
+    span = _tracer.start_as_current_span(name, attributes={k: str(v) for k, v in attributes.items()}) if _tracer else None
+    if span is not None:
+        span.__enter__()
+    stage_in_flight.inc(stage=name)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as exc:
+        stage_errors.inc(stage=name)
+        if span is not None:
+            span.__exit__(type(exc), exc, exc.__traceback__)
+            span = None
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=name)
+        stage_in_flight.dec(stage=name)
+        if span is not None:
+            span.__exit__(None, None, None)
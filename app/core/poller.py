@@ -0,0 +1,122 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from app.core.constants import (
+    KLING_POLL_TICK_S, KLING_POLL_BATCH_SIZE, KLING_POLL_CONCURRENCY, KLING_POLL_MAX_RPS,
+    KLING_POLL_FIRST_DELAY_S, KLING_POLL_MIN_INTERVAL_S, KLING_POLL_MAX_INTERVAL_S,
+    KLING_CALLBACK_SECRET, KLING_CALLBACK_FALLBACK_DELAY_S,
+)
+from app.core.executor import run_db
+from app.core.kling import fetch_task
+from app.core.kling_callbacks import kling_callbacks
+from app.core.kling_scheduler import kling_scheduler
+from app.db.session import SessionLocal
+from app.db.models.video import Video
+
+def _age_seconds(created_at: Optional[datetime]) -> float:
+    if created_at is None:
+        return 0.0
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (datetime.now(timezone.utc) - created_at).total_seconds())
+
+def _interval(age: float, failures: int) -> float:
+    # Young tasks are checked often, old ones progressively less; upstream
+    # errors back the task off exponentially on top of that.
+    interval = max(KLING_POLL_MIN_INTERVAL_S, age / 6)
+    if failures:
+        interval *= 2 ** failures
+    return min(KLING_POLL_MAX_INTERVAL_S, interval)
+
+class KlingPoller:
+    def __init__(self):
+        self._next_check: Dict[str, float] = {}
+        self._failures: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._sem = asyncio.Semaphore(KLING_POLL_CONCURRENCY)
+        self._rate_lock = asyncio.Lock()
+        self._last_request = 0.0
+        # With callbacks registered, polling only catches tasks whose callback never arrived.
+        self.first_delay = KLING_CALLBACK_FALLBACK_DELAY_S if KLING_CALLBACK_SECRET else KLING_POLL_FIRST_DELAY_S
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as exc:
+                print("Kling poller sweep failed:", exc)
+            await asyncio.sleep(KLING_POLL_TICK_S)
+
+    def _load_processing(self) -> List[Any]:
+        db = SessionLocal()
+        try:
+            return db.query(Video.id, Video.created_at, Video.kling_account).filter(Video.status == 'processing').all()
+        finally:
+            db.close()
+
+    async def sweep(self):
+        rows = await run_db(self._load_processing)
+        now = time.monotonic()
+
+        ages = {row.id: _age_seconds(row.created_at) for row in rows}
+        kling_scheduler.reconcile(ages)
+        accounts = {row.id: row.kling_account for row in rows}
+        for task_id in list(self._next_check):
+            if task_id not in ages:
+                self._next_check.pop(task_id, None)
+                self._failures.pop(task_id, None)
+        for task_id, age in ages.items():
+            if task_id not in self._next_check:
+                self._next_check[task_id] = now + max(0.0, self.first_delay - age)
+
+        due = sorted((t for t, at in self._next_check.items() if at <= now), key=self._next_check.__getitem__)
+        due = due[:KLING_POLL_BATCH_SIZE]
+        if due:
+            await asyncio.gather(*(self._poll_one(task_id, ages[task_id], accounts[task_id]) for task_id in due))
+
+    async def _throttle(self):
+        async with self._rate_lock:
+            wait = self._last_request + 1 / KLING_POLL_MAX_RPS - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._last_request = time.monotonic()
+
+    def _reschedule(self, task_id: str, age: float):
+        self._next_check[task_id] = time.monotonic() + _interval(age, self._failures.get(task_id, 0))
+
+    async def _poll_one(self, task_id: str, age: float, account: Optional[str] = None):
+        async with self._sem:
+            await self._throttle()
+            try:
+                data = await fetch_task(task_id, account)
+                if data['task_status'] in ('succeed', 'failed'):
+                    # Applied like a callback: the thumbnail is extracted in
+                    # the background, so a bad video file cannot hold the row.
+                    await kling_callbacks.apply(task_id, data)
+                    self._next_check.pop(task_id, None)
+                    self._failures.pop(task_id, None)
+                    return
+                self._failures.pop(task_id, None)
+            except Exception as exc:
+                print(f"Kling status check for {task_id} failed:", exc)
+                self._failures[task_id] = self._failures.get(task_id, 0) + 1
+            self._reschedule(task_id, age)
+
+    def stats(self) -> Dict[str, int]:
+        return {"tracked": len(self._next_check), "backing_off": len(self._failures)}
+
+poller = KlingPoller()
@@ -0,0 +1,95 @@
+import tempfile
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, IO, Optional, Tuple
+import httpx
+from app.core.constants import UPLOAD_CHUNK_BYTES, UPLOAD_SPILL_TO_DISK, UPLOAD_SPOOL_MEMORY_BYTES
+from app.core.executor import run_blocking
+from app.core.http import media_pool, shopify_pool
+from app.core.metrics import stage
+
+# Pipes a video from its source URL into a Shopify staged upload target in
+# fixed-size chunks, so memory per upload stays constant regardless of video
+# size. The source body is only spooled (memory first, then disk) when its
+# size is unknown up front or UPLOAD_SPILL_TO_DISK is set.
+
+@dataclass
+class SourceVideo:
+    size: int
+    chunks: AsyncIterator[bytes]
+
+async def _iter_file(f: IO[bytes]) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await run_blocking(f.read, UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            return
+        yield chunk
+
+@asynccontextmanager
+async def open_source(url: str) -> AsyncIterator[SourceVideo]:
+    async with media_pool.stream("GET", url) as resp:
+        resp.raise_for_status()
+        length = resp.headers.get("Content-Length")
+        encoded = resp.headers.get("Content-Encoding", "identity") != "identity"
+        if length is not None and not encoded and not UPLOAD_SPILL_TO_DISK:
+            yield SourceVideo(size=int(length), chunks=resp.aiter_raw(UPLOAD_CHUNK_BYTES))
+            return
+
+        with tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MEMORY_BYTES) as spool:
+            size = 0
+            async for chunk in resp.aiter_bytes(UPLOAD_CHUNK_BYTES):
+                await run_blocking(spool.write, chunk)
+                size += len(chunk)
+            spool.seek(0)
+            yield SourceVideo(size=size, chunks=_iter_file(spool))
+
+async def probe_size(url: str) -> Optional[int]:
+    # Size of the source from a HEAD request, or None when the server does not
+    # say (the caller then has to open the source to learn it).
+    try:
+        resp = await media_pool.request("HEAD", url)
+    except httpx.HTTPError:
+        return None
+    length = resp.headers.get("Content-Length")
+    if resp.status_code != 200 or resp.headers.get("Content-Encoding", "identity") != "identity" or not (length or "").isdigit():
+        return None
+    return int(length)
+
+def _quote(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', "%22").replace("\r", " ").replace("\n", " ")
+
+def multipart_body(fields: Dict[str, str], filename: str, mime: str, source: SourceVideo) -> Tuple[Dict[str, str], AsyncIterator[bytes]]:
+    # Builds the multipart/form-data request by hand so the file part can be
+    # streamed while still sending an exact Content-Length (staged targets
+    # reject chunked transfer encoding).
+    boundary = uuid.uuid4().hex
+    preamble = b"".join(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{_quote(name)}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in fields.items()
+    ) + (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{_quote(filename)}"\r\n'
+        f'Content-Type: {mime}\r\n\r\n'
+    ).encode()
+    epilogue = f"\r\n--{boundary}--\r\n".encode()
+
+    async def body() -> AsyncIterator[bytes]:
+        yield preamble
+        sent = 0
+        async for chunk in source.chunks:
+            sent += len(chunk)
+            yield chunk
+        if sent != source.size:
+            raise httpx.StreamError(f"Source ended after {sent} of {source.size} bytes")
+        yield epilogue
+
+    headers = {
+        "Content-Type": f"multipart/form-data; boundary={boundary}",
+        "Content-Length": str(len(preamble) + source.size + len(epilogue)),
+    }
+    return headers, body()
+
+async def relay_to_staged_target(upload_url: str, fields: Dict[str, str], filename: str, mime: str, source: SourceVideo) -> httpx.Response:
+    headers, body = multipart_body(fields, filename, mime, source)
+    with stage("staged_upload"):
+        return await shopify_pool.request("POST", upload_url, headers=headers, content=body)
@@ -0,0 +1,137 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+from fastapi import Request, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.core.constants import RESPONSE_CACHE_TTL_S, RESPONSE_CACHE_MAX_ENTRIES
+from app.core.metrics import registry
+from app.db.models.credits import Credits, CreditLedger
+from app.db.models.video import Video
+
+# Serialized JSON responses keyed by (kind, shop, params), each tagged with the
+# shop's version for that kind at the time it was built. A commit that
+# touched a shop's videos or credits bumps the version, which drops the stale
+# entries; an entry built from a read that raced such a commit is never
+# stored. Every response carries an ETag so clients can revalidate with
+# If-None-Match and get a bodyless 304.
+#
+# Versions live in this process only, fed by the commits of its own sessions.
+# With several workers, a write on one of them leaves the others serving
+# their entry until RESPONSE_CACHE_TTL_S runs out; with the TTL at 0 nothing
+# is stored and every read goes to the DB (ETags and 304s still work).
+
+VIDEOS = "videos"
+CREDITS = "credits"
+
+Key = Tuple[str, str, Hashable]
+
+response_cache_requests = registry.counter("response_cache_requests_total", "Cached dashboard reads, by kind and result (hit, miss, not_modified).")
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+    headers: Dict[str, str]
+    version: int
+    stored_at: float
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    tags = {t.strip().removeprefix("W/") for t in header.split(",")}
+    return "*" in tags or etag in tags
+
+class ResponseCache:
+    def __init__(self, ttl_s: float = RESPONSE_CACHE_TTL_S, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Key, CachedResponse]" = OrderedDict()
+        self._versions: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()  # commits are reported from executor threads
+        self.invalidations = 0
+
+    def version(self, kind: str, shop: str) -> int:
+        with self._lock:
+            return self._versions.get((kind, shop), 0)
+
+    def get(self, key: Key) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.version != self._versions.get(key[:2], 0) or time.monotonic() - entry.stored_at > self.ttl_s:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Key, version: int, body: bytes, headers: Dict[str, str]) -> CachedResponse:
+        entry = CachedResponse(body, etag_for(body), headers, version, time.monotonic())
+        with self._lock:
+            if version == self._versions.get(key[:2], 0):
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, kind: str, shop: str):
+        # Entries of older versions are dropped lazily by get() or LRU eviction.
+        with self._lock:
+            self._versions[(kind, shop)] = self._versions.get((kind, shop), 0) + 1
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "shops": len({k[1] for k in self._entries}), "invalidations": self.invalidations}
+
+    async def serve(self, request: Request, kind: str, shop: str, params: Hashable,
+                    build: Callable[[], Awaitable[Tuple[bytes, Dict[str, str]]]]) -> Response:
+        key = (kind, shop, params)
+        entry = self.get(key)
+        if entry is None:
+            response_cache_requests.inc(kind=kind, result="miss")
+            version = self.version(kind, shop)
+            body, headers = await build()
+            if self.ttl_s > 0:
+                entry = self.put(key, version, body, headers)
+            else:
+                entry = CachedResponse(body, etag_for(body), headers, version, time.monotonic())
+        else:
+            response_cache_requests.inc(kind=kind, result="hit")
+
+        headers = {**entry.headers, "ETag": entry.etag, "Cache-Control": "private, no-cache"}
+        # 304 only for safe methods; POST /credits still benefits from the cache.
+        if request.method in ("GET", "HEAD") and _etag_matches(request.headers.get("if-none-match"), entry.etag):
+            response_cache_requests.inc(kind=kind, result="not_modified")
+            return Response(status_code=304, headers=headers)
+        return Response(entry.body, media_type="application/json", headers=headers)
+
+response_cache = ResponseCache()
+
+@event.listens_for(Session, "before_flush")
+def _collect_changes(session: Session, flush_context, instances):
+    changed: Set[Tuple[str, str]] = session.info.setdefault("changed_shops", set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Video) and obj.shop:
+            changed.add((VIDEOS, obj.shop))
+        elif isinstance(obj, (Credits, CreditLedger)) and obj.shop_name:
+            # Balance changes are Core UPDATEs the ORM does not track, but
+            # each one writes a ledger row.
+            changed.add((CREDITS, obj.shop_name))
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changes(session: Session):
+    for kind, shop in session.info.pop("changed_shops", ()):
+        response_cache.invalidate(kind, shop)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session: Session):
+    session.info.pop("changed_shops", None)
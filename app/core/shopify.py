@@ -0,0 +1,135 @@
+import asyncio
+import random
+import re
+import time
+from typing import Any, Dict, Optional
+from fastapi import HTTPException
+from app.core.constants import (
+    SHOPIFY_BUDGET_MAX_POINTS, SHOPIFY_BUDGET_RESTORE_RATE, SHOPIFY_QUERY_COST_ESTIMATE,
+    SHOPIFY_THROTTLE_RETRIES, SHOPIFY_THROTTLE_BACKOFF_S, SHOPIFY_ADMIN_URL,
+)
+from app.core.http import shopify_pool
+from app.core.metrics import registry, stage
+
+class FileProcessingFailed(HTTPException):
+    # Shopify gave up on the file itself; retrying has to start from a new staged upload.
+    pass
+
+def graphql_url(shop: str, version: str = "2024-07") -> str:
+    return f"{SHOPIFY_ADMIN_URL.format(shop=shop)}/admin/api/{version}/graphql.json"
+
+class ShopBudget:
+    # Local mirror of Shopify's per-shop leaky bucket. Every call takes its
+    # expected cost out of the bucket before it is sent and waits (in FIFO
+    # order, via the lock) until enough points have leaked back in. The
+    # throttleStatus returned with each response resyncs the mirror.
+    def __init__(self):
+        self.maximum = SHOPIFY_BUDGET_MAX_POINTS
+        self.restore_rate = SHOPIFY_BUDGET_RESTORE_RATE
+        self.available = self.maximum
+        self.updated_at = time.monotonic()
+        self.costs: Dict[str, float] = {}
+        self.lock = asyncio.Lock()
+        self.calls = 0
+        self.throttled = 0
+        self.wait_s = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.maximum, self.available + (now - self.updated_at) * self.restore_rate)
+        self.updated_at = now
+
+    def estimate(self, query: str) -> float:
+        return min(self.costs.get(query, SHOPIFY_QUERY_COST_ESTIMATE), self.maximum)
+
+    def refill_delay(self, cost: float) -> float:
+        self._refill()
+        return max(0.0, (cost - self.available) / self.restore_rate)
+
+    async def acquire(self, cost: float):
+        async with self.lock:
+            delay = self.refill_delay(cost)
+            if delay:
+                self.wait_s += delay
+                await asyncio.sleep(delay)
+                self._refill()
+            self.available -= cost
+            self.calls += 1
+
+    def observe(self, query: str, cost: Optional[Dict[str, Any]]):
+        if not cost:
+            return
+        if cost.get("requestedQueryCost") is not None:
+            self.costs[query] = float(cost["requestedQueryCost"])
+        status = cost.get("throttleStatus") or {}
+        if status.get("currentlyAvailable") is not None:
+            self.maximum = float(status.get("maximumAvailable") or self.maximum)
+            self.restore_rate = float(status.get("restoreRate") or self.restore_rate)
+            self.available = float(status["currentlyAvailable"])
+            self.updated_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        self._refill()
+        return {
+            "available": round(self.available, 1),
+            "maximum": self.maximum,
+            "restore_rate": self.restore_rate,
+            "calls": self.calls,
+            "throttled": self.throttled,
+            "wait_s": round(self.wait_s, 3),
+        }
+
+_budgets: Dict[str, ShopBudget] = {}
+_OPERATION_RE = re.compile(r"\b(?:query|mutation)\s+(\w+)")
+
+shopify_throttled_total = registry.counter("shopify_throttled_total", "Shopify GraphQL calls answered with THROTTLED or HTTP 429.")
+
+def shopify_budgets() -> Dict[str, Dict[str, Any]]:
+    return {shop: budget.stats() for shop, budget in _budgets.items()}
+
+def _is_throttled(data: Dict[str, Any]) -> bool:
+    return any((e.get("extensions") or {}).get("code") == "THROTTLED" for e in data.get("errors") or [])
+
+async def gql(GQL_URL: str, HEADERS: Any, query: str, variables: Dict[str, Any]):
+    shop = GQL_URL.split("/admin/api/", 1)[0].split("://", 1)[-1]
+    budget = _budgets.setdefault(shop, ShopBudget())
+
+    match = _OPERATION_RE.search(query)
+    operation = match.group(1) if match else "graphql"
+
+    for attempt in range(SHOPIFY_THROTTLE_RETRIES + 1):
+        cost = budget.estimate(query)
+        with stage("shopify_budget_wait"):
+            await budget.acquire(cost)
+        with stage(f"shopify_{operation}"):
+            r = await shopify_pool.request("POST", GQL_URL, headers=HEADERS, json={"query": query, "variables": variables})
+        req_id = r.headers.get("X-Request-Id")
+
+        throttled = r.status_code == 429
+        data: Dict[str, Any] = {}
+        if not throttled:
+            if r.status_code >= 400:
+                raise HTTPException(r.status_code, f"Shopify HTTP error: {r.text} (X-Request-Id: {req_id})")
+            data = r.json()
+            budget.observe(query, (data.get("extensions") or {}).get("cost"))
+            throttled = _is_throttled(data)
+
+        if not throttled:
+            if "errors" in data:
+                raise HTTPException(502, {"message": "Shopify GraphQL error", "errors": data["errors"], "x_request_id": req_id})
+            return {"data": data["data"], "x_request_id": req_id}
+
+        budget.throttled += 1
+        shopify_throttled_total.inc(operation=operation)
+        if attempt == SHOPIFY_THROTTLE_RETRIES:
+            break
+        # Wait until the bucket can cover the call again, plus jittered
+        # exponential backoff so throttled callers do not retry in lockstep.
+        retry_after = r.headers.get("Retry-After")
+        delay = float(retry_after) if retry_after and retry_after.replace(".", "", 1).isdigit() else budget.refill_delay(cost)
+        delay += random.uniform(0, SHOPIFY_THROTTLE_BACKOFF_S * 2 ** attempt)
+        print(f"Shopify throttled {shop} (X-Request-Id: {req_id}), retrying in {delay:.1f}s")
+        budget.wait_s += delay
+        await asyncio.sleep(delay)
+
+    raise HTTPException(429, f"Shopify API budget exhausted for {shop} (X-Request-Id: {req_id})")
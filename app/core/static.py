@@ -0,0 +1,231 @@
+import asyncio
+import os
+import time
+import uuid
+from typing import Dict, List, Optional, Set, Tuple
+import cv2
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse
+from starlette.types import Scope
+from app.core.constants import (
+    STATIC_IMMUTABLE_MAX_AGE_S, STATIC_DEFAULT_MAX_AGE_S, STATIC_VARIANT_FORMATS, STATIC_VARIANT_QUALITY, STATIC_VARIANT_PENDING_MAX_AGE_S,
+    STATIC_ACCEL_REDIRECT_PREFIX, STATIC_DIR, IMAGE_STORE_GC_INTERVAL_S, IMAGE_STORE_GRACE_S,
+)
+from app.core.executor import run_blocking
+from app.core.image_store import ImageStore
+from app.core.metrics import registry
+from app.core.thumbnail_store import ThumbnailStore
+
+_MEDIA_TYPES = {"avif": "image/avif", "webp": "image/webp"}
+_SOURCE_EXTS = (".png", ".jpg")
+
+static_variant_responses = registry.counter("static_variant_responses_total", "Static files served as a negotiated variant, by format.")
+
+def _encode_params(fmt: str, lossless: bool) -> List[int]:
+    # PNG sources are product images Kling renders from, so their variants
+    # stay pixel-identical; JPEG thumbnails are lossy already.
+    if fmt == "webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, 101 if lossless else STATIC_VARIANT_QUALITY]
+    return [cv2.IMWRITE_AVIF_QUALITY, 100 if lossless else STATIC_VARIANT_QUALITY]
+
+def _accepts(accept: Optional[str], media_type: str) -> bool:
+    # Only an explicit listing counts; "*/*" or "image/*" clients keep the original.
+    for part in (accept or "").split(","):
+        fields = [f.strip() for f in part.split(";")]
+        if fields[0].lower() != media_type:
+            continue
+        return not any(f.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000") for f in fields[1:])
+    return False
+
+class MediaVariants:
+    # Re-encodings of files in the content-addressed stores, kept under
+    # static/variants/<subdir>/<name>.<fmt>. They are built in the background
+    # the first time a client asks for one, so that request still gets the
+    # original, with a short cache lifetime so the client comes back for the
+    # variant. A variant that would not be smaller is never used.
+    subdir = "variants"
+
+    def __init__(self, root: str, formats: str = STATIC_VARIANT_FORMATS):
+        self.static_root = root
+        self.root = os.path.join(root, self.subdir)
+        self.formats = [f.strip() for f in formats.split(",") if f.strip() in _MEDIA_TYPES]
+        self._building: Set[str] = set()
+        self._useless: Set[str] = set()  # variant paths that came out larger than the source
+        self._unsupported: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._gc_task: Optional[asyncio.Task] = None
+
+    def path(self, rel: str, fmt: str) -> str:
+        return os.path.join(self.root, f"{os.path.splitext(rel)[0]}.{fmt}")
+
+    def pick(self, full_path: str, rel: str, accept: Optional[str]) -> Tuple[Optional[Tuple[str, str, os.stat_result]], bool]:
+        # Returns ((format, path, stat) of a ready variant the client accepts,
+        # or None; whether a build for an accepted format is still pending),
+        # scheduling builds for accepted formats that are missing.
+        pending = False
+        for fmt in self.formats:
+            if fmt in self._unsupported or not _accepts(accept, _MEDIA_TYPES[fmt]):
+                continue
+            path = self.path(rel, fmt)
+            if path in self._useless:
+                continue
+            try:
+                return (fmt, path, os.stat(path)), False
+            except FileNotFoundError:
+                self._schedule(full_path, path, fmt)
+                pending = pending or path in self._building
+        return None, pending
+
+    def _schedule(self, source: str, path: str, fmt: str):
+        if path in self._building:
+            return
+        self._building.add(path)
+        task = asyncio.get_running_loop().create_task(self._build(source, path, fmt))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _build(self, source: str, path: str, fmt: str):
+        try:
+            written = await run_blocking(self.encode, source, path, fmt)
+            if not written:
+                self._useless.add(path)
+        except cv2.error as exc:
+            print(f"{fmt} encoding is not available:", exc)
+            self._unsupported.add(fmt)
+        except Exception as exc:
+            print(f"Building {path} failed:", exc)
+        finally:
+            self._building.discard(path)
+
+    def encode(self, source: str, path: str, fmt: str) -> bool:
+        img = cv2.imread(source, cv2.IMREAD_UNCHANGED)
+        if img is None:
+            raise ValueError(f"Cannot decode {source}")
+        ok, buf = cv2.imencode(f".{fmt}", img, _encode_params(fmt, source.endswith(".png")))
+        if not ok:
+            raise cv2.error(f"{fmt} encoder returned no data")
+        if len(buf) >= os.path.getsize(source):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(buf.tobytes())
+        os.replace(temp_path, path)
+        return True
+
+    def gc(self) -> int:
+        # Variants follow their source: once the store evicted it, they go too.
+        removed = 0
+        stale_tmp = time.time() - IMAGE_STORE_GRACE_S
+        for dirpath, _, names in os.walk(self.root):
+            rel_dir = os.path.relpath(dirpath, self.root)
+            for name in names:
+                path = os.path.join(dirpath, name)
+                if name.endswith(".tmp"):
+                    orphan = os.path.getmtime(path) < stale_tmp  # interrupted encode
+                else:
+                    base = os.path.join(self.static_root, rel_dir, name.split(".", 1)[0])
+                    orphan = not any(os.path.exists(base + ext) for ext in _SOURCE_EXTS)
+                if orphan:
+                    try:
+                        os.remove(path)
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+        return removed
+
+    def start(self):
+        if self._gc_task is None and self.formats:
+            self._gc_task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        tasks = set(self._tasks)
+        if self._gc_task is not None:
+            tasks.add(self._gc_task)
+            self._gc_task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(IMAGE_STORE_GC_INTERVAL_S)
+            try:
+                removed = await run_blocking(self.gc)
+                if removed:
+                    print(f"Media variant GC removed {removed} files")
+            except Exception as exc:
+                print("Media variant GC failed:", exc)
+
+    def stats(self) -> Dict[str, int]:
+        return {"building": len(self._building), "not_smaller": len(self._useless)}
+
+class MediaStaticFiles(StaticFiles):
+    # Files in the content-addressed stores never change under the same name,
+    # so they get a strong ETag derived from the name and a year-long immutable
+    # cache lifetime. Everything else keeps Starlette's mtime/size ETag.
+    # FileResponse answers Range requests; If-Range is checked against the
+    # ETag set here. Stored images may be sent as a smaller AVIF/WebP variant
+    # when the client lists it in Accept (with Vary: Accept). With
+    # STATIC_ACCEL_REDIRECT_PREFIX set, nginx sends the bytes (sendfile) and
+    # this only decides headers and 304s.
+    content_addressed_dirs = (ImageStore.subdir, ThumbnailStore.subdir, MediaVariants.subdir)
+
+    def __init__(self, *args, variants: Optional[MediaVariants] = None, accel_redirect_prefix: str = STATIC_ACCEL_REDIRECT_PREFIX, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.variants = variants
+        self.accel_redirect_prefix = accel_redirect_prefix
+
+    def relative(self, full_path: str) -> str:
+        return os.path.relpath(full_path, str(self.directory))
+
+    def is_content_addressed(self, full_path: str) -> bool:
+        return self.relative(full_path).split(os.sep, 1)[0] in self.content_addressed_dirs
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        rel = self.relative(full_path)
+        content_addressed = self.is_content_addressed(full_path)
+        negotiable = (
+            self.variants is not None and self.variants.formats and content_addressed
+            and rel.split(os.sep, 1)[0] != MediaVariants.subdir and rel.endswith(_SOURCE_EXTS)
+        )
+
+        media_type = None
+        name = os.path.splitext(os.path.basename(full_path))[0]
+        etag = f'"{name}"'
+        pending = False
+        if negotiable:
+            variant, pending = self.variants.pick(full_path, rel, request_headers.get("accept"))
+            if variant is not None:
+                fmt, full_path, stat_result = variant
+                media_type = _MEDIA_TYPES[fmt]
+                etag = f'"{name}.{fmt}"'
+                rel = self.relative(full_path)
+                static_variant_responses.inc(format=fmt)
+
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, media_type=media_type)
+        if content_addressed:
+            response.headers["etag"] = etag
+            if pending:
+                # A cache that kept this for a year would never see the variant.
+                response.headers["cache-control"] = f"public, max-age={STATIC_VARIANT_PENDING_MAX_AGE_S}"
+            else:
+                response.headers["cache-control"] = f"public, max-age={STATIC_IMMUTABLE_MAX_AGE_S}, immutable"
+        else:
+            response.headers["cache-control"] = f"public, max-age={STATIC_DEFAULT_MAX_AGE_S}"
+        response.headers["accept-ranges"] = "bytes"
+        if negotiable:
+            response.headers["vary"] = "Accept"
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        if self.accel_redirect_prefix:
+            headers = {k: v for k, v in response.headers.items() if k != "content-length"}
+            headers["x-accel-redirect"] = self.accel_redirect_prefix.rstrip("/") + "/" + rel.replace(os.sep, "/")
+            return Response(status_code=status_code, headers=headers)
+        return response
+
+media_variants = MediaVariants(STATIC_DIR)
@@ -0,0 +1,89 @@
+import asyncio
+from typing import Dict, Optional
+import stripe
+from app.core.constants import STRIPE_EVENT_POLL_S, STRIPE_EVENT_BATCH_SIZE
+from app.core.executor import run_blocking, run_db
+from app.core.metrics import stage
+from app.crud.stripe_events import claim_due_events, complete_checkout_event, fail_event, record_event
+from app.db.models.stripe_event import StripeEvent
+from app.db.session import SessionLocal
+
+# POST /stripe-hook only verifies the signature, records the event id and
+# answers 200; credits are granted here. The stripe_events primary key makes
+# Stripe's redeliveries no-ops, and an event is marked done in the same
+# transaction that grants its credits, so a grant is applied exactly once
+# even across crashes and several app processes.
+
+def _with_session(fn, *args):
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+class StripeEventProcessor:
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self.processed = 0
+        self.failed = 0
+        self.duplicates = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def record(self, event_id: str, type_: str, shop: Optional[str], session_id: Optional[str]) -> bool:
+        # Returns False for an event id seen before.
+        created = await run_db(_with_session, record_event, event_id, type_, shop, session_id)
+        if created:
+            self._wake.set()
+        else:
+            self.duplicates += 1
+        return created
+
+    async def _run(self):
+        while True:
+            try:
+                while await self.drain():
+                    pass
+            except Exception as exc:
+                print("Stripe event processing failed:", exc)
+            try:
+                await asyncio.wait_for(self._wake.wait(), STRIPE_EVENT_POLL_S)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def drain(self) -> int:
+        events = await run_db(_with_session, claim_due_events, STRIPE_EVENT_BATCH_SIZE)
+        await asyncio.gather(*(self._process(event) for event in events))
+        return len(events)
+
+    async def _process(self, event: StripeEvent):
+        try:
+            with stage("stripe_event", type=event.type):
+                line_items = await run_blocking(stripe.checkout.Session.list_line_items, event.session_id, limit=100)
+                item = line_items["data"][0]
+                price_id, product_id, quantity, amount = item["price"]["id"], item["price"]["product"], item["quantity"], item["price"]["unit_amount"]
+                print("line_items:", event.shop_name, price_id, product_id, quantity, amount)
+                await run_db(_with_session, complete_checkout_event, event, product_id, quantity, amount)
+            self.processed += 1
+        except Exception as exc:
+            print(f"Stripe event {event.id} failed (attempt {event.attempts}):", exc)
+            self.failed += 1
+            await run_db(_with_session, fail_event, event, str(exc))
+
+    def stats(self) -> Dict[str, int]:
+        return {"processed": self.processed, "failed": self.failed, "duplicates": self.duplicates}
+
+stripe_event_processor = StripeEventProcessor()
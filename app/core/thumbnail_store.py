@@ -0,0 +1,171 @@
+import asyncio
+import base64
+import hashlib
+import os
+import re
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+import cv2
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.core.constants import (
+    PUBLIC_BASE_URL, STATIC_DIR, THUMBNAIL_SMALL_WIDTH, THUMBNAIL_LARGE_WIDTH, THUMBNAIL_QUALITY,
+    IMAGE_STORE_GRACE_S, IMAGE_STORE_GC_INTERVAL_S,
+)
+from app.core.executor import run_blocking, run_db
+from app.core.metrics import stage
+from app.core.thumbnails import encode_jpeg, extract_first_frame
+from app.crud.job_locks import try_lock, unlock
+from app.db.models.video import Video
+from app.db.session import SessionLocal
+
+THUMBNAIL_SIZES: Dict[str, int] = {
+    "sm": THUMBNAIL_SMALL_WIDTH,  # video lists
+    "lg": THUMBNAIL_LARGE_WIDTH,  # detail views
+}
+
+_KEY_RE = re.compile(r"^[0-9a-f]{64}$")
+_MIGRATION_LOCK = "thumbnail_inline_migration"
+_MIGRATION_LOCK_STALE_S = 600  # refreshed after every batch
+
+def is_thumbnail_key(value: Optional[str]) -> bool:
+    return bool(value) and bool(_KEY_RE.match(value))
+
+class ThumbnailStore:
+    # JPEG thumbnails written once per video under static/thumbs/<key>-<size>.jpg,
+    # where <key> is the hash of the frame they were rendered from.
+    # Video.thumbnail holds the key; the API turns it into one URL per size.
+    subdir = "thumbs"
+
+    def __init__(self, root: str):
+        self.root = os.path.join(root, self.subdir)
+        self._task: Optional[asyncio.Task] = None
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key: str, size: str) -> str:
+        return os.path.join(self.root, f"{key}-{size}.jpg")
+
+    def url(self, key: str, size: str) -> str:
+        return f"{PUBLIC_BASE_URL}/static/{self.subdir}/{key}-{size}.jpg"
+
+    def save_frame(self, frame: np.ndarray) -> str:
+        key = hashlib.sha256(np.ascontiguousarray(frame).tobytes()).hexdigest()
+        for size, width in THUMBNAIL_SIZES.items():
+            path = self.path(key, size)
+            try:
+                # Reused files get a fresh mtime so the GC grace period
+                # covers the row that is about to reference them.
+                os.utime(path)
+                continue
+            except FileNotFoundError:
+                pass
+            temp_path = os.path.join(self.root, f".{key}-{size}.{uuid.uuid4().hex}.tmp")
+            with open(temp_path, "wb") as f:
+                f.write(encode_jpeg(frame, width, THUMBNAIL_QUALITY))
+            os.replace(temp_path, path)
+        return key
+
+    async def store_from_video(self, video_url: str) -> str:
+        with stage("thumbnail_extract"):
+            frame = await extract_first_frame(video_url)
+            return await run_blocking(self.save_frame, frame)
+
+    def store_from_base64(self, data: str) -> str:
+        frame = cv2.imdecode(np.frombuffer(base64.b64decode(data), dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError("Failed to decode inline thumbnail")
+        return self.save_frame(frame)
+
+    def migrate_inline(self, db: Session, holder: str) -> int:
+        # One-off move of legacy base64 thumbnails out of the videos table.
+        # Every worker calls this at startup; the lock row leaves the work to
+        # one of them, the others serve the inline thumbnails meanwhile.
+        if not try_lock(db, _MIGRATION_LOCK, holder, _MIGRATION_LOCK_STALE_S):
+            return 0
+        try:
+            return self._migrate_batches(db, holder)
+        finally:
+            db.rollback()
+            unlock(db, _MIGRATION_LOCK, holder)
+
+    def _migrate_batches(self, db: Session, holder: str) -> int:
+        migrated = 0
+        while True:
+            rows = db.query(Video).filter(func.length(Video.thumbnail) > 64).limit(100).all()
+            if not rows:
+                return migrated
+            for video in rows:
+                try:
+                    video.thumbnail = self.store_from_base64(video.thumbnail)
+                except Exception as exc:
+                    print(f"Could not migrate thumbnail of video {video.id}:", exc)
+                    video.thumbnail = None
+                migrated += 1
+            db.commit()
+            if not try_lock(db, _MIGRATION_LOCK, holder, _MIGRATION_LOCK_STALE_S):
+                print("Thumbnail migration lock was taken over, stopping")
+                return migrated
+
+    def migrate_inline_once(self) -> int:
+        db = SessionLocal()
+        try:
+            return self.migrate_inline(db, uuid.uuid4().hex)
+        finally:
+            db.close()
+
+    def gc(self, db: Session) -> int:
+        referenced = {key for (key,) in db.query(Video.thumbnail).filter(Video.thumbnail.is_not(None)) if is_thumbnail_key(key)}
+        now = time.time()
+        removed = 0
+        for entry in os.scandir(self.root):
+            if not entry.is_file() or now - entry.stat().st_mtime < IMAGE_STORE_GRACE_S:
+                continue
+            if entry.name.startswith(".") or entry.name.split("-", 1)[0] not in referenced:
+                try:
+                    if now - os.stat(entry.path).st_mtime < IMAGE_STORE_GRACE_S:
+                        continue  # reused by save_frame since the scan
+                    os.remove(entry.path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def _gc_once(self) -> int:
+        db = SessionLocal()
+        try:
+            return self.gc(db)
+        finally:
+            db.close()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                removed = await run_db(self._gc_once)
+                if removed:
+                    print(f"Thumbnail store GC removed {removed} files")
+            except Exception as exc:
+                print("Thumbnail store GC failed:", exc)
+            await asyncio.sleep(IMAGE_STORE_GC_INTERVAL_S)
+
+thumbnail_store = ThumbnailStore(STATIC_DIR)
+
+def thumbnail_urls(value: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    # (list-size URL, detail-size URL) for a stored Video.thumbnail value.
+    if not is_thumbnail_key(value):
+        return value or None, None
+    return thumbnail_store.url(value, "sm"), thumbnail_store.url(value, "lg")
@@ -0,0 +1,144 @@
+import os
+import struct
+import tempfile
+from typing import List, Optional, Tuple
+import cv2
+import numpy as np
+from app.core.constants import THUMBNAIL_LARGE_WIDTH, THUMBNAIL_QUALITY, THUMBNAIL_PROBE_BYTES, THUMBNAIL_MDAT_PREFIX_BYTES
+from app.core.executor import run_blocking
+from app.core.http import media_pool
+
+# The first frame of an MP4 only needs the `moov` box (sample tables) and the
+# first few samples at the start of `mdat`. Those are fetched with HTTP Range
+# requests and written at their original offsets into a sparse temp file, so
+# the decoder sees a file with the right layout while we only download a small
+# fraction of it. Anything unexpected falls back to a full streamed download.
+
+MAX_TOP_LEVEL_BOXES = 64
+
+class RangeNotSupported(Exception):
+    pass
+
+Segment = Tuple[int, bytes]
+
+async def _fetch_range(url: str, start: int, end: int) -> Tuple[bytes, int]:
+    async with media_pool.stream("GET", url, headers={"Range": f"bytes={start}-{end}"}) as resp:
+        if resp.status_code != 206:
+            resp.raise_for_status()
+            raise RangeNotSupported(f"Range request answered with {resp.status_code}")
+        content_range = resp.headers.get("Content-Range", "")
+        total = content_range.rsplit("/", 1)[-1]
+        if not total.isdigit():
+            raise RangeNotSupported(f"Unusable Content-Range: {content_range!r}")
+        return await resp.aread(), int(total)
+
+async def _box_header(url: str, head: bytes, offset: int) -> Tuple[str, int]:
+    # Returns (box_type, box_size) for the top-level box starting at `offset`.
+    if offset + 16 <= len(head):
+        raw = head[offset:offset + 16]
+    else:
+        raw, _ = await _fetch_range(url, offset, offset + 15)
+    if len(raw) < 8:
+        raise ValueError("Truncated MP4 box header")
+    size, box_type = struct.unpack(">I4s", raw[:8])
+    if size == 1:
+        size = struct.unpack(">Q", raw[8:16])[0]
+    return box_type.decode("latin-1"), size
+
+async def _fetch_first_frame_segments(url: str) -> Tuple[List[Segment], int]:
+    head, total = await _fetch_range(url, 0, THUMBNAIL_PROBE_BYTES - 1)
+    segments: List[Segment] = [(0, head)]
+
+    boxes = {}
+    offset = 0
+    for _ in range(MAX_TOP_LEVEL_BOXES):
+        if offset >= total:
+            break
+        box_type, size = await _box_header(url, head, offset)
+        if size == 0:
+            size = total - offset
+        if size < 8:
+            raise ValueError(f"Invalid MP4 box size {size} at {offset}")
+        boxes.setdefault(box_type, (offset, size))
+        offset += size
+
+    if "moov" not in boxes or "mdat" not in boxes or "moof" in boxes:
+        raise ValueError(f"Unsupported MP4 layout: {sorted(boxes)}")
+
+    moov_offset, moov_size = boxes["moov"]
+    if moov_offset + moov_size > len(head):
+        moov, _ = await _fetch_range(url, moov_offset, moov_offset + moov_size - 1)
+        segments.append((moov_offset, moov))
+
+    mdat_offset, mdat_size = boxes["mdat"]
+    prefix_end = min(mdat_offset + mdat_size, mdat_offset + THUMBNAIL_MDAT_PREFIX_BYTES) - 1
+    if prefix_end >= len(head):
+        start = max(mdat_offset, len(head))
+        mdat, _ = await _fetch_range(url, start, prefix_end)
+        segments.append((start, mdat))
+
+    return segments, total
+
+async def _download_full(url: str, path: str):
+    async with media_pool.stream("GET", url) as resp:
+        if resp.status_code != 200:
+            raise Exception(f"Failed to download video: {resp.status_code}")
+        with open(path, "wb") as f:
+            async for chunk in resp.aiter_bytes(chunk_size=64 * 1024):
+                f.write(chunk)
+
+def _write_sparse(path: str, segments: List[Segment], total: int):
+    with open(path, "r+b") as f:
+        f.truncate(total)
+        for offset, data in segments:
+            f.seek(offset)
+            f.write(data)
+
+def _first_frame(path: str) -> np.ndarray:
+    cap = cv2.VideoCapture(path)
+    try:
+        success, frame = cap.read()
+    finally:
+        cap.release()
+    if not success:
+        raise ValueError("Failed to read frame from video")
+    return frame
+
+def _sparse_first_frame(path: str, segments: List[Segment], total: int) -> np.ndarray:
+    _write_sparse(path, segments, total)
+    return _first_frame(path)
+
+def encode_jpeg(frame: np.ndarray, width: int = THUMBNAIL_LARGE_WIDTH, quality: int = THUMBNAIL_QUALITY) -> bytes:
+    h, w = frame.shape[:2]
+    if width and w > width:
+        frame = cv2.resize(frame, (width, max(1, int(h * width / w))), interpolation=cv2.INTER_AREA)
+
+    success, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not success:
+        raise ValueError("Failed to encode frame to JPEG")
+    return buffer.tobytes()
+
+async def extract_first_frame(url: str) -> np.ndarray:
+    fd, path = tempfile.mkstemp(suffix=".mp4")
+    os.close(fd)
+    try:
+        try:
+            segments, total = await _fetch_first_frame_segments(url)
+            return await run_blocking(_sparse_first_frame, path, segments, total)
+        except (RangeNotSupported, ValueError, struct.error) as exc:
+            print(f"Partial thumbnail fetch for {url} failed, downloading full video:", exc)
+        await _download_full(url, path)
+        return await run_blocking(_first_frame, path)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+async def extract_thumbnail(url: str, width: Optional[int] = None, quality: Optional[int] = None) -> bytes:
+    frame = await extract_first_frame(url)
+    return await run_blocking(
+        encode_jpeg, frame,
+        THUMBNAIL_LARGE_WIDTH if width is None else width,
+        THUMBNAIL_QUALITY if quality is None else quality,
+    )
@@ -0,0 +1,394 @@
+import asyncio
+import mimetypes
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+from fastapi import HTTPException
+from app.core.constants import (
+    STAGED_UPLOADS_CREATE, FILE_CREATE, FILE_UPDATE_ADD_PRODUCT, UPLOAD_WORKERS,
+    UPLOAD_BATCH_SIZE, UPLOAD_RELAY_CONCURRENCY, UPLOAD_HEARTBEAT_S, UPLOAD_STALE_S,
+)
+from app.core.executor import run_db
+from app.core.file_status import file_status_poller
+from app.core.metrics import stage
+from app.core.relay import open_source, probe_size, relay_to_staged_target
+from app.core.shopify import FileProcessingFailed, gql, graphql_url
+from app.crud.video import fail_stale_uploads, touch_uploads
+from app.db.models.video import Video
+from app.db.session import SessionLocal
+
+# Uploads to Shopify run as background jobs (one per video, job id = video id).
+# Each step records a checkpoint on the Video row, so a retried job resumes
+# where the last attempt stopped instead of re-sending the video:
+#   queued  -> bytes not yet on a staged target
+#   staged  -> bytes uploaded, upload_resource_url set
+#   created -> fileCreate done, Shopify file id in video_id
+#   ready   -> Shopify finished processing the file
+#   attached-> file referenced by the product, status "uploaded"
+# The queue itself is in memory. Its owner refreshes upload_heartbeat_at on
+# every queued and running row; any process sweeps rows whose heartbeat is
+# older than UPLOAD_STALE_S (jobs lost to a crash or restart) to failed, and
+# the next upload request for them resumes from the recorded checkpoint.
+
+@dataclass
+class UploadJob:
+    video_id: str
+    shop: str
+    token: str
+    video_url: str
+    product_id: str
+    product_title: str
+
+def _update_video(id: str, **fields: Any) -> Optional[Video]:
+    db = SessionLocal()
+    try:
+        video = db.query(Video).filter(Video.id == id).first()
+        if video:
+            for name, value in fields.items():
+                setattr(video, name, value)
+            db.commit()
+            db.refresh(video)
+            db.expunge(video)
+        return video
+    finally:
+        db.close()
+
+async def _stage(job: UploadJob, GQL_URL: str, HEADERS: Dict[str, str], filename: str, mime: str) -> str:
+    async with open_source(job.video_url) as source:
+        variables: Dict[str, Any] = {
+            "input": [{
+                "filename": filename,
+                "mimeType": mime,
+                "resource": "VIDEO",
+                "httpMethod": "POST",
+                "fileSize": str(source.size),
+            }]
+        }
+        d1 = await gql(GQL_URL, HEADERS, STAGED_UPLOADS_CREATE, variables)
+        su = d1["data"]["stagedUploadsCreate"]
+        if su["userErrors"]:
+            raise HTTPException(400, {"where": "stagedUploadsCreate", "userErrors": su["userErrors"], "x_request_id": d1["x_request_id"]})
+        target = su["stagedTargets"][0]
+        params = {p["name"]: p["value"] for p in target["parameters"]}  # includes key, policy, x-goog-*, etc.
+
+        # multipart POST (fields EXACTLY as provided + file), streamed straight from the source
+        r = await relay_to_staged_target(target["url"], params, filename, mime, source)
+        if r.status_code not in (204, 201, 200):
+            raise HTTPException(502, f"Upload to staged target failed: {r.status_code} {r.text}")
+        return target["resourceUrl"]
+
+async def run_upload(job: UploadJob):
+    GQL_URL = graphql_url(job.shop)
+    HEADERS = {
+        "X-Shopify-Access-Token": job.token
+    }
+    filename = f"{job.product_title}.mp4"
+    mime = mimetypes.guess_type(filename)[0] or "video/mp4"
+
+    video = await run_db(_update_video, job.video_id)
+    if not video:
+        return
+    stage = video.upload_stage or "queued"
+    resource_url = video.upload_resource_url
+    file_id = video.video_id
+    try:
+        if stage == "queued":
+            resource_url = await _stage(job, GQL_URL, HEADERS, filename, mime)
+            await run_db(_update_video, job.video_id, upload_stage="staged", upload_resource_url=resource_url)
+            stage = "staged"
+
+        if stage == "staged":
+            d2 = await gql(GQL_URL, HEADERS, FILE_CREATE, {
+                "files": [{
+                    "contentType": "VIDEO",
+                    "originalSource": resource_url,
+                }]
+            })
+            fc = d2["data"]["fileCreate"]
+            if fc["userErrors"]:
+                raise HTTPException(400, {"where": "fileCreate", "userErrors": fc["userErrors"], "x_request_id": d2["x_request_id"]})
+            file_id = fc["files"][0]["id"]
+            await run_db(_update_video, job.video_id, upload_stage="created", video_id=file_id)
+            stage = "created"
+
+        if stage == "created":
+            await file_status_poller.wait_ready(job.shop, job.token, file_id)
+            await run_db(_update_video, job.video_id, upload_stage="ready")
+            stage = "ready"
+
+        if stage == "ready":
+            d3 = await gql(GQL_URL, HEADERS, FILE_UPDATE_ADD_PRODUCT, {
+                "files": [{"id": file_id, "alt": job.product_title, "referencesToAdd": [job.product_id]}]
+            })
+            fu = d3["data"]["fileUpdate"]
+            if fu["userErrors"]:
+                raise HTTPException(400, {"where": "fileUpdate", "userErrors": fu["userErrors"], "x_request_id": d3["x_request_id"]})
+            await run_db(_update_video, job.video_id, upload_stage="attached", status="uploaded", upload_error=None)
+    except Exception as exc:
+        await _record_failure(job, stage, exc)
+
+async def _record_failure(job: UploadJob, stage: str, exc: Exception):
+    detail = exc.detail if isinstance(exc, HTTPException) else str(exc)
+    print(f"Upload of video {job.video_id} failed at stage {stage}:", detail)
+    fields: Dict[str, Any] = {"status": "completed", "upload_error": str(detail)}
+    if stage == "staged" or isinstance(exc, FileProcessingFailed):
+        # The staged resource was rejected or Shopify could not process the
+        # file; the next attempt has to upload the bytes again.
+        fields.update(upload_stage="queued", upload_resource_url=None)
+    await run_db(_update_video, job.video_id, **fields)
+
+# Batch uploads walk the same checkpoints, but every Shopify mutation carries
+# up to UPLOAD_BATCH_SIZE videos and byte transfers run UPLOAD_RELAY_CONCURRENCY
+# at a time. A video that fails drops out of the batch with its error recorded;
+# the rest carry on. All jobs of a batch belong to the same shop.
+
+class _BatchItem:
+    def __init__(self, job: UploadJob, video: Video):
+        self.job = job
+        self.stage = video.upload_stage or "queued"
+        self.resource_url = video.upload_resource_url
+        self.file_id = video.video_id
+        self.filename = f"{job.product_title}.mp4"
+        self.mime = mimetypes.guess_type(self.filename)[0] or "video/mp4"
+        self.size: Optional[int] = None
+        self.failed = False
+
+def _chunks(items: List[_BatchItem]) -> List[List[_BatchItem]]:
+    return [items[i:i + UPLOAD_BATCH_SIZE] for i in range(0, len(items), UPLOAD_BATCH_SIZE)]
+
+async def _fail(item: _BatchItem, exc: Exception):
+    item.failed = True
+    await _record_failure(item.job, item.stage, exc)
+
+async def _fail_all(items: List[_BatchItem], exc: Exception):
+    for item in items:
+        await _fail(item, exc)
+
+def _error_index(error: Dict[str, Any], arg: str, size: int) -> Optional[int]:
+    # userErrors point at the offending input through `field`,
+    # e.g. ["files", "3", "originalSource"].
+    field = error.get("field") or []
+    if len(field) >= 2 and field[0] == arg and str(field[1]).isdigit() and int(field[1]) < size:
+        return int(field[1])
+    return None
+
+async def _mutate_chunk(GQL_URL: str, HEADERS: Dict[str, str], query: str, where: str, arg: str, results: str,
+                        chunk: List[_BatchItem], build: Callable[[_BatchItem], Dict[str, Any]]) -> List[Tuple[_BatchItem, Dict[str, Any]]]:
+    # Runs one batched mutation and returns (item, result) pairs. userErrors
+    # that name an input fail that item only; when the response carries no
+    # results for the others they are sent again without it. Errors that do
+    # not name an input fail the whole chunk.
+    while chunk:
+        try:
+            d = await gql(GQL_URL, HEADERS, query, {arg: [build(item) for item in chunk]})
+            payload = d["data"][where]
+            errors: Dict[int, List[Any]] = {}
+            for error in payload["userErrors"]:
+                index = _error_index(error, arg, len(chunk))
+                if index is None:
+                    raise HTTPException(400, {"where": where, "userErrors": payload["userErrors"], "x_request_id": d["x_request_id"]})
+                errors.setdefault(index, []).append(error)
+        except Exception as exc:
+            await _fail_all(chunk, exc)
+            return []
+        out = payload.get(results) or []
+        if not errors:
+            return list(zip(chunk, out))
+        for index, item_errors in errors.items():
+            await _fail(chunk[index], HTTPException(400, {"where": where, "userErrors": item_errors, "x_request_id": d["x_request_id"]}))
+        rest = [i for i in range(len(chunk)) if i not in errors]
+        if len(out) == len(chunk) and all(out[i] for i in rest):
+            return [(chunk[i], out[i]) for i in rest]
+        chunk = [chunk[i] for i in rest]
+    return []
+
+async def _relay_one(sem: asyncio.Semaphore, item: _BatchItem, target: Dict[str, Any]):
+    async with sem:
+        try:
+            async with open_source(item.job.video_url) as source:
+                if source.size != item.size:
+                    raise HTTPException(502, f"Source size changed from {item.size} to {source.size} bytes")
+                params = {p["name"]: p["value"] for p in target["parameters"]}
+                r = await relay_to_staged_target(target["url"], params, item.filename, item.mime, source)
+            if r.status_code not in (204, 201, 200):
+                raise HTTPException(502, f"Upload to staged target failed: {r.status_code} {r.text}")
+            item.resource_url = target["resourceUrl"]
+            await run_db(_update_video, item.job.video_id, upload_stage="staged", upload_resource_url=item.resource_url)
+            item.stage = "staged"
+        except Exception as exc:
+            await _fail(item, exc)
+
+async def _stage_batch(GQL_URL: str, HEADERS: Dict[str, str], items: List[_BatchItem]):
+    sizes = await asyncio.gather(*(probe_size(item.job.video_url) for item in items))
+    known: List[_BatchItem] = []
+    for item, size in zip(items, sizes):
+        item.size = size
+        if size is None:
+            # No size without reading the body; stage this one on its own.
+            try:
+                item.resource_url = await _stage(item.job, GQL_URL, HEADERS, item.filename, item.mime)
+                await run_db(_update_video, item.job.video_id, upload_stage="staged", upload_resource_url=item.resource_url)
+                item.stage = "staged"
+            except Exception as exc:
+                await _fail(item, exc)
+        else:
+            known.append(item)
+
+    sem = asyncio.Semaphore(UPLOAD_RELAY_CONCURRENCY)
+    for chunk in _chunks(known):
+        staged = await _mutate_chunk(GQL_URL, HEADERS, STAGED_UPLOADS_CREATE, "stagedUploadsCreate", "input", "stagedTargets", chunk, lambda item: {
+            "filename": item.filename,
+            "mimeType": item.mime,
+            "resource": "VIDEO",
+            "httpMethod": "POST",
+            "fileSize": str(item.size),
+        })
+        await asyncio.gather(*(_relay_one(sem, item, target) for item, target in staged))
+
+async def _create_batch(GQL_URL: str, HEADERS: Dict[str, str], items: List[_BatchItem]):
+    for chunk in _chunks(items):
+        created = await _mutate_chunk(GQL_URL, HEADERS, FILE_CREATE, "fileCreate", "files", "files", chunk, lambda item: {
+            "contentType": "VIDEO", "originalSource": item.resource_url,
+        })
+        for item, file in created:
+            item.file_id = file["id"]
+            await run_db(_update_video, item.job.video_id, upload_stage="created", video_id=item.file_id)
+            item.stage = "created"
+
+async def _wait_ready(item: _BatchItem):
+    try:
+        await file_status_poller.wait_ready(item.job.shop, item.job.token, item.file_id)
+        await run_db(_update_video, item.job.video_id, upload_stage="ready")
+        item.stage = "ready"
+    except Exception as exc:
+        await _fail(item, exc)
+
+async def _attach_batch(GQL_URL: str, HEADERS: Dict[str, str], items: List[_BatchItem]):
+    for chunk in _chunks(items):
+        updated = await _mutate_chunk(GQL_URL, HEADERS, FILE_UPDATE_ADD_PRODUCT, "fileUpdate", "files", "files", chunk, lambda item: {
+            "id": item.file_id, "alt": item.job.product_title, "referencesToAdd": [item.job.product_id],
+        })
+        for item, _ in updated:
+            await run_db(_update_video, item.job.video_id, upload_stage="attached", status="uploaded", upload_error=None)
+            item.stage = "attached"
+
+async def run_upload_batch(jobs: List[UploadJob]):
+    if not jobs:
+        return
+    GQL_URL = graphql_url(jobs[0].shop)
+    HEADERS = {
+        "X-Shopify-Access-Token": jobs[0].token
+    }
+    items: List[_BatchItem] = []
+    for job in jobs:
+        video = await run_db(_update_video, job.video_id)
+        if video:
+            items.append(_BatchItem(job, video))
+
+    try:
+        await _stage_batch(GQL_URL, HEADERS, [i for i in items if i.stage == "queued"])
+        await _create_batch(GQL_URL, HEADERS, [i for i in items if i.stage == "staged" and not i.failed])
+        await asyncio.gather(*(_wait_ready(i) for i in items if i.stage == "created" and not i.failed))
+        await _attach_batch(GQL_URL, HEADERS, [i for i in items if i.stage == "ready" and not i.failed])
+    except Exception as exc:
+        await _fail_all([i for i in items if i.stage != "attached" and not i.failed], exc)
+
+UploadWork = Union[UploadJob, List[UploadJob]]
+
+class UploadQueue:
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._queue: "asyncio.Queue[UploadWork]" = asyncio.Queue()
+        self._queued: Dict[str, int] = {}  # video id -> sequence number of its queue entry
+        self._running: Set[str] = set()
+        self._tasks: list = []
+        self._seq = 0
+        self.interrupted = 0
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+            self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _beat(self) -> int:
+        now = datetime.now(timezone.utc)
+        db = SessionLocal()
+        try:
+            touch_uploads(db, list(self._running | set(self._queued)), now)
+            return fail_stale_uploads(db, now - timedelta(seconds=UPLOAD_STALE_S), "Upload interrupted by a restart; upload again to resume")
+        finally:
+            db.close()
+
+    async def _heartbeat(self):
+        while True:
+            try:
+                interrupted = await run_db(self._beat)
+                if interrupted:
+                    self.interrupted += interrupted
+                    print(f"Marked {interrupted} interrupted upload jobs as failed")
+            except Exception as exc:
+                print("Upload heartbeat failed:", exc)
+            await asyncio.sleep(UPLOAD_HEARTBEAT_S)
+
+    def position(self, video_id: str) -> Optional[int]:
+        # 0 while running, 1-based position while waiting, None if unknown here.
+        # Videos of one batch share a position.
+        if video_id in self._running:
+            return 0
+        if video_id in self._queued:
+            return sorted(set(self._queued.values())).index(self._queued[video_id]) + 1
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        return {"queued": len(self._queued), "running": len(self._running)}
+
+    def enqueue(self, job: UploadJob) -> int:
+        position = self.position(job.video_id)
+        if position is not None:
+            return position
+        return self._put(job, [job.video_id])
+
+    def enqueue_batch(self, jobs: List[UploadJob]) -> Dict[str, int]:
+        # Videos already queued or running keep their place; the rest go into
+        # one batch entry. Returns the queue position of every video.
+        positions = {job.video_id: self.position(job.video_id) for job in jobs}
+        fresh = [job for job in jobs if positions[job.video_id] is None]
+        if fresh:
+            position = self._put(fresh, [job.video_id for job in fresh])
+            positions.update({job.video_id: position for job in fresh})
+        return positions
+
+    def _put(self, work: UploadWork, video_ids: List[str]) -> int:
+        self._seq += 1
+        for video_id in video_ids:
+            self._queued[video_id] = self._seq
+        self._queue.put_nowait(work)
+        return len(set(self._queued.values()))
+
+    async def _worker(self):
+        while True:
+            work = await self._queue.get()
+            jobs = work if isinstance(work, list) else [work]
+            for job in jobs:
+                self._queued.pop(job.video_id, None)
+                self._running.add(job.video_id)
+            try:
+                with stage("upload_batch" if isinstance(work, list) else "upload_job"):
+                    if isinstance(work, list):
+                        await run_upload_batch(work)
+                    else:
+                        await run_upload(work)
+            except Exception as exc:
+                print(f"Upload worker error for videos {[job.video_id for job in jobs]}:", exc)
+            finally:
+                for job in jobs:
+                    self._running.discard(job.video_id)
+                self._queue.task_done()
+
+upload_queue = UploadQueue(UPLOAD_WORKERS)
@@ -0,0 +1,124 @@
+import uuid
+from dataclasses import dataclass, field
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from app.db.models.credits import Credits, CreditLedger
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+EXTRA_CREDIT_PRODUCT_ID = "prod_Su4INfJofTlANV"
+RESERVE_ATTEMPTS = 5
+
+MONTHLY = "monthly"
+EXTRA = "extra"
+
+@dataclass
+class Reservation:
+    id: str
+    shop: str
+    buckets: Dict[str, int] = field(default_factory=dict)
+    task_id: Optional[str] = None
+
+    @property
+    def amount(self) -> int:
+        return sum(self.buckets.values())
+
+def get_credits(db: Session, shop: str) -> Optional[Credits]:
+    return db.query(Credits).filter(Credits.shop_name == shop).first()
+
+def _bucket_column(bucket: str):
+    return Credits.monthly_credit if bucket == MONTHLY else Credits.extra_credit
+
+def _take(db: Session, shop: str, bucket: str, amount: int, now: datetime) -> bool:
+    # Single conditional UPDATE: only succeeds if the balance still covers the
+    # amount at the moment the row is written, so concurrent workers can never
+    # drive a balance negative.
+    column = _bucket_column(bucket)
+    stmt = update(Credits).where(Credits.shop_name == shop, column >= amount)
+    if bucket == MONTHLY:
+        stmt = stmt.where(Credits.subscription_expired >= now)
+    result = db.execute(stmt.values({column: column - amount}).execution_options(synchronize_session=False))
+    return result.rowcount == 1
+
+def reserve_credits(db: Session, shop: str, amount: int = 1) -> Optional[Reservation]:
+    # Draws from the monthly allowance first (while the subscription is
+    # active), then from extra credits. Returns None when the shop cannot
+    # cover `amount`; nothing is deducted in that case.
+    for _ in range(RESERVE_ATTEMPTS):
+        now = datetime.now()
+        credits = db.query(Credits).filter(Credits.shop_name == shop).populate_existing().first()
+        if not credits:
+            return None
+
+        active = credits.subscription_expired is not None and credits.subscription_expired >= now
+        from_monthly = min(int(credits.monthly_credit or 0), amount) if active else 0
+        from_extra = amount - from_monthly
+        if from_extra > (credits.extra_credit or 0):
+            db.rollback()
+            return None
+
+        reservation = Reservation(id=uuid.uuid4().hex, shop=shop)
+        ok = True
+        for bucket, n in ((MONTHLY, from_monthly), (EXTRA, from_extra)):
+            if n and ok:
+                ok = _take(db, shop, bucket, n, now)
+                reservation.buckets[bucket] = n
+        if ok:
+            for bucket, n in reservation.buckets.items():
+                db.add(CreditLedger(shop_name=shop, reservation_id=reservation.id, entry_type="reserve", bucket=bucket, delta=-n))
+            db.commit()
+            return reservation
+        # Another worker spent the balance between our read and write; retry
+        # against fresh numbers.
+        db.rollback()
+    return None
+
+def commit_reservation(db: Session, reservation: Reservation, task_id: Optional[str] = None):
+    db.add(CreditLedger(shop_name=reservation.shop, reservation_id=reservation.id, entry_type="commit", delta=0, task_id=task_id))
+    db.commit()
+
+def refund_reservation(db: Session, reservation: Reservation, amount: Optional[int] = None):
+    # Returns `amount` credits (default: everything still held) to the buckets
+    # they came from, extra credits first since those never expire.
+    remaining = reservation.amount if amount is None else min(amount, reservation.amount)
+    for bucket in (EXTRA, MONTHLY):
+        n = min(reservation.buckets.get(bucket, 0), remaining)
+        if not n:
+            continue
+        column = _bucket_column(bucket)
+        db.execute(
+            update(Credits).where(Credits.shop_name == reservation.shop)
+            .values({column: column + n}).execution_options(synchronize_session=False)
+        )
+        db.add(CreditLedger(shop_name=reservation.shop, reservation_id=reservation.id, entry_type="refund", bucket=bucket, delta=n))
+        reservation.buckets[bucket] -= n
+        remaining -= n
+    db.commit()
+
+def _subscription_values(amount: int) -> Dict[str, Any]:
+    return {
+        "monthly_credit": amount / 140,
+        "subscription_type": (1 if amount == 14000 else (2 if amount == 35000 else 3)),
+        "subscription_expired": datetime.now() + timedelta(days=30),
+    }
+
+def add_checkout_credits(db: Session, shop_id: str, product_id: str, quantity: int, amount: int, stripe_event_id: Optional[str] = None):
+    # Single-statement UPDATEs (no read-modify-write), so concurrent grants for
+    # the same shop cannot overwrite each other. Does not commit.
+    if product_id == EXTRA_CREDIT_PRODUCT_ID: # extra credit
+        result = db.execute(
+            update(Credits).where(Credits.shop_name == shop_id)
+            .values(extra_credit=Credits.extra_credit + quantity).execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            db.add(Credits(shop_name=shop_id, extra_credit=quantity))
+        db.add(CreditLedger(shop_name=shop_id, entry_type="purchase", bucket=EXTRA, delta=quantity, stripe_event_id=stripe_event_id))
+    else:
+        values = _subscription_values(amount)
+        result = db.execute(
+            update(Credits).where(Credits.shop_name == shop_id)
+            .values(values).execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            db.add(Credits(shop_name=shop_id, **values))
+        db.add(CreditLedger(shop_name=shop_id, entry_type="subscription", bucket=MONTHLY, delta=int(amount / 140), stripe_event_id=stripe_event_id))
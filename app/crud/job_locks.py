@@ -0,0 +1,28 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.db.models.job_lock import JobLock
+
+def try_lock(db: Session, name: str, holder: str, stale_s: float) -> bool:
+    # Takes the lock, refreshes it for its holder, or takes it over from a
+    # holder that has not refreshed it for stale_s (a worker that died).
+    now = datetime.now(timezone.utc)
+    db.add(JobLock(name=name, holder=holder, acquired_at=now))
+    try:
+        db.commit()
+        return True
+    except IntegrityError:
+        db.rollback()
+    result = db.execute(
+        update(JobLock).where(
+            JobLock.name == name,
+            or_(JobLock.holder == holder, JobLock.acquired_at < now - timedelta(seconds=stale_s)),
+        ).values(holder=holder, acquired_at=now).execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+def unlock(db: Session, name: str, holder: str):
+    db.execute(delete(JobLock).where(JobLock.name == name, JobLock.holder == holder).execution_options(synchronize_session=False))
+    db.commit()
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from sqlalchemy import and_, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.core.constants import STRIPE_EVENT_MAX_ATTEMPTS, STRIPE_EVENT_RETRY_BASE_S, STRIPE_EVENT_RETRY_MAX_S, STRIPE_EVENT_STALE_S
+from app.crud.credits import add_checkout_credits
+from app.db.models.stripe_event import StripeEvent
+
+def record_event(db: Session, event_id: str, type_: str, shop: Optional[str], session_id: Optional[str]) -> bool:
+    # Returns False when the event was already recorded (a Stripe retry).
+    db.add(StripeEvent(id=event_id, type=type_, shop_name=shop, session_id=session_id))
+    try:
+        db.commit()
+        return True
+    except IntegrityError:
+        db.rollback()
+        return False
+
+def _claimable(now: datetime):
+    return or_(
+        and_(StripeEvent.status == "pending", StripeEvent.next_attempt_at <= now),
+        and_(StripeEvent.status == "processing", StripeEvent.claimed_at < now - timedelta(seconds=STRIPE_EVENT_STALE_S)),
+    )
+
+def claim_due_events(db: Session, limit: int) -> List[StripeEvent]:
+    # Moves due events to `processing` one conditional UPDATE at a time, so
+    # several app processes can share the table without double-processing.
+    now = datetime.now(timezone.utc)
+    ids = [id for (id,) in db.query(StripeEvent.id).filter(_claimable(now)).order_by(StripeEvent.next_attempt_at).limit(limit)]
+    claimed = []
+    for id in ids:
+        result = db.execute(
+            update(StripeEvent).where(StripeEvent.id == id, _claimable(now))
+            .values(status="processing", claimed_at=now, attempts=StripeEvent.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            claimed.append(id)
+    db.commit()
+    events = db.query(StripeEvent).filter(StripeEvent.id.in_(claimed)).all() if claimed else []
+    db.expunge_all()
+    return events
+
+def complete_checkout_event(db: Session, event: StripeEvent, product_id: str, quantity: int, amount: int) -> bool:
+    # Marks the event done and grants the credits in one transaction; if
+    # another worker already finished it, nothing is applied.
+    result = db.execute(
+        update(StripeEvent).where(StripeEvent.id == event.id, StripeEvent.status == "processing")
+        .values(status="done", processed_at=datetime.now(timezone.utc), last_error=None)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        db.rollback()
+        return False
+    add_checkout_credits(db, event.shop_name, product_id, quantity, amount, event.id)
+    db.commit()
+    return True
+
+def fail_event(db: Session, event: StripeEvent, error: str):
+    db.rollback()
+    values = {"last_error": error[:1000]}
+    if event.attempts >= STRIPE_EVENT_MAX_ATTEMPTS:
+        values["status"] = "failed"
+    else:
+        delay = min(STRIPE_EVENT_RETRY_MAX_S, STRIPE_EVENT_RETRY_BASE_S * 2 ** (event.attempts - 1))
+        values.update(status="pending", next_attempt_at=datetime.now(timezone.utc) + timedelta(seconds=delay))
+    db.execute(
+        update(StripeEvent).where(StripeEvent.id == event.id, StripeEvent.status == "processing")
+        .values(values).execution_options(synchronize_session=False)
+    )
+    db.commit()
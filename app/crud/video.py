@@ -1,9 +1,13 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_, update
 from sqlalchemy.orm import Session
 from app.db.models.video import Video
-from typing import List
+from typing import Any, List, Optional, Tuple
 
-def create_video(db: Session, id: str, images: List[str], prompt: str, product_id: str, product_title: str, shop: str):
-    video = Video(
+def build_video(id: str, images: List[str], prompt: str, product_id: str, product_title: str, shop: str, kling_account: Optional[str] = None) -> Video:
+    return Video(
         id = id,
         product_id = product_id,
         product_title = product_title,
@@ -16,9 +20,118 @@ def create_video(db: Session, id: str, images: List[str], prompt: str, product_i
         video_url = "",
         status = "processing",
         duration = 5,
+        kling_account = kling_account,
     )
-    
+
+def create_video(db: Session, id: str, images: List[str], prompt: str, product_id: str, product_title: str, shop: str, kling_account: Optional[str] = None, request_fingerprint: Optional[str] = None, request_body_hash: Optional[str] = None):
+    video = build_video(id, images, prompt, product_id, product_title, shop, kling_account)
+    video.request_fingerprint = request_fingerprint
+    video.request_body_hash = request_body_hash
     db.add(video)
     db.commit()
     db.refresh(video)
-    return video
\ No newline at end of file
+    return video
+
+def create_videos(db: Session, videos: List[Video]):
+    # One multi-row INSERT for a whole bulk job.
+    db.add_all(videos)
+    db.commit()
+
+def find_recent_video(db: Session, shop: str, request_fingerprint: str, since: datetime, skip_failed: bool = False) -> Optional[Any]:
+    query = db.query(Video.id, Video.status, Video.request_body_hash).filter(
+        Video.shop == shop, Video.request_fingerprint == request_fingerprint, Video.created_at >= since,
+    )
+    if skip_failed:
+        query = query.filter(Video.status != 'failed')
+    return query.order_by(Video.created_at.desc()).first()
+
+def get_video_status(db: Session, id: str) -> Optional[str]:
+    return db.query(Video.status).filter(Video.id == id).scalar()
+
+def get_video_by_id(db: Session, id: str) -> Optional[Video]:
+    return db.query(Video).filter(Video.id == id).first()
+
+def get_videos_by_ids(db: Session, ids: List[str]) -> List[Video]:
+    return db.query(Video).filter(Video.id.in_(ids)).all()
+
+# Only the columns VideoSummary renders; image URLs and prompts stay in the DB.
+SUMMARY_COLUMNS = (
+    Video.id, Video.product_id, Video.product_title, Video.video_url,
+    Video.status, Video.duration, Video.thumbnail, Video.created_at,
+)
+
+def encode_cursor(created_at: datetime, id: str) -> str:
+    raw = json.dumps([created_at.isoformat(), id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, id = json.loads(raw)
+        return datetime.fromisoformat(created_at), str(id)
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+def list_videos(db: Session, shop: str, limit: Optional[int], cursor: Optional[str] = None,
+                status: Optional[str] = None, product_id: Optional[str] = None) -> Tuple[List[Any], Optional[str]]:
+    # Keyset pagination over (shop, created_at, id), newest first. Returns the
+    # page and the cursor for the next one (None on the last page). Without a
+    # limit every row is returned, as GET /video did before pagination.
+    query = db.query(*SUMMARY_COLUMNS).filter(Video.shop == shop)
+    if status:
+        query = query.filter(Video.status == status)
+    if product_id:
+        query = query.filter(Video.product_id == product_id)
+    if cursor:
+        created_at, id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Video.created_at < created_at,
+            and_(Video.created_at == created_at, Video.id < id),
+        ))
+
+    query = query.order_by(Video.created_at.desc(), Video.id.desc())
+    if limit is None:
+        return query.all(), None
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
+
+def get_upload_state(db: Session, id: str) -> Optional[Any]:
+    return db.query(Video.status, Video.video_id, Video.upload_stage, Video.upload_error).filter(Video.id == id).first()
+
+def touch_uploads(db: Session, ids: List[str], now: datetime):
+    if ids:
+        db.execute(
+            update(Video).where(Video.id.in_(ids), Video.status == "uploading")
+            .values(upload_heartbeat_at=now).execution_options(synchronize_session=False)
+        )
+        db.commit()
+
+def fail_stale_uploads(db: Session, before: datetime, error: str) -> int:
+    # Upload jobs live in the memory of the process that accepted them. Rows
+    # still `uploading` whose heartbeat stopped lost that process; they are
+    # marked failed with their checkpoint kept, so uploading again resumes.
+    result = db.execute(
+        update(Video).where(
+            Video.status == "uploading",
+            or_(Video.upload_heartbeat_at == None, Video.upload_heartbeat_at < before),
+        ).values(status="completed", upload_error=error).execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+def save_video(db: Session, video: Video) -> Video:
+    db.commit()
+    db.refresh(video)
+    return video
+
+def save_videos(db: Session, videos: List[Video]) -> List[Video]:
+    # One commit for a batch of modified rows.
+    db.commit()
+    return videos
+
+def delete_video(db: Session, video: Video):
+    db.delete(video)
+    db.commit()
@@ -1,10 +1,20 @@
-from app.db.session import SessionLocal
+from app.core.constants import DB_ASYNC
+from app.db.session import SessionLocal, AsyncSessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import Generator
+from typing import AsyncGenerator, Generator
 
-def get_db() -> Generator[Session, None, None]:
+def get_sync_db() -> Generator[Session, None, None]:
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Routes hand the session to run_db(), which accepts either kind, so
+# DB_ASYNC=1 switches every route to the async engine without code changes.
+get_db = get_async_db if DB_ASYNC else get_sync_db
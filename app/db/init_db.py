@@ -1,6 +1,46 @@
+import time
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
 from app.db.base import Base
 from app.db.session import engine
 from app.db.models.video import Video
+from app.db.models.credits import Credits, CreditLedger
+from app.db.models.stripe_event import StripeEvent
+from app.db.models.job_lock import JobLock
 
-def init_db():
+def _add_missing_columns():
+    # create_all never alters existing tables; new nullable columns on existing
+    # models are added here so deployments don't need a manual migration.
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+def _migrate():
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    # create_all skips tables that already exist, so indexes added to existing
+    # models later on have to be created separately.
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+def init_db(attempts: int = 3):
+    # Every uvicorn worker runs this at startup. Workers starting together can
+    # race on the same CREATE/ALTER; the loser retries and then sees the
+    # winner's schema.
+    for attempt in range(attempts):
+        try:
+            _migrate()
+            return
+        except (OperationalError, ProgrammingError) as exc:
+            if attempt == attempts - 1:
+                raise
+            print("init_db raced another worker, retrying:", exc)
+            time.sleep(0.5 * (attempt + 1))
@@ -9,4 +9,20 @@ class Credits(Base):
     extra_credit: Mapped[int] = mapped_column(default=0)
     monthly_credit: Mapped[int] = mapped_column(default=0)
     subscription_type: Mapped[int] = mapped_column(nullable=True)
-    subscription_expired: Mapped[datetime] = mapped_column(nullable=True)
\ No newline at end of file
+    subscription_expired: Mapped[datetime] = mapped_column(nullable=True)
+
+class CreditLedger(Base):
+    # Append-only audit trail of every credit movement. A reservation writes
+    # one `reserve` row per bucket it drew from, followed later by either a
+    # `commit` row or `refund` rows under the same reservation_id.
+    __tablename__ = "credit_ledger"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    shop_name: Mapped[str] = mapped_column(nullable=False, index=True)
+    reservation_id: Mapped[str] = mapped_column(nullable=True, index=True)
+    entry_type: Mapped[str] = mapped_column(nullable=False)
+    bucket: Mapped[str] = mapped_column(nullable=True)
+    delta: Mapped[int] = mapped_column(nullable=False)
+    task_id: Mapped[str] = mapped_column(nullable=True)
+    stripe_event_id: Mapped[str] = mapped_column(nullable=True)
+    created_at: Mapped[datetime] = mapped_column(default=lambda: datetime.now(timezone.utc))
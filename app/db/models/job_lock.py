@@ -0,0 +1,12 @@
+from sqlalchemy.orm import Mapped, mapped_column
+from app.db.base import Base
+from datetime import datetime
+
+class JobLock(Base):
+    # One row per named one-off job while some process runs it; the primary
+    # key lets only one worker insert it.
+    __tablename__ = "job_locks"
+
+    name: Mapped[str] = mapped_column(primary_key=True)
+    holder: Mapped[str] = mapped_column(nullable=False)
+    acquired_at: Mapped[datetime] = mapped_column(nullable=False)
@@ -0,0 +1,24 @@
+from sqlalchemy import Index
+from sqlalchemy.orm import Mapped, mapped_column
+from app.db.base import Base
+from datetime import datetime, timezone
+
+class StripeEvent(Base):
+    # One row per Stripe event id; the primary key is what makes retried
+    # deliveries no-ops. status: pending -> processing -> done | failed
+    __tablename__ = "stripe_events"
+    __table_args__ = (
+        Index("ix_stripe_events_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+    id: Mapped[str] = mapped_column(primary_key=True)
+    type: Mapped[str] = mapped_column(nullable=False)
+    shop_name: Mapped[str] = mapped_column(nullable=True)
+    session_id: Mapped[str] = mapped_column(nullable=True)
+    status: Mapped[str] = mapped_column(nullable=False, default="pending")
+    attempts: Mapped[int] = mapped_column(default=0)
+    last_error: Mapped[str] = mapped_column(nullable=True)
+    received_at: Mapped[datetime] = mapped_column(default=lambda: datetime.now(timezone.utc))
+    next_attempt_at: Mapped[datetime] = mapped_column(default=lambda: datetime.now(timezone.utc))
+    claimed_at: Mapped[datetime] = mapped_column(nullable=True)
+    processed_at: Mapped[datetime] = mapped_column(nullable=True)
@@ -1,3 +1,4 @@
+from sqlalchemy import Index
 from sqlalchemy.orm import Mapped, mapped_column
 from app.db.base import Base
 from datetime import datetime, timezone
@@ -5,6 +6,11 @@ from datetime import datetime, timezone
 
 class Video(Base):
     __tablename__ = "videos"
+    __table_args__ = (
+        # Backs the keyset-paginated listing in GET /video.
+        Index("ix_videos_shop_created_at_id", "shop", "created_at", "id"),
+        Index("ix_videos_shop_request_fingerprint", "shop", "request_fingerprint"),
+    )
 
     id: Mapped[str] = mapped_column(primary_key=True)
     product_id: Mapped[str] = mapped_column(nullable=False)
@@ -20,4 +26,16 @@ class Video(Base):
     thumbnail: Mapped[str] = mapped_column(nullable=True)
     status: Mapped[str] = mapped_column(nullable=False)
     duration: Mapped[float] = mapped_column(nullable=False)
-    created_at: Mapped[datetime] = mapped_column(default=lambda: datetime.now(timezone.utc))
\ No newline at end of file
+    created_at: Mapped[datetime] = mapped_column(default=lambda: datetime.now(timezone.utc))
+    # Access key of the Kling account the task was submitted under (None: the default key)
+    kling_account: Mapped[str] = mapped_column(nullable=True)
+    # Identifies the POST /video request (content hash or Idempotency-Key) for duplicate detection
+    request_fingerprint: Mapped[str] = mapped_column(nullable=True)
+    # Hash of the request body sent with an Idempotency-Key; a reuse of the key with another body is rejected
+    request_body_hash: Mapped[str] = mapped_column(nullable=True)
+    # Shopify upload job checkpoints: queued -> staged -> created -> ready -> attached
+    upload_stage: Mapped[str] = mapped_column(nullable=True)
+    upload_resource_url: Mapped[str] = mapped_column(nullable=True)
+    upload_error: Mapped[str] = mapped_column(nullable=True)
+    # Refreshed by the process that holds the upload job; a stale value means that process is gone
+    upload_heartbeat_at: Mapped[datetime] = mapped_column(nullable=True)
\ No newline at end of file
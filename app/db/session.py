@@ -1,12 +1,118 @@
 # app/db/session.py
 
-from sqlalchemy import create_engine
+import time
+from typing import Any, Dict
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from app.core.constants import SQLALCHEMY_DATABASE_URL
-
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False}  # Required for SQLite
+from app.core.constants import (
+    SQLALCHEMY_DATABASE_URL, ASYNC_DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT_S,
+    DB_POOL_RECYCLE_S, DB_POOL_PRE_PING, SQLITE_BUSY_TIMEOUT_MS, SQLITE_WAL,
 )
+from app.core.metrics import registry
+
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg", "mysql": "mysql+aiomysql"}
+
+db_pool_checkouts = registry.counter("db_pool_checkouts_total", "Connections handed out by the DB pool.")
+db_pool_connects = registry.counter("db_pool_connects_total", "New DB connections opened by the pool.")
+db_pool_checkout_seconds = registry.histogram("db_pool_checkout_seconds", "Time a session waited for a pooled DB connection.")
+
+def _is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+def async_url(url: str) -> str:
+    parsed = make_url(url)
+    if "+" in parsed.drivername:
+        parsed = parsed.set(drivername=parsed.get_backend_name())
+    return parsed.set(drivername=_ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)).render_as_string(hide_password=False)
+
+def _engine_args(url: str) -> Dict[str, Any]:
+    if _is_sqlite(url):
+        args: Dict[str, Any] = {"connect_args": {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}}
+        if make_url(url).database in (None, "", ":memory:"):
+            return args  # single shared in-memory connection; pool sizing does not apply
+    else:
+        args = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE_S}
+    args.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT_S)
+    return args
+
+def _instrument(engine: Engine, name: str):
+    sqlite = engine.dialect.name == "sqlite"
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, _):
+        db_pool_connects.inc(engine=name)
+        if sqlite:
+            # WAL lets readers run alongside the one writer, and busy_timeout
+            # makes a second writer (another uvicorn worker) wait instead of
+            # failing with "database is locked".
+            cursor = dbapi_connection.cursor()
+            if SQLITE_WAL:
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            cursor.close()
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(*_):
+        db_pool_checkouts.inc(engine=name)
+
+    # The pool has no "checkout started" event; time Session connection acquisition instead.
+    connect = engine.connect
+
+    def timed_connect(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return connect(*args, **kwargs)
+        finally:
+            db_pool_checkout_seconds.observe(time.perf_counter() - start, engine=name)
+    engine.connect = timed_connect
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_args(SQLALCHEMY_DATABASE_URL))
+_instrument(engine, "sync")
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async engine for routes that take get_async_db (or get_db with DB_ASYNC=1).
+# Built lazily so deployments without an async driver installed are unaffected.
+_async_engine = None
+_async_sessionmaker = None
+
+def async_engine() -> AsyncEngine:
+    global _async_engine, _async_sessionmaker
+    if _async_engine is None:
+        url = ASYNC_DATABASE_URL or async_url(SQLALCHEMY_DATABASE_URL)
+        try:
+            _async_engine = create_async_engine(url, **_engine_args(url))
+        except ImportError as exc:
+            driver = make_url(url).drivername.split("+")[-1]
+            raise RuntimeError(f"The async engine needs the {driver} driver (pip install {driver}), or point ASYNC_DATABASE_URL at an installed one") from exc
+        _instrument(_async_engine.sync_engine, "async")
+        # expire_on_commit=False: routes read attributes after commit, and an
+        # expired attribute cannot be lazy-loaded outside the greenlet bridge.
+        _async_sessionmaker = async_sessionmaker(_async_engine, autoflush=False, expire_on_commit=False)
+    return _async_engine
+
+def AsyncSessionLocal():
+    async_engine()
+    return _async_sessionmaker()
+
+def pool_stats(e: Engine) -> Dict[str, Any]:
+    pool = e.pool
+    stats: Dict[str, Any] = {"class": type(pool).__name__}
+    for name in ("size", "checkedout", "checkedin", "overflow"):
+        if hasattr(pool, name):
+            stats[name] = getattr(pool, name)()
+    return stats
+
+def db_stats() -> Dict[str, Dict[str, Any]]:
+    stats = {"sync": pool_stats(engine)}
+    if _async_engine is not None:
+        stats["async"] = pool_stats(_async_engine.sync_engine)
+    return stats
+
+async def dispose_engines():
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    engine.dispose()
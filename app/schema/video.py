@@ -1,6 +1,8 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field, model_validator
+from typing import Any, Optional, List
 from datetime import datetime
+from app.core.constants import BULK_MAX_PRODUCTS, UPLOAD_BULK_MAX
+from app.core.thumbnail_store import thumbnail_urls
 
 
 class VideoSummary(BaseModel):
@@ -11,11 +13,23 @@ class VideoSummary(BaseModel):
     status: str
     duration: float
     thumbnail: Optional[str]
+    thumbnail_large: Optional[str] = None
     created_at: datetime
 
     class Config:
         from_attributes = True
 
+    @model_validator(mode="before")
+    @classmethod
+    def thumbnail_to_urls(cls, data: Any) -> Any:
+        # Video.thumbnail stores a thumbnail-store key; expose list- and detail-size URLs.
+        if not isinstance(data, dict):
+            data = {name: getattr(data, name, None) for name in cls.model_fields}
+        elif data.get("thumbnail_large"):
+            return data
+        data["thumbnail"], data["thumbnail_large"] = thumbnail_urls(data.get("thumbnail"))
+        return data
+
 class GenerateVideoRequest(BaseModel):
     prompt: str
     product_id: str
@@ -23,6 +37,17 @@ class GenerateVideoRequest(BaseModel):
     images: List[str]
     shop: str
 
+class BulkProduct(BaseModel):
+    product_id: str
+    product_title: str
+    images: List[str]
+    prompt: Optional[str] = None
+
+class BulkGenerateRequest(BaseModel):
+    shop: str
+    prompt: str  # used for every product without its own prompt
+    products: List[BulkProduct] = Field(..., min_length=1, max_length=BULK_MAX_PRODUCTS)
+
 class VideoUploadRequest(BaseModel):
     shop: str
     token: str
@@ -31,6 +56,17 @@ class VideoUploadRequest(BaseModel):
     product_id: str
     product_title: str
 
+class BulkUploadItem(BaseModel):
+    video_id: str
+    video_url: str
+    product_id: str
+    product_title: str
+
+class BulkUploadRequest(BaseModel):
+    shop: str
+    token: str
+    videos: List[BulkUploadItem] = Field(..., min_length=1, max_length=UPLOAD_BULK_MAX)
+
 class CreateSessionRequest(BaseModel):
     shop: str
     plan: str
@@ -38,4 +74,12 @@ class CreateSessionRequest(BaseModel):
     redirectUrl: str
 
 class ShopNamePayload(BaseModel):
-    shop: str
\ No newline at end of file
+    shop: str
+
+class UploadJobStatus(BaseModel):
+    job_id: str
+    status: str
+    stage: Optional[str]
+    queue_position: Optional[int]
+    video_id: Optional[str]
+    error: Optional[str]
@@ -0,0 +1,288 @@
+# Stand-in for every upstream the backend talks to, so the whole request path
+# can be exercised locally without touching live Kling, Shopify or Stripe:
+#
+#   Kling    POST /v1/videos/multi-image2video, GET .../{task_id}, callbacks
+#   Shopify  POST /{shop}/admin/api/{version}/graphql.json (+ POST /staged)
+#   Stripe   GET /v1/checkout/sessions/{id}/line_items, POST /v1/checkout/sessions
+#   Media    GET /media/image-{n}.png, GET /media/video.mp4
+#
+# Point the app at it with
+#
+#   KLING_AI_API_URL=http://127.0.0.1:9100 SHOPIFY_ADMIN_URL=http://127.0.0.1:9100/{shop}
+#   STRIPE_API_BASE=http://127.0.0.1:9100
+#
+# and run it with
+#
+#   python -m bench.fake_upstream --port 9100 --latency-ms 50 --error-rate 0.01
+#
+# GET /_stats returns per-route call counts; POST /_reset clears them.
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+import cv2
+import httpx
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse, JSONResponse, Response
+
+@dataclass
+class FakeConfig:
+    latency_ms: float = 20
+    jitter_ms: float = 10
+    error_rate: float = 0.0
+    task_seconds: float = 5
+    file_ready_seconds: float = 2
+    image_px: int = 1024
+    video_mb: float = 2
+    shopify_bucket: float = 1000
+    shopify_restore: float = 50
+    callbacks: bool = True
+    kling_max_tasks: int = 0  # unfinished tasks allowed at once (Kling plan concurrency); 0 = unlimited
+
+def make_video(path: str, target_mb: float):
+    # Random-noise frames barely compress, so the file size tracks the frame count.
+    frame = lambda: np.random.randint(0, 256, (360, 640, 3), dtype=np.uint8)
+    probe = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 24, (640, 360))
+    for _ in range(5):
+        probe.write(frame())
+    probe.release()
+    per_frame = max(1, os.path.getsize(path) // 5)
+    frames = max(1, int(target_mb * 1024 * 1024 / per_frame))
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 24, (640, 360))
+    for _ in range(frames):
+        writer.write(frame())
+    writer.release()
+
+def create_app(config: FakeConfig) -> FastAPI:
+    app = FastAPI()
+    calls: Counter = Counter()
+    tasks: Dict[str, Dict[str, Any]] = {}
+    files: Dict[str, float] = {}
+    bucket = {"available": config.shopify_bucket, "at": time.monotonic()}
+    ids = itertools.count(1)
+    video_path = os.path.join(tempfile.mkdtemp(), "video.mp4")
+    make_video(video_path, config.video_mb)
+    background = set()
+
+    async def upstream(route: str) -> Optional[Response]:
+        calls[route] += 1
+        await asyncio.sleep(max(0.0, config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)) / 1000)
+        if random.random() < config.error_rate:
+            calls[f"{route}:error"] += 1
+            return JSONResponse({"message": "injected failure"}, status_code=random.choice([500, 502, 503]))
+        return None
+
+    def base_url(request: Request) -> str:
+        return str(request.base_url).rstrip("/")
+
+    # Kling
+
+    def task_data(task_id: str, request: Request) -> Dict[str, Any]:
+        task = tasks[task_id]
+        done = time.monotonic() - task["created"] >= config.task_seconds
+        data: Dict[str, Any] = {"task_id": task_id, "task_status": "succeed" if done else "processing"}
+        if done:
+            data["task_result"] = {"videos": [{"url": f"{base_url(request)}/media/video.mp4", "duration": "5.0"}]}
+        return data
+
+    async def send_callback(task_id: str, url: str, request: Request):
+        await asyncio.sleep(config.task_seconds)
+        calls["kling:callback"] += 1
+        try:
+            async with httpx.AsyncClient(timeout=10) as client:
+                await client.post(url, json=task_data(task_id, request))
+        except httpx.HTTPError as exc:
+            calls["kling:callback:error"] += 1
+            print("Callback failed:", exc)
+
+    @app.post("/v1/videos/multi-image2video")
+    async def kling_submit(request: Request):
+        if (failed := await upstream("kling:submit")) is not None:
+            return failed
+        body = await request.json()
+        if config.kling_max_tasks:
+            now = time.monotonic()
+            running = sum(1 for t in tasks.values() if now - t["created"] < config.task_seconds)
+            if running >= config.kling_max_tasks:
+                calls["kling:submit:429"] += 1
+                return JSONResponse({"code": 1303, "message": "parallel task limit exceeded"}, status_code=429)
+        task_id = f"fake-task-{next(ids)}"
+        tasks[task_id] = {"created": time.monotonic()}
+        if config.callbacks and body.get("callback_url"):
+            task = asyncio.create_task(send_callback(task_id, body["callback_url"], request))
+            background.add(task)
+            task.add_done_callback(background.discard)
+        return {"code": 0, "data": {"task_id": task_id, "task_status": "submitted"}}
+
+    @app.get("/v1/videos/multi-image2video/{task_id}")
+    async def kling_status(task_id: str, request: Request):
+        if (failed := await upstream("kling:status")) is not None:
+            return failed
+        if task_id not in tasks:
+            return JSONResponse({"code": 1201, "message": "task not found"}, status_code=404)
+        return {"code": 0, "data": task_data(task_id, request)}
+
+    # Media
+
+    @app.get("/media/image-{n}.png")
+    async def media_image(n: int):
+        calls["media:image"] += 1
+        img = np.full((config.image_px, config.image_px, 3), n % 256, dtype=np.uint8)
+        cv2.putText(img, str(n), (20, config.image_px // 2), cv2.FONT_HERSHEY_SIMPLEX, 4, (255, 255, 255), 8)
+        return Response(cv2.imencode(".png", img)[1].tobytes(), media_type="image/png")
+
+    @app.api_route("/media/video.mp4", methods=["GET", "HEAD"])
+    async def media_video():
+        calls["media:video"] += 1
+        return FileResponse(video_path, media_type="video/mp4")
+
+    # Shopify
+
+    def shopify_cost(cost: float) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        bucket["available"] = min(config.shopify_bucket, bucket["available"] + (now - bucket["at"]) * config.shopify_restore)
+        bucket["at"] = now
+        throttled = bucket["available"] < cost
+        if not throttled:
+            bucket["available"] -= cost
+        return {
+            "throttled": throttled,
+            "cost": {
+                "requestedQueryCost": cost,
+                "actualQueryCost": None if throttled else cost,
+                "throttleStatus": {
+                    "maximumAvailable": config.shopify_bucket,
+                    "currentlyAvailable": int(bucket["available"]),
+                    "restoreRate": config.shopify_restore,
+                },
+            },
+        }
+
+    @app.post("/{shop}/admin/api/{version}/graphql.json")
+    async def shopify_graphql(shop: str, version: str, request: Request):
+        if (failed := await upstream("shopify:graphql")) is not None:
+            return failed
+        body = await request.json()
+        query, variables = body["query"], body.get("variables") or {}
+        items = next((v for v in variables.values() if isinstance(v, list)), [])
+        meter = shopify_cost(10 + len(items))
+        extensions = {"cost": meter["cost"]}
+        if meter["throttled"]:
+            calls["shopify:throttled"] += 1
+            return {"errors": [{"message": "Throttled", "extensions": {"code": "THROTTLED"}}], "extensions": extensions}
+
+        if "stagedUploadsCreate" in query:
+            calls["shopify:stagedUploadsCreate"] += 1
+            targets = [{
+                "url": f"{base_url(request)}/staged",
+                "resourceUrl": f"{base_url(request)}/staged/{next(ids)}",
+                "parameters": [{"name": "key", "value": item["filename"]}],
+            } for item in items]
+            data = {"stagedUploadsCreate": {"stagedTargets": targets, "userErrors": []}}
+        elif "fileCreate" in query:
+            calls["shopify:fileCreate"] += 1
+            created = []
+            for _ in items:
+                file_id = f"gid://shopify/Video/{next(ids)}"
+                files[file_id] = time.monotonic()
+                created.append({"id": file_id, "fileStatus": "UPLOADED"})
+            data = {"fileCreate": {"files": created, "userErrors": []}}
+        elif "nodes(" in query:
+            calls["shopify:nodes"] += 1
+            now = time.monotonic()
+            data = {"nodes": [
+                {"id": file_id, "fileStatus": "READY" if now - files.get(file_id, now) >= config.file_ready_seconds else "PROCESSING"}
+                for file_id in items
+            ]}
+        elif "fileUpdate" in query:
+            calls["shopify:fileUpdate"] += 1
+            data = {"fileUpdate": {"files": [{"id": item["id"]} for item in items], "userErrors": []}}
+        elif "fileDelete" in query:
+            calls["shopify:fileDelete"] += 1
+            data = {"fileDelete": {"deletedFileIds": items, "userErrors": []}}
+        else:
+            return {"errors": [{"message": "Unsupported operation in fake upstream"}]}
+        return JSONResponse({"data": data, "extensions": extensions}, headers={"X-Request-Id": f"fake-{next(ids)}"})
+
+    @app.post("/staged")
+    async def shopify_staged(request: Request):
+        if (failed := await upstream("shopify:staged")) is not None:
+            return failed
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+        calls["shopify:staged_bytes"] += size
+        return Response(status_code=201)
+
+    # Stripe
+
+    @app.get("/v1/checkout/sessions/{session_id}/line_items")
+    async def stripe_line_items(session_id: str):
+        if (failed := await upstream("stripe:line_items")) is not None:
+            return failed
+        return {
+            "object": "list",
+            "url": f"/v1/checkout/sessions/{session_id}/line_items",
+            "has_more": False,
+            "data": [{
+                "id": f"li_{session_id}",
+                "object": "item",
+                "quantity": 10,
+                "price": {"id": "price_fake", "object": "price", "product": "prod_Su4INfJofTlANV", "unit_amount": 100},
+            }],
+        }
+
+    @app.post("/v1/checkout/sessions")
+    async def stripe_create_session():
+        if (failed := await upstream("stripe:create_session")) is not None:
+            return failed
+        session_id = f"cs_fake_{next(ids)}"
+        return {"id": session_id, "object": "checkout.session", "url": f"https://checkout.stripe.test/{session_id}"}
+
+    @app.get("/_stats")
+    async def stats():
+        return dict(calls)
+
+    @app.post("/_reset")
+    async def reset():
+        calls.clear()
+        return {"ok": True}
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=FakeConfig.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=FakeConfig.jitter_ms)
+    parser.add_argument("--error-rate", type=float, default=FakeConfig.error_rate)
+    parser.add_argument("--task-seconds", type=float, default=FakeConfig.task_seconds)
+    parser.add_argument("--file-ready-seconds", type=float, default=FakeConfig.file_ready_seconds)
+    parser.add_argument("--image-px", type=int, default=FakeConfig.image_px)
+    parser.add_argument("--video-mb", type=float, default=FakeConfig.video_mb)
+    parser.add_argument("--shopify-bucket", type=float, default=FakeConfig.shopify_bucket)
+    parser.add_argument("--shopify-restore", type=float, default=FakeConfig.shopify_restore)
+    parser.add_argument("--kling-max-tasks", type=int, default=FakeConfig.kling_max_tasks)
+    parser.add_argument("--no-callbacks", action="store_true")
+    args = parser.parse_args()
+
+    import uvicorn
+    config = FakeConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        task_seconds=args.task_seconds, file_ready_seconds=args.file_ready_seconds,
+        image_px=args.image_px, video_mb=args.video_mb,
+        shopify_bucket=args.shopify_bucket, shopify_restore=args.shopify_restore,
+        callbacks=not args.no_callbacks, kling_max_tasks=args.kling_max_tasks,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
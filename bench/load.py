@@ -0,0 +1,239 @@
+# Load test for the main request paths against bench/fake_upstream.py. Starts
+# the fake upstream and the app (uvicorn, temp SQLite DB and static dir), then
+# drives, in order:
+#
+#   stripe    POST /api/v1/stripe-hook   signed checkout.session.completed events (also seeds credits,
+#                                        waiting until the background grants land)
+#   generate  POST /api/v1/video
+#   status    PUT  /api/v1/video/{id}
+#   upload    POST /api/v1/upload, then waits for every job to finish
+#
+# and prints p50/p99 latency, throughput, app RSS and upstream call counts per
+# scenario.
+#
+#   python -m bench.load --requests 200 --concurrency 20 --latency-ms 50
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import httpx
+
+WEBHOOK_SECRET = "whsec_bench"
+CALLBACK_SECRET = "bench"
+
+def rss_mb(pid: int) -> Optional[float]:
+    # Includes child processes, so --workers N reports the whole server.
+    total = None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    total = int(line.split()[1]) / 1024
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            for child in f.read().split():
+                total = (total or 0) + (rss_mb(int(child)) or 0)
+    except OSError:
+        pass
+    return total
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def stripe_signature(payload: bytes, secret: str) -> str:
+    ts = int(time.time())
+    digest = hmac.new(secret.encode(), f"{ts}.".encode() + payload, hashlib.sha256).hexdigest()
+    return f"t={ts},v1={digest}"
+
+async def wait_up(url: str, timeout_s: float = 60):
+    deadline = time.monotonic() + timeout_s
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+class Scenario:
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.elapsed = 0.0
+        self.peak_rss: Optional[float] = None
+        self.upstream: Dict[str, int] = {}
+
+    def report(self) -> str:
+        ms = [x * 1000 for x in self.latencies]
+        rps = len(ms) / self.elapsed if self.elapsed else 0
+        rss = f"{self.peak_rss:.0f}" if self.peak_rss is not None else "-"
+        calls = ", ".join(f"{k}={v}" for k, v in sorted(self.upstream.items())) or "-"
+        return (f"{self.name:<9} n={len(ms):<5} err={self.errors:<4} p50={percentile(ms, 0.5):7.1f}ms "
+                f"p99={percentile(ms, 0.99):7.1f}ms {rps:7.1f} req/s  rss_peak={rss}MB\n          upstream: {calls}")
+
+async def drive(scenario: Scenario, pid: int, concurrency: int, jobs: List[Callable[[], Awaitable[httpx.Response]]], upstream: httpx.AsyncClient):
+    await upstream.post("/_reset")
+    sem = asyncio.Semaphore(concurrency)
+    stop = asyncio.Event()
+
+    async def sample():
+        while not stop.is_set():
+            rss = rss_mb(pid)
+            if rss is not None:
+                scenario.peak_rss = max(scenario.peak_rss or 0, rss)
+            await asyncio.sleep(0.1)
+
+    async def one(job):
+        async with sem:
+            start = time.perf_counter()
+            try:
+                r = await job()
+                if r.status_code >= 400:
+                    scenario.errors += 1
+            except httpx.HTTPError:
+                scenario.errors += 1
+            scenario.latencies.append(time.perf_counter() - start)
+
+    sampler = asyncio.create_task(sample())
+    start = time.perf_counter()
+    await asyncio.gather(*(one(job) for job in jobs))
+    scenario.elapsed = time.perf_counter() - start
+    stop.set()
+    await sampler
+    scenario.upstream = (await upstream.get("/_stats")).json()
+
+async def run(args):
+    workdir = tempfile.mkdtemp()
+    fake = f"http://127.0.0.1:{args.fake_port}"
+    base = f"http://127.0.0.1:{args.app_port}"
+    env = {
+        **os.environ,
+        "SQLALCHEMY_DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "STATIC_DIR": os.path.join(workdir, "static"),
+        "PUBLIC_BASE_URL": base,
+        "KLING_AI_API_URL": fake,
+        "SHOPIFY_ADMIN_URL": f"{fake}/{{shop}}",
+        "STRIPE_API_BASE": fake,
+        "STRIPE_SECRET_KEY": "sk_test_bench",
+        "WEBHOOK_SECRET": WEBHOOK_SECRET,
+        "KLING_CALLBACK_SECRET": CALLBACK_SECRET if args.callbacks else "",
+        "KLING_CALLBACK_BASE_URL": base,
+        "KLING_SUBMIT_MAX_RPS": str(args.kling_rps),
+    }
+    fake_cmd = [sys.executable, "-m", "bench.fake_upstream", "--port", str(args.fake_port),
+                "--latency-ms", str(args.latency_ms), "--error-rate", str(args.error_rate),
+                "--task-seconds", str(args.task_seconds), "--video-mb", str(args.video_mb),
+                "--kling-max-tasks", str(args.kling_max_tasks)]
+    app_cmd = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.app_port), "--log-level", "warning", "--workers", str(args.workers)]
+    procs = [subprocess.Popen(fake_cmd, env=env), subprocess.Popen(app_cmd, env=env, stdout=subprocess.DEVNULL)]
+    try:
+        await wait_up(f"{fake}/_stats")
+        await wait_up(f"{base}/")
+        pid = procs[1].pid
+        shops = [f"bench-{i}.myshopify.com" for i in range(args.shops)]
+        results: List[Scenario] = []
+        async with httpx.AsyncClient(base_url=base, timeout=120) as client, httpx.AsyncClient(base_url=fake) as upstream:
+            # stripe: each event buys 10 extra credits for one shop
+            events = max(args.shops, args.requests // 10 + args.shops)
+            def stripe_job(i: int):
+                payload = json.dumps({
+                    "id": f"evt_bench_{i}", "object": "event", "type": "checkout.session.completed",
+                    "data": {"object": {"id": f"cs_bench_{i}", "object": "checkout.session", "client_reference_id": shops[i % len(shops)]}},
+                }).encode()
+                return lambda: client.post("/api/v1/stripe-hook", content=payload, headers={"stripe-signature": stripe_signature(payload, WEBHOOK_SECRET)})
+            scenario = Scenario("stripe")
+            await drive(scenario, pid, args.concurrency, [stripe_job(i) for i in range(events)], upstream)
+            # credits are granted asynchronously after the webhook is acknowledged
+            expected = {shop: 10 * len(range(i, events, len(shops))) for i, shop in enumerate(shops)}
+            start = time.perf_counter()
+            while time.perf_counter() - start < 30:
+                granted = {shop: (await client.post("/api/v1/credits", json={"shop": shop})).json()["extra_credit"] for shop in shops}
+                if all(granted[shop] >= n for shop, n in expected.items()):
+                    break
+                await asyncio.sleep(0.2)
+            print(f"stripe credits granted {time.perf_counter() - start:.1f}s after the last webhook")
+            scenario.upstream = (await upstream.get("/_stats")).json()
+            results.append(scenario)
+
+            task_ids: List[Dict[str, Any]] = []
+            def generate_job(i: int):
+                async def job():
+                    shop = shops[i % len(shops)]
+                    r = await client.post("/api/v1/video", json={
+                        "prompt": "bench", "product_id": f"gid://shopify/Product/{i}", "product_title": f"Bench {i}",
+                        "images": [f"{fake}/media/image-{i}.png", f"{fake}/media/image-{i + 1}.png"], "shop": shop,
+                    })
+                    if r.status_code == 200:
+                        task_ids.append({"id": r.json()["data"]["task_id"], "shop": shop, "i": i})
+                    return r
+                return job
+            scenario = Scenario("generate")
+            await drive(scenario, pid, args.concurrency, [generate_job(i) for i in range(args.requests)], upstream)
+            results.append(scenario)
+
+            scenario = Scenario("status")
+            await drive(scenario, pid, args.concurrency, [
+                (lambda t=t: client.put(f"/api/v1/video/{t['id']}")) for t in task_ids for _ in range(args.status_reads)
+            ], upstream)
+            results.append(scenario)
+
+            scenario = Scenario("upload")
+            start = time.perf_counter()
+            await drive(scenario, pid, args.concurrency, [
+                (lambda t=t: client.post("/api/v1/upload", json={
+                    "shop": t["shop"], "token": "bench", "video_id": t["id"], "video_url": f"{fake}/media/video.mp4",
+                    "product_id": f"gid://shopify/Product/{t['i']}", "product_title": f"Bench {t['i']}",
+                })) for t in task_ids
+            ], upstream)
+            pending = {t["id"] for t in task_ids}
+            while pending and time.perf_counter() - start < args.upload_timeout_s:
+                for task_id in list(pending):
+                    status = (await client.get(f"/api/v1/upload/{task_id}")).json()
+                    if status["status"] in ("done", "failed"):
+                        pending.discard(task_id)
+                        scenario.errors += status["status"] == "failed"
+                await asyncio.sleep(0.5)
+            scenario.upstream = (await upstream.get("/_stats")).json()
+            results.append(scenario)
+            print(f"upload jobs finished in {time.perf_counter() - start:.1f}s ({len(pending)} still pending)")
+
+        for scenario in results:
+            print(scenario.report())
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--shops", type=int, default=5)
+    parser.add_argument("--status-reads", type=int, default=5, help="PUT /video/{id} calls per generated video")
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--task-seconds", type=float, default=5)
+    parser.add_argument("--video-mb", type=float, default=2)
+    parser.add_argument("--kling-rps", type=float, default=50)
+    parser.add_argument("--upload-timeout-s", type=float, default=300)
+    parser.add_argument("--kling-max-tasks", type=int, default=0, help="fake Kling plan concurrency (429 above it); match KLING_MAX_IN_FLIGHT")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers sharing the one SQLite DB")
+    parser.add_argument("--no-callbacks", dest="callbacks", action="store_false")
+    parser.add_argument("--fake-port", type=int, default=9100)
+    parser.add_argument("--app-port", type=int, default=8100)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
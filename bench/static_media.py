@@ -0,0 +1,140 @@
+# Throughput of /static: Starlette's plain StaticFiles (the original mount)
+# against MediaStaticFiles, over a temp directory laid out like the image and
+# thumbnail stores. Each server runs in its own uvicorn process; scenarios:
+#
+#   full      GET of a product PNG, Accept: */*
+#   revalid   GET with If-None-Match (browser revalidation; 304 when supported)
+#   range     GET of the first 64 KiB (Range: bytes=0-65535)
+#   webp      GET with Accept: image/avif,image/webp,*/* (MediaStaticFiles serves a variant)
+#
+#   python -m bench.static_media --requests 2000 --concurrency 32 --files 50
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+import cv2
+import httpx
+import numpy as np
+from bench.load import percentile, wait_up
+
+def seed(root: str, files: int, px: int) -> List[str]:
+    os.makedirs(os.path.join(root, "images"), exist_ok=True)
+    names = []
+    for i in range(files):
+        # Smooth gradients plus noise: compresses like a product photo, not like a flat fill.
+        y, x = np.mgrid[0:px, 0:px]
+        img = np.dstack([(x + i) % 256, (y * 2) % 256, (x + y) % 256]).astype(np.uint8)
+        img = cv2.add(img, np.random.randint(0, 4, img.shape, dtype=np.uint8))
+        name = f"{i:064x}"
+        cv2.imwrite(os.path.join(root, "images", f"{name}.png"), img)
+        names.append(f"images/{name}.png")
+    return names
+
+def serve(kind: str, directory: str, port: int):
+    import uvicorn
+    from fastapi import FastAPI
+    from fastapi.staticfiles import StaticFiles
+    from app.core.static import MediaStaticFiles, MediaVariants
+
+    app = FastAPI()
+    if kind == "plain":
+        app.mount("/static", StaticFiles(directory=directory), name="static")
+    else:
+        variants = MediaVariants(directory)
+        app.mount("/static", MediaStaticFiles(directory=directory, variants=variants), name="static")
+    uvicorn.run(app, port=port, log_level="warning")
+
+async def settle(directory: str, timeout_s: float):
+    # Waits until background variant builds stop producing files.
+    deadline = time.monotonic() + timeout_s
+    last, stable_since = -1, time.monotonic()
+    while time.monotonic() < deadline:
+        count = sum(len(files) for _, _, files in os.walk(directory))
+        if count != last:
+            last, stable_since = count, time.monotonic()
+        elif time.monotonic() - stable_since > 3:
+            return
+        await asyncio.sleep(0.5)
+
+async def scenario(client: httpx.AsyncClient, paths: List[str], requests: int, concurrency: int,
+                   headers: Dict[str, str], etags: Optional[Dict[str, str]] = None) -> str:
+    sem = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    received = 0
+
+    async def one(i: int):
+        nonlocal received
+        path = paths[i % len(paths)]
+        h = dict(headers)
+        if etags is not None:
+            h["If-None-Match"] = etags[path]
+        async with sem:
+            start = time.perf_counter()
+            r = await client.get(path, headers=h)
+            latencies.append(time.perf_counter() - start)
+        statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+        received += len(r.content)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    ms = [x * 1000 for x in latencies]
+    codes = ",".join(f"{k}x{v}" for k, v in sorted(statuses.items()))
+    return (f"{requests / elapsed:8.0f} req/s  p50={percentile(ms, 0.5):6.1f}ms p99={percentile(ms, 0.99):6.1f}ms  "
+            f"{received / requests / 1024:7.1f} KiB/resp  [{codes}]")
+
+async def run(args):
+    root = tempfile.mkdtemp()
+    names = seed(root, args.files, args.px)
+    print(f"{args.files} PNGs, {sum(os.path.getsize(os.path.join(root, n)) for n in names) / args.files / 1024:.0f} KiB average")
+    servers = {"plain": args.port, "media": args.port + 1}
+    procs = [subprocess.Popen([sys.executable, "-m", "bench.static_media", "--serve", kind, "--dir", root, "--port", str(port)])
+             for kind, port in servers.items()]
+    try:
+        for port in servers.values():
+            await wait_up(f"http://127.0.0.1:{port}/static/{names[0]}")
+        paths = [f"/static/{n}" for n in names]
+        limits = httpx.Limits(max_connections=args.concurrency)
+        for kind, port in servers.items():
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+                accept_modern = {"Accept": "image/avif,image/webp,*/*"}
+                # Warm up: page cache, and on the media server the variant builds.
+                for path in paths:
+                    await client.get(path, headers=accept_modern)
+                if kind == "media":
+                    await settle(os.path.join(root, "variants"), args.variant_warmup_s)
+                etags = {path: (await client.get(path)).headers["etag"] for path in paths}
+                print(f"\n{kind}")
+                print("  full    ", await scenario(client, paths, args.requests, args.concurrency, {"Accept": "*/*"}))
+                print("  revalid ", await scenario(client, paths, args.requests, args.concurrency, {"Accept": "*/*"}, etags))
+                print("  range   ", await scenario(client, paths, args.requests, args.concurrency, {"Range": "bytes=0-65535"}))
+                print("  webp    ", await scenario(client, paths, args.requests, args.concurrency, accept_modern))
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--px", type=int, default=768)
+    parser.add_argument("--variant-warmup-s", type=float, default=120, help="longest wait for background variant builds")
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--serve", choices=["plain", "media"], help=argparse.SUPPRESS)
+    parser.add_argument("--dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve, args.dir, args.port)
+    else:
+        asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
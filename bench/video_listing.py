@@ -0,0 +1,106 @@
+# Compares the old unbounded GET /video query with the keyset-paginated one on
+# a seeded SQLite database.
+#
+#   python -m bench.video_listing --rows 100000 --shops 20
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import sessionmaker
+from app.crud.video import SUMMARY_COLUMNS, list_videos
+from app.db.base import Base
+from app.db.models.video import Video
+
+def seed(engine, rows: int, shops: int):
+    start = datetime.now(timezone.utc) - timedelta(days=365)
+    batch = []
+    with engine.begin() as conn:
+        for i in range(rows):
+            batch.append({
+                "id": f"task-{i:08d}",
+                "product_id": f"gid://shopify/Product/{random.randint(1, 5000)}",
+                "product_title": f"Product {i}",
+                "shop": f"shop-{i % shops}.myshopify.com",
+                "image1": f"https://lookmotion.ai/static/images/{i:064x}.png",
+                "image2": "", "image3": "", "image4": "",
+                "prompt": "A slow pan across the product on a white background" * 4,
+                "video_url": f"https://cdn.klingai.com/{i}.mp4",
+                "thumbnail": f"{i:064x}",
+                "status": random.choice(["completed", "uploaded", "processing", "failed"]),
+                "duration": 5,
+                "created_at": start + timedelta(seconds=i * 300),
+            })
+            if len(batch) == 5000:
+                conn.execute(insert(Video), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(Video), batch)
+
+def list_query(db, shop: str, limit: int = 50):
+    return (
+        db.query(*SUMMARY_COLUMNS).filter(Video.shop == shop)
+        .order_by(Video.created_at.desc(), Video.id.desc()).limit(limit + 1)
+    )
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--shops", type=int, default=20)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    t = time.perf_counter()
+    seed(engine, args.rows, args.shops)
+    print(f"seeded {args.rows} rows across {args.shops} shops in {time.perf_counter() - t:.1f}s ({path})")
+
+    db = sessionmaker(bind=engine)()
+    shop = "shop-0.myshopify.com"
+
+    def unbounded():
+        db.query(Video).filter(Video.shop == shop).order_by(Video.created_at.desc()).all()
+        db.expunge_all()
+
+    def first_page():
+        list_videos(db, shop, args.page_size)
+
+    _, cursor = list_videos(db, shop, args.page_size * 20)
+    def deep_page():
+        list_videos(db, shop, args.page_size, cursor)
+
+    def walk_all():
+        next_cursor, pages = None, 0
+        while True:
+            _, next_cursor = list_videos(db, shop, args.page_size, next_cursor)
+            pages += 1
+            if not next_cursor:
+                return pages
+
+    print(f"unbounded full-row query:   {timed(unbounded, args.repeat):8.2f} ms")
+    print(f"keyset first page:          {timed(first_page, args.repeat):8.2f} ms")
+    print(f"keyset page 21:             {timed(deep_page, args.repeat):8.2f} ms")
+    print(f"keyset walk of all pages:   {timed(walk_all, 1):8.2f} ms")
+    # The index covers (shop, created_at, id) only: it gives the order and the
+    # keyset seek, and each of the page's rows is then read from the table for
+    # the other summary columns.
+    sql = str(list_query(db, shop).statement.compile(db.bind, compile_kwargs={"literal_binds": True}))
+    print("query plan:")
+    for row in db.execute(text(f"EXPLAIN QUERY PLAN {sql}")):
+        print("  ", row[-1])
+
+if __name__ == "__main__":
+    main()
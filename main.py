@@ -1,11 +1,62 @@
-from pathlib import Path
-from fastapi import FastAPI
+import hmac
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse
 from app.api.v1.routes import router as v1_router
+from app.core.bulk import bulk_generator
+from app.core.constants import DB_ASYNC, KLING_POLLER_ENABLED, METRICS_TOKEN, STATIC_DIR
+from app.core.executor import executor_stats, run_db, shutdown_executors
+from app.core.file_status import file_status_poller
+from app.core.http import POOLS, close_pools, pool_stats
+from app.core.kling_auth import kling_keys
+from app.core.kling_callbacks import kling_callbacks
+from app.core.kling_scheduler import kling_scheduler
+from app.core.metrics import registry
+from app.core.response_cache import response_cache
+from app.core.shopify import shopify_budgets
+from app.core.image_store import image_store
+from app.core.static import MediaStaticFiles, media_variants
+from app.core.stripe_events import stripe_event_processor
+from app.core.thumbnail_store import thumbnail_store
+from app.core.uploads import upload_queue
+from app.core.poller import poller
 from app.db.init_db import init_db
+from app.db.session import async_engine, db_stats, dispose_engines
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if DB_ASYNC:
+        async_engine()  # fail at startup, not on the first request, when the driver is missing
+    migrated = await run_db(thumbnail_store.migrate_inline_once)
+    if migrated:
+        print(f"Moved {migrated} inline thumbnails to the thumbnail store")
+    kling_scheduler.start()
+    if KLING_POLLER_ENABLED:
+        poller.start()
+    image_store.start()
+    thumbnail_store.start()
+    media_variants.start()
+    upload_queue.start()
+    kling_callbacks.start()
+    stripe_event_processor.start()
+    yield
+    await stripe_event_processor.stop()
+    await bulk_generator.stop()
+    await upload_queue.stop()
+    await poller.stop()
+    await kling_callbacks.stop()
+    await kling_scheduler.stop()
+    await image_store.stop()
+    await thumbnail_store.stop()
+    await media_variants.stop()
+    await close_pools()
+    await dispose_engines()
+    shutdown_executors()
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(v1_router, prefix="/api/v1")
 
 app.add_middleware(
@@ -13,13 +64,101 @@ app.add_middleware(
     allow_origins=['*'],  # Use ["*"] temporarily for testing
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
-static_dir = Path(__file__).parent / "static"
-app.mount("/static", StaticFiles(directory=static_dir), name="static")
+http_requests_total = registry.counter("http_requests_total", "Requests served, by route template and status.")
+http_request_seconds = registry.histogram("http_request_duration_seconds", "Time to produce the response headers.")
+http_in_flight = registry.gauge("http_requests_in_flight", "Requests currently being handled.")
+pool_in_flight = registry.gauge("upstream_pool_in_flight", "Upstream requests holding a connection slot.")
+pool_capacity = registry.gauge("upstream_pool_max_connections", "Connection limit of each upstream pool.")
+executor_queued = registry.gauge("executor_queued", "Jobs waiting for an executor thread.")
+executor_workers = registry.gauge("executor_workers", "Executor thread count.")
+upload_jobs = registry.gauge("upload_jobs", "Shopify upload jobs by state.")
+kling_tracked = registry.gauge("kling_tasks_tracked", "Kling tasks the poller is tracking.")
+kling_key_in_flight = registry.gauge("kling_key_in_flight", "Kling calls in flight per account (by position in the key list).")
+file_status_waiting = registry.gauge("file_status_waiting", "Uploads waiting for Shopify to mark a file READY.")
+shopify_budget_shops = registry.gauge("shopify_budget_shops", "Shops with a locally tracked Shopify GraphQL budget.")
+shopify_budget_min_available = registry.gauge("shopify_budget_min_available", "Fewest Shopify GraphQL points available to any tracked shop.")
+bulk_jobs_running = registry.gauge("bulk_jobs_running", "Bulk generation jobs in progress.")
+kling_scheduler_in_flight = registry.gauge("kling_scheduler_in_flight", "Kling tasks holding a scheduler slot.")
+kling_scheduler_queued = registry.gauge("kling_scheduler_queued", "Kling submissions waiting for a slot.")
+response_cache_entries = registry.gauge("response_cache_entries", "Cached dashboard responses held in memory.")
+db_pool_checked_out = registry.gauge("db_pool_checked_out", "DB connections currently checked out, per engine.")
+db_pool_size = registry.gauge("db_pool_size", "DB pool size (excluding overflow), per engine.")
+stripe_events_total = registry.gauge("stripe_events_handled", "Stripe webhook events handled by this process, by outcome.")
+
+@registry.collector
+def collect_state():
+    for pool in POOLS:
+        pool_in_flight.set(pool.in_flight, pool=pool.name)
+        pool_capacity.set(pool.max_connections, pool=pool.name)
+    for name, stats in executor_stats().items():
+        executor_queued.set(stats["queued"], pool=name)
+        executor_workers.set(stats["workers"], pool=name)
+    for state, count in upload_queue.stats().items():
+        upload_jobs.set(count, state=state)
+    kling_tracked.set(poller.stats()["tracked"])
+    for key in kling_keys.stats()["keys"]:
+        kling_key_in_flight.set(key["in_flight"], key=key["key"])
+    file_status_waiting.set(sum(file_status_poller.stats().values()))
+    budgets = shopify_budgets()
+    shopify_budget_shops.set(len(budgets))
+    if budgets:
+        shopify_budget_min_available.set(min(budget["available"] for budget in budgets.values()))
+    bulk_jobs_running.set(bulk_generator.stats()["running"])
+    response_cache_entries.set(response_cache.stats()["entries"])
+    scheduler = kling_scheduler.stats()
+    kling_scheduler_in_flight.set(scheduler["in_flight"])
+    kling_scheduler_queued.set(scheduler["queued"])
+    for name, stats in db_stats().items():
+        if "checkedout" in stats:
+            db_pool_checked_out.set(stats["checkedout"], engine=name)
+            db_pool_size.set(stats["size"], engine=name)
+    for outcome, count in stripe_event_processor.stats().items():
+        stripe_events_total.set(count, outcome=outcome)
+
+@app.middleware("http")
+async def record_request(request: Request, call_next):
+    http_in_flight.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = getattr(route, "path", None) or ("/static" if request.url.path.startswith("/static/") else "unmatched")
+        http_request_seconds.observe(time.perf_counter() - start, method=request.method, route=path)
+        http_requests_total.inc(method=request.method, route=path, status=status)
+        http_in_flight.dec()
+
+app.mount("/static", MediaStaticFiles(directory=STATIC_DIR, variants=media_variants), name="static")
 
 init_db()
 
 @app.get("/")
 def welcome():
-    return "Welcome"
\ No newline at end of file
+    return "Welcome"
+
+def require_metrics_token(authorization: Optional[str] = Header(None)):
+    # Diagnostics name shops and upstream accounts; without a token configured
+    # they are not served at all.
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404)
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+
+@app.get("/pools", dependencies=[Depends(require_metrics_token)])
+def pools():
+    return {**pool_stats(), "kling_keys": kling_keys.stats(), "kling_scheduler": kling_scheduler.stats(), "db": db_stats()}
+
+@app.get("/shopify-budgets", dependencies=[Depends(require_metrics_token)])
+def budgets():
+    return shopify_budgets()
+
+@app.get("/metrics", dependencies=[Depends(require_metrics_token)])
+def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,72 @@
+# The app reads its settings at import time, so the environment is set up
+# here before any test imports it: a throwaway SQLite DB and static dir, and
+# Kling pointed at bench/fake_upstream.py, which the `upstream` fixture runs
+# on a local port. The `live_app` fixture serves main:app on another port so
+# the fake can deliver task callbacks to it.
+import os
+import tempfile
+import time
+from servers import free_port, serve
+
+UPSTREAM_PORT = free_port()
+APP_PORT = free_port()
+UPSTREAM_URL = f"http://127.0.0.1:{UPSTREAM_PORT}"
+APP_URL = f"http://127.0.0.1:{APP_PORT}"
+CALLBACK_SECRET = "test-callback-secret"
+METRICS_TOKEN = "test-metrics-token"
+
+_tmp = tempfile.mkdtemp(prefix="adgen-tests-")
+os.environ.update({
+    "SQLALCHEMY_DATABASE_URL": f"sqlite:///{_tmp}/test.db",
+    "STATIC_DIR": os.path.join(_tmp, "static"),
+    "PUBLIC_BASE_URL": APP_URL,
+    "KLING_AI_API_URL": UPSTREAM_URL,
+    "KLING_CALLBACK_BASE_URL": APP_URL,
+    "KLING_CALLBACK_SECRET": CALLBACK_SECRET,
+    "METRICS_TOKEN": METRICS_TOKEN,
+    "KLING_POLLER_ENABLED": "0",
+    "ACCESS_KEY": "test-access-key",
+    "SECRET_KEY": "test-secret-key",
+    "KLING_SUBMIT_MAX_RPS": "1000",
+    "KLING_MAX_IN_FLIGHT": "1000",
+    "KLING_QUEUE_MAX_PER_SHOP": "1000",
+    "THUMBNAIL_RETRY_INTERVAL_S": "0.5",
+})
+os.makedirs(os.environ["STATIC_DIR"], exist_ok=True)
+
+import pytest
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    from app.db.init_db import init_db
+    init_db()
+
+@pytest.fixture(scope="session")
+def upstream():
+    from bench.fake_upstream import FakeConfig, create_app
+    config = FakeConfig(latency_ms=5, jitter_ms=0, task_seconds=1, image_px=64, video_mb=0.2)
+    with serve(create_app(config), UPSTREAM_PORT):
+        yield UPSTREAM_URL
+
+@pytest.fixture(scope="session")
+def live_app(upstream):
+    from main import app
+    with serve(app, APP_PORT, lifespan="on"):
+        yield APP_URL
+
+@pytest.fixture
+def shop_with_credits():
+    # A fresh shop per test, holding `n` extra credits.
+    from app.db.models.credits import Credits
+    from app.db.session import SessionLocal
+
+    def make(n: int) -> str:
+        shop = f"shop-{time.monotonic_ns()}.myshopify.com"
+        db = SessionLocal()
+        try:
+            db.add(Credits(shop_name=shop, extra_credit=n))
+            db.commit()
+        finally:
+            db.close()
+        return shop
+    return make
@@ -0,0 +1,29 @@
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+import uvicorn
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@contextmanager
+def serve(app, port: int, lifespan: str = "off") -> Iterator[str]:
+    # Runs an ASGI app on its own thread and event loop, so a handler that
+    # blocks the app's loop cannot stall the server it is waiting on.
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan=lifespan))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 30
+    while not server.started:
+        if not thread.is_alive() or time.monotonic() > deadline:
+            raise RuntimeError(f"Server on port {port} did not start")
+        time.sleep(0.02)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=30)
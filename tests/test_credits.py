@@ -0,0 +1,60 @@
+# Parallel generations against one shop: every credit is spent at most once,
+# and each accepted generation leaves a reserve and a commit in the ledger.
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from sqlalchemy import func
+from app.crud.credits import reserve_credits
+from app.db.models.credits import CreditLedger, Credits
+from app.db.models.video import Video
+from app.db.session import SessionLocal
+
+def _balance(shop: str) -> int:
+    db = SessionLocal()
+    try:
+        return db.query(Credits.extra_credit).filter(Credits.shop_name == shop).scalar()
+    finally:
+        db.close()
+
+def test_parallel_generations_never_overdraw(live_app, upstream, shop_with_credits):
+    credits, requests = 40, 300
+    shop = shop_with_credits(credits)
+
+    async def run():
+        async with httpx.AsyncClient(base_url=live_app, timeout=120, limits=httpx.Limits(max_connections=requests)) as client:
+            return await asyncio.gather(*(client.post("/api/v1/video", json={
+                "prompt": "spin", "product_id": f"p{i}", "product_title": "Shoe",
+                "images": [f"{upstream}/media/image-{i}.png"], "shop": shop,
+            }) for i in range(requests)))
+
+    statuses = [r.status_code for r in asyncio.run(run())]
+    assert statuses.count(200) == credits
+    assert statuses.count(403) == requests - credits
+    assert _balance(shop) == 0
+
+    db = SessionLocal()
+    try:
+        entries = dict(db.query(CreditLedger.entry_type, func.sum(CreditLedger.delta)).filter(CreditLedger.shop_name == shop).group_by(CreditLedger.entry_type).all())
+        commits = db.query(CreditLedger).filter(CreditLedger.shop_name == shop, CreditLedger.entry_type == "commit").count()
+        videos = db.query(Video).filter(Video.shop == shop).count()
+    finally:
+        db.close()
+    assert entries == {"reserve": -credits, "commit": 0}
+    assert commits == videos == credits
+
+def test_concurrent_reservations_from_separate_sessions(shop_with_credits):
+    # Each call runs on its own thread and connection, as separate workers would.
+    credits, attempts = 50, 200
+    shop = shop_with_credits(credits)
+
+    def reserve(_) -> bool:
+        db = SessionLocal()
+        try:
+            return reserve_credits(db, shop) is not None
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        granted = sum(pool.map(reserve, range(attempts)))
+    assert granted == credits
+    assert _balance(shop) == 0
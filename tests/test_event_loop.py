@@ -0,0 +1,53 @@
+# A product image host that takes SLOW_S to answer must only delay the
+# requests that fetch from it: other requests keep being served, and
+# concurrent generations overlap instead of queueing behind each other.
+import asyncio
+import time
+import cv2
+import httpx
+import numpy as np
+from fastapi import FastAPI
+from fastapi.responses import Response
+from servers import free_port, serve
+
+SLOW_S = 1.0
+GENERATIONS = 5
+
+def slow_image_host() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/slow/{n}.png")
+    async def slow(n: int):
+        await asyncio.sleep(SLOW_S)
+        img = np.full((64, 64, 3), n, dtype=np.uint8)
+        return Response(cv2.imencode(".png", img)[1].tobytes(), media_type="image/png")
+    return app
+
+def test_slow_image_host_does_not_block_other_requests(live_app, shop_with_credits):
+    shop = shop_with_credits(GENERATIONS)
+
+    async def run(host: str):
+        async with httpx.AsyncClient(base_url=live_app, timeout=30) as client:
+            async def generate(i: int) -> httpx.Response:
+                return await client.post("/api/v1/video", json={
+                    "prompt": "spin", "product_id": f"p{i}", "product_title": "Shoe",
+                    "images": [f"{host}/slow/{i}.png"], "shop": shop,
+                })
+
+            async def probe() -> float:
+                await asyncio.sleep(SLOW_S / 4)  # generations are waiting on the image host by now
+                start = time.perf_counter()
+                r = await client.get("/")
+                assert r.status_code == 200
+                return time.perf_counter() - start
+
+            start = time.perf_counter()
+            *responses, probe_s = await asyncio.gather(*(generate(i) for i in range(GENERATIONS)), probe())
+            return responses, probe_s, time.perf_counter() - start
+
+    with serve(slow_image_host(), free_port()) as host:
+        responses, probe_s, total_s = asyncio.run(run(host))
+
+    assert [r.status_code for r in responses] == [200] * GENERATIONS, [r.text for r in responses]
+    assert probe_s < SLOW_S / 2
+    assert total_s < SLOW_S * 2.5  # serialized fetches would take GENERATIONS * SLOW_S
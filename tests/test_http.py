@@ -0,0 +1,25 @@
+import asyncio
+import httpx
+from app.core.http import UpstreamPool
+
+def test_host_slots_are_dropped_when_idle():
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(0.01)
+        return httpx.Response(200)
+
+    async def run():
+        pool = UpstreamPool("test", 10, 2, timeout=5.0)
+        pool._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            requests = [pool.request("GET", f"https://shop-{i % 20}.myshopify.com/") for i in range(100)]
+            peak = asyncio.gather(*requests)
+            await asyncio.sleep(0)
+            assert len(pool._host_slots) == 20
+            assert all(r.status_code == 200 for r in await peak)
+            return pool
+        finally:
+            await pool.close()
+
+    pool = asyncio.run(run())
+    assert pool._host_slots == {} and pool._host_users == {}
+    assert pool.stats()["hosts_in_flight"] == {}
@@ -0,0 +1,91 @@
+# Duplicate POST /video requests are answered from the first submission:
+# from memory while it is recent, from the Video row after that (another
+# worker, a restart). Clearing the coalescer simulates the second case.
+import httpx
+from app.api.v1.routes import generate_coalescer
+from app.db.models.video import Video
+from app.db.session import SessionLocal
+
+def _generate(app_url: str, upstream: str, shop: str, key=None, prompt: str = "spin", image: int = 1) -> httpx.Response:
+    return httpx.post(f"{app_url}/api/v1/video", timeout=30, headers={"Idempotency-Key": key} if key else {}, json={
+        "prompt": prompt, "product_id": "p1", "product_title": "Shoe",
+        "images": [f"{upstream}/media/image-{image}.png"], "shop": shop,
+    })
+
+def _balance(app_url: str, shop: str) -> int:
+    r = httpx.post(f"{app_url}/api/v1/credits", json={"shop": shop})
+    assert r.status_code == 200, r.text
+    return r.json()["extra_credit"]
+
+def test_idempotency_key_replays_the_first_submission(live_app, upstream, shop_with_credits):
+    shop = shop_with_credits(2)
+    first = _generate(live_app, upstream, shop, key="k1")
+    again = _generate(live_app, upstream, shop, key="k1")
+    generate_coalescer._recent.clear()
+    stored = _generate(live_app, upstream, shop, key="k1")
+
+    task_id = first.json()["data"]["task_id"]
+    assert again.json()["data"]["task_id"] == stored.json()["data"]["task_id"] == task_id
+    assert again.headers["Idempotent-Replayed"] == stored.headers["Idempotent-Replayed"] == "true"
+    assert _balance(live_app, shop) == 1
+
+def test_idempotency_key_with_another_body_is_rejected(live_app, upstream, shop_with_credits):
+    shop = shop_with_credits(2)
+    assert _generate(live_app, upstream, shop, key="k2").status_code == 200
+    assert _generate(live_app, upstream, shop, key="k2", prompt="zoom").status_code == 422
+    generate_coalescer._recent.clear()
+    assert _generate(live_app, upstream, shop, key="k2", prompt="zoom").status_code == 422
+    assert _balance(live_app, shop) == 1
+
+def test_stored_duplicate_is_answered_without_credits(live_app, upstream, shop_with_credits):
+    shop = shop_with_credits(1)
+    first = _generate(live_app, upstream, shop)
+    assert first.status_code == 200
+    generate_coalescer._recent.clear()
+
+    duplicate = _generate(live_app, upstream, shop)  # balance is 0 now
+    assert duplicate.status_code == 200, duplicate.text
+    assert duplicate.json()["data"]["task_id"] == first.json()["data"]["task_id"]
+    assert _balance(live_app, shop) == 0
+
+def test_resubmit_without_key_ignores_the_title(live_app, upstream, shop_with_credits):
+    shop = shop_with_credits(1)
+    first = _generate(live_app, upstream, shop)
+    renamed = httpx.post(f"{live_app}/api/v1/video", timeout=30, json={
+        "prompt": "spin", "product_id": "p1", "product_title": "Running shoe",
+        "images": [f"{upstream}/media/image-1.png"], "shop": shop,
+    })
+    assert renamed.status_code == 200, renamed.text
+    assert renamed.json()["data"]["task_id"] == first.json()["data"]["task_id"]
+    assert _balance(live_app, shop) == 0
+
+def _mark_failed(task_id: str):
+    db = SessionLocal()
+    try:
+        db.query(Video).filter(Video.id == task_id).update({"status": "failed"})
+        db.commit()
+    finally:
+        db.close()
+
+def test_failed_task_can_be_regenerated_without_key(live_app, upstream, shop_with_credits):
+    shop = shop_with_credits(3)
+    first = _generate(live_app, upstream, shop, image=2)
+    _mark_failed(first.json()["data"]["task_id"])
+
+    retry = _generate(live_app, upstream, shop, image=2)  # answered from memory before the fix
+    generate_coalescer._recent.clear()
+    _mark_failed(retry.json()["data"]["task_id"])
+    again = _generate(live_app, upstream, shop, image=2)  # answered from the row before the fix
+
+    ids = {r.json()["data"]["task_id"] for r in (first, retry, again)}
+    assert len(ids) == 3
+    assert _balance(live_app, shop) == 0
+
+def test_failed_task_is_replayed_for_its_idempotency_key(live_app, upstream, shop_with_credits):
+    shop = shop_with_credits(2)
+    first = _generate(live_app, upstream, shop, key="k3")
+    _mark_failed(first.json()["data"]["task_id"])
+    generate_coalescer._recent.clear()
+    again = _generate(live_app, upstream, shop, key="k3")
+    assert again.json()["data"]["task_id"] == first.json()["data"]["task_id"]
+    assert _balance(live_app, shop) == 1
@@ -0,0 +1,56 @@
+# End to end against bench/fake_upstream.py: the fake Kling posts task
+# results to the app's callback URL, and thumbnails missing from completed
+# videos are filled in by the retry sweep.
+import os
+import time
+import httpx
+from app.core.thumbnail_store import is_thumbnail_key, thumbnail_store
+from app.crud.video import build_video
+from app.db.models.video import Video
+from app.db.session import SessionLocal
+
+def _wait_for_thumbnail(video_id: str, timeout_s: float = 30) -> Video:
+    deadline = time.monotonic() + timeout_s
+    while True:
+        db = SessionLocal()
+        try:
+            video = db.query(Video).filter(Video.id == video_id).first()
+            if video and is_thumbnail_key(video.thumbnail):
+                return video
+        finally:
+            db.close()
+        assert time.monotonic() < deadline, f"no thumbnail for {video_id}"
+        time.sleep(0.2)
+
+def test_callback_completes_video_and_extracts_thumbnail(live_app, upstream, shop_with_credits):
+    shop = shop_with_credits(1)
+    r = httpx.post(f"{live_app}/api/v1/video", timeout=30, json={
+        "prompt": "spin", "product_id": "p1", "product_title": "Shoe",
+        "images": [f"{upstream}/media/image-1.png"], "shop": shop,
+    })
+    assert r.status_code == 200, r.text
+    task_id = r.json()["data"]["task_id"]
+
+    video = _wait_for_thumbnail(task_id)
+    assert video.status == "completed"
+    assert video.video_url == f"{upstream}/media/video.mp4"
+    assert os.path.exists(thumbnail_store.path(video.thumbnail, "sm"))
+    assert httpx.get(f"{upstream}/_stats").json().get("kling:status", 0) == 0  # no polling needed
+
+def test_callback_rejects_a_wrong_token(live_app):
+    r = httpx.post(f"{live_app}/api/v1/kling/callback", params={"token": "wrong"}, json={"task_id": "x", "task_status": "succeed"})
+    assert r.status_code == 401
+
+def test_missing_thumbnail_is_retried(live_app, upstream):
+    db = SessionLocal()
+    try:
+        video = build_video(f"retry-{time.monotonic_ns()}", ["image"], "spin", "p1", "Shoe", "retry-shop")
+        video.status = "completed"
+        video.video_url = f"{upstream}/media/video.mp4"
+        db.add(video)
+        db.commit()
+        video_id = video.id
+    finally:
+        db.close()
+
+    assert is_thumbnail_key(_wait_for_thumbnail(video_id).thumbnail)
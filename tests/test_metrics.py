@@ -0,0 +1,22 @@
+# Diagnostics need the metrics token and never name shops, hosts or keys.
+import httpx
+from conftest import METRICS_TOKEN
+
+def test_diagnostics_require_the_token(live_app):
+    for path in ("/metrics", "/pools", "/shopify-budgets"):
+        assert httpx.get(live_app + path).status_code == 401
+        assert httpx.get(live_app + path, headers={"Authorization": "Bearer wrong"}).status_code == 401
+        assert httpx.get(live_app + path, headers={"Authorization": f"Bearer {METRICS_TOKEN}"}).status_code == 200
+
+def test_metrics_labels_are_bounded(live_app, upstream, shop_with_credits):
+    shop = shop_with_credits(1)
+    r = httpx.post(f"{live_app}/api/v1/video", timeout=30, json={
+        "prompt": "spin", "product_id": "p1", "product_title": "Shoe",
+        "images": [f"{upstream}/media/image-7.png"], "shop": shop,
+    })
+    assert r.status_code == 200, r.text
+
+    body = httpx.get(f"{live_app}/metrics", headers={"Authorization": f"Bearer {METRICS_TOKEN}"}).text
+    assert 'host="' not in body
+    assert shop not in body
+    assert "test-access-key"[:6] not in body
@@ -0,0 +1,41 @@
+import asyncio
+from app.core import poller as poller_module
+from app.core.kling_callbacks import kling_callbacks
+from app.core.poller import KlingPoller
+from app.core.thumbnail_store import thumbnail_store
+from app.crud.video import build_video, create_videos
+from app.db.models.video import Video
+from app.db.session import SessionLocal
+
+def test_polled_result_is_applied_when_thumbnail_extraction_fails(monkeypatch):
+    task_id = "poll-thumbnail-fails"
+    db = SessionLocal()
+    try:
+        create_videos(db, [build_video(task_id, ["https://example.com/a.png"], "spin", "p1", "Shoe", "poll-shop")])
+    finally:
+        db.close()
+
+    async def fetch_task(task_id, account=None):
+        return {"task_id": task_id, "task_status": "succeed", "task_result": {"videos": [{"url": "https://example.com/v.mp4", "duration": "5"}]}}
+
+    async def store_from_video(url):
+        raise ValueError("no frame")
+
+    monkeypatch.setattr(poller_module, "fetch_task", fetch_task)
+    monkeypatch.setattr(thumbnail_store, "store_from_video", store_from_video)
+
+    async def poll():
+        await KlingPoller()._poll_one(task_id, 0)
+        await asyncio.gather(*kling_callbacks._thumbnails.values(), return_exceptions=True)
+    asyncio.run(poll())
+
+    db = SessionLocal()
+    try:
+        video = db.get(Video, task_id)
+        assert video.status == "completed"
+        assert video.video_url == "https://example.com/v.mp4"
+        assert not video.thumbnail
+    finally:
+        db.close()
+    assert kling_callbacks._failures.pop(task_id) == 1  # left to the retry sweep
+    kling_callbacks._retry_at.pop(task_id, None)
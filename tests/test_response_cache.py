@@ -0,0 +1,30 @@
+import asyncio
+from starlette.requests import Request
+from app.core.response_cache import CREDITS, ResponseCache
+
+def _request(if_none_match: str = None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/credits", "headers": headers, "query_string": b""})
+
+def _serve(cache: ResponseCache, builds: list, if_none_match: str = None):
+    async def build():
+        builds.append(1)
+        return b'{"credits": %d}' % len(builds), {}
+    return asyncio.run(cache.serve(_request(if_none_match), CREDITS, "shop", None, build))
+
+def test_invalidate_drops_the_entry():
+    cache, builds = ResponseCache(ttl_s=60), []
+    first = _serve(cache, builds)
+    _serve(cache, builds)
+    assert len(builds) == 1
+    cache.invalidate(CREDITS, "shop")
+    assert _serve(cache, builds).body != first.body
+    assert len(builds) == 2
+
+def test_zero_ttl_disables_storing_but_keeps_etags():
+    cache, builds = ResponseCache(ttl_s=0), []
+    first = _serve(cache, builds)
+    _serve(cache, builds)
+    assert len(builds) == 2
+    assert cache.stats()["entries"] == 0
+    assert first.headers["etag"]
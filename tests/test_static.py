@@ -0,0 +1,37 @@
+# Stored images are negotiated to WebP/AVIF by Accept. Until the variant is
+# built the original goes out with a short lifetime, never as immutable.
+import os
+import time
+import cv2
+import httpx
+import numpy as np
+from app.core.constants import STATIC_DIR
+
+def _store_image(name: str) -> str:
+    img = np.zeros((300, 300, 3), dtype=np.uint8)
+    img[:150] = 200
+    img[150:, :, 0] = np.arange(300, dtype=np.uint8)[:150, None] % 7
+    os.makedirs(os.path.join(STATIC_DIR, "images"), exist_ok=True)
+    cv2.imwrite(os.path.join(STATIC_DIR, "images", f"{name}.png"), img)
+    return f"/static/images/{name}.png"
+
+def test_original_is_not_immutable_while_variant_is_pending(live_app):
+    path = _store_image(f"{time.monotonic_ns():064x}"[-64:])
+
+    plain = httpx.get(live_app + path)
+    assert plain.headers["cache-control"].endswith("immutable")
+
+    first = httpx.get(live_app + path, headers={"Accept": "image/webp"})
+    assert first.headers["content-type"] == "image/png"
+    assert "immutable" not in first.headers["cache-control"]
+    assert first.headers["vary"] == "Accept"
+
+    deadline = time.monotonic() + 10
+    while True:
+        r = httpx.get(live_app + path, headers={"Accept": "image/webp"})
+        if r.headers["content-type"] == "image/webp":
+            break
+        assert time.monotonic() < deadline, "variant was never served"
+        time.sleep(0.1)
+    assert r.headers["cache-control"].endswith("immutable")
+    assert len(r.content) < len(first.content)
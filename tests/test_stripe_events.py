@@ -0,0 +1,68 @@
+# The stripe_events table on its own DB, so the live app's processor (when
+# another test started it) cannot claim these events.
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+from app.core.constants import STRIPE_EVENT_MAX_ATTEMPTS, STRIPE_EVENT_RETRY_BASE_S, STRIPE_EVENT_STALE_S
+from app.crud.credits import EXTRA_CREDIT_PRODUCT_ID
+from app.crud.stripe_events import claim_due_events, complete_checkout_event, fail_event, record_event
+from app.db.base import Base
+from app.db.models.credits import CreditLedger, Credits
+from app.db.models.stripe_event import StripeEvent
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/events.db")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+def _set(db, event_id: str, **values):
+    db.execute(update(StripeEvent).where(StripeEvent.id == event_id).values(values))
+    db.commit()
+
+def _get(db, event_id: str) -> StripeEvent:
+    return db.query(StripeEvent).filter(StripeEvent.id == event_id).populate_existing().one()
+
+def _naive(value: datetime) -> datetime:
+    return value.replace(tzinfo=None) if value.tzinfo else value
+
+def test_duplicate_delivery_is_recorded_once(db):
+    assert record_event(db, "evt_1", "checkout.session.completed", "shop", "cs_1")
+    assert not record_event(db, "evt_1", "checkout.session.completed", "shop", "cs_1")
+    assert db.query(StripeEvent).count() == 1
+
+def test_failed_event_backs_off_and_gives_up(db):
+    record_event(db, "evt_2", "checkout.session.completed", "shop", "cs_2")
+    for attempt in range(1, STRIPE_EVENT_MAX_ATTEMPTS + 1):
+        [event] = claim_due_events(db, 10)
+        assert event.attempts == attempt
+        before = datetime.now(timezone.utc)
+        fail_event(db, event, "line items unavailable")
+        assert claim_due_events(db, 10) == []  # not due again yet
+        stored = _get(db, "evt_2")
+        if attempt < STRIPE_EVENT_MAX_ATTEMPTS:
+            assert stored.status == "pending"
+            delay = (_naive(stored.next_attempt_at) - _naive(before)).total_seconds()
+            assert delay == pytest.approx(STRIPE_EVENT_RETRY_BASE_S * 2 ** (attempt - 1), abs=1)
+            _set(db, "evt_2", next_attempt_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+    assert stored.status == "failed"
+    assert stored.last_error == "line items unavailable"
+
+def test_stale_claim_is_reclaimed_and_granted_once(db):
+    record_event(db, "evt_3", "checkout.session.completed", "shop", "cs_3")
+    [crashed] = claim_due_events(db, 10)
+    assert claim_due_events(db, 10) == []  # still held by the first worker
+
+    _set(db, "evt_3", claimed_at=datetime.now(timezone.utc) - timedelta(seconds=STRIPE_EVENT_STALE_S + 1))
+    [reclaimed] = claim_due_events(db, 10)
+    assert reclaimed.attempts == 2
+
+    assert complete_checkout_event(db, reclaimed, EXTRA_CREDIT_PRODUCT_ID, 10, 100)
+    assert not complete_checkout_event(db, crashed, EXTRA_CREDIT_PRODUCT_ID, 10, 100)
+    assert _get(db, "evt_3").status == "done"
+    assert db.query(Credits.extra_credit).filter(Credits.shop_name == "shop").scalar() == 10
+    assert db.query(CreditLedger).filter(CreditLedger.stripe_event_id == "evt_3").count() == 1
@@ -0,0 +1,66 @@
+import base64
+import os
+import time
+import cv2
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.core.constants import IMAGE_STORE_GRACE_S
+from app.core.thumbnail_store import _MIGRATION_LOCK, ThumbnailStore, is_thumbnail_key
+from app.crud.job_locks import try_lock, unlock
+from app.crud.video import build_video
+from app.db.base import Base
+from app.db.models.job_lock import JobLock
+from app.db.models.video import Video
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/thumbs.db")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+def _frame(seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 255, (48, 64, 3), dtype=np.uint8)
+
+def test_reused_thumbnail_survives_gc(tmp_path, db):
+    store = ThumbnailStore(str(tmp_path))
+    key = store.save_frame(_frame(1))
+    old = time.time() - IMAGE_STORE_GRACE_S - 60
+    for size in ("sm", "lg"):
+        os.utime(store.path(key, size), (old, old))
+
+    assert store.save_frame(_frame(1)) == key
+    assert store.gc(db) == 0  # the row referencing it is not committed yet
+    assert os.path.exists(store.path(key, "sm"))
+
+def test_lock_is_exclusive_until_released_or_stale(db):
+    assert try_lock(db, "job", "a", 600)
+    assert try_lock(db, "job", "a", 600)  # refresh
+    assert not try_lock(db, "job", "b", 600)
+    assert try_lock(db, "job", "b", 0)  # a stopped refreshing
+    unlock(db, "job", "a")
+    assert not try_lock(db, "job", "a", 600)
+    unlock(db, "job", "b")
+    assert try_lock(db, "job", "a", 600)
+
+def test_inline_migration_runs_in_one_worker(tmp_path, db):
+    store = ThumbnailStore(str(tmp_path))
+    _, jpeg = cv2.imencode(".jpg", _frame(2))
+    video = build_video("task-1", ["https://example.com/a.png"], "spin", "p1", "Shoe", "shop")
+    video.thumbnail = base64.b64encode(jpeg.tobytes()).decode()
+    db.add(video)
+    db.commit()
+
+    assert try_lock(db, _MIGRATION_LOCK, "other-worker", 600)
+    assert store.migrate_inline(db, "this-worker") == 0
+    assert not is_thumbnail_key(db.get(Video, "task-1").thumbnail)
+
+    unlock(db, _MIGRATION_LOCK, "other-worker")
+    assert store.migrate_inline(db, "this-worker") == 1
+    db.expire_all()
+    assert is_thumbnail_key(db.get(Video, "task-1").thumbnail)
+    assert db.query(JobLock).count() == 0
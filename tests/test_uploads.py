@@ -0,0 +1,51 @@
+# Upload jobs live in the process that accepted them; a row another worker is
+# uploading (fresh heartbeat) must not be queued a second time.
+from datetime import datetime, timedelta, timezone
+import httpx
+from app.core.constants import UPLOAD_STALE_S
+from app.core.uploads import upload_queue
+from app.crud.video import build_video, create_videos
+from app.db.models.video import Video
+from app.db.session import SessionLocal
+
+def _uploading(task_id: str, heartbeat: datetime):
+    video = build_video(task_id, ["https://example.com/a.png"], "spin", "p1", "Shoe", "upload-shop")
+    video.status = "uploading"
+    video.upload_stage = "staged"
+    video.upload_heartbeat_at = heartbeat
+    db = SessionLocal()
+    try:
+        create_videos(db, [video])
+    finally:
+        db.close()
+
+def _row(task_id: str) -> Video:
+    db = SessionLocal()
+    try:
+        return db.get(Video, task_id)
+    finally:
+        db.close()
+
+def _item(task_id: str):
+    return {"video_id": task_id, "video_url": "https://example.com/v.mp4", "product_id": "p1", "product_title": "Shoe"}
+
+def test_upload_held_by_another_worker_is_not_queued_again(live_app):
+    heartbeat = datetime.now(timezone.utc) - timedelta(seconds=5)
+    _uploading("upload-elsewhere", heartbeat)
+    _uploading("upload-elsewhere-bulk", heartbeat)
+
+    single = httpx.post(f"{live_app}/api/v1/upload", json={"shop": "upload-shop", "token": "t", **_item("upload-elsewhere")})
+    bulk = httpx.post(f"{live_app}/api/v1/upload/bulk", json={"shop": "upload-shop", "token": "t", "videos": [_item("upload-elsewhere-bulk")]})
+
+    assert single.status_code == bulk.status_code == 202
+    assert single.json()["status"] == bulk.json()["jobs"][0]["status"] == "running"
+    for task_id in ("upload-elsewhere", "upload-elsewhere-bulk"):
+        assert upload_queue.position(task_id) is None
+        assert _row(task_id).upload_stage == "staged"
+        assert _row(task_id).upload_heartbeat_at.replace(tzinfo=timezone.utc) == heartbeat
+
+def test_upload_with_stale_heartbeat_is_taken_over(live_app):
+    _uploading("upload-stale", datetime.now(timezone.utc) - timedelta(seconds=UPLOAD_STALE_S + 60))
+    r = httpx.post(f"{live_app}/api/v1/upload", json={"shop": "upload-shop", "token": "t", **_item("upload-stale")})
+    assert r.status_code == 202
+    assert r.json()["queue_position"] is not None
@@ -0,0 +1,37 @@
+# GET /video only paginates when asked to: clients that send neither limit
+# nor cursor keep getting the whole list.
+import httpx
+from app.core.constants import VIDEO_PAGE_SIZE
+from app.crud.video import build_video, create_videos
+from app.db.session import SessionLocal
+
+def _seed(shop: str, n: int):
+    videos = [build_video(f"{shop}-{i:03d}", ["https://example.com/a.png"], "spin", "p1", "Shoe", shop) for i in range(n)]
+    for video in videos:
+        video.status = "failed"
+    db = SessionLocal()
+    try:
+        create_videos(db, videos)
+    finally:
+        db.close()
+
+def test_listing_is_unbounded_without_limit_or_cursor(live_app, shop_with_credits):
+    shop = shop_with_credits(0)
+    _seed(shop, VIDEO_PAGE_SIZE + 10)
+    r = httpx.get(f"{live_app}/api/v1/video", params={"shop": shop})
+    assert r.status_code == 200
+    assert len(r.json()) == VIDEO_PAGE_SIZE + 10
+    assert "x-next-cursor" not in r.headers
+
+def test_limit_and_cursor_walk_every_row_once(live_app, shop_with_credits):
+    shop = shop_with_credits(0)
+    _seed(shop, 2 * VIDEO_PAGE_SIZE + 10)
+    first = httpx.get(f"{live_app}/api/v1/video", params={"shop": shop, "limit": 25})
+    assert len(first.json()) == 25
+    rest = httpx.get(f"{live_app}/api/v1/video", params={"shop": shop, "cursor": first.headers["x-next-cursor"]})
+    assert len(rest.json()) == VIDEO_PAGE_SIZE
+    last = httpx.get(f"{live_app}/api/v1/video", params={"shop": shop, "cursor": rest.headers["x-next-cursor"]})
+    assert len(last.json()) == VIDEO_PAGE_SIZE + 10 - 25
+    assert "x-next-cursor" not in last.headers
+    ids = [v["id"] for page in (first, rest, last) for v in page.json()]
+    assert len(set(ids)) == 2 * VIDEO_PAGE_SIZE + 10